@@ -0,0 +1,115 @@
+"""
+Byte and CPU cost of A2A responses, before and after compact encoding and compression.
+
+Builds `tasks/get` responses like the ones the Green agent polls: a task whose
+history holds the benchmark instruction, a system context with FHIR resources,
+and the agent's answer artifact. For each size it reports:
+
+    encoding     model_dump + stdlib json (Starlette's JSONResponse) vs orjson
+    compression  raw, gzip and brotli sizes and the time to compress
+
+Usage:
+    python scripts/bench_compression.py [--observations 20 200 1000] [--runs 50]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from a2a.types import (  # noqa: E402
+    Artifact,
+    GetTaskSuccessResponse,
+    Message,
+    Part,
+    Role,
+    Task,
+    TaskState,
+    TaskStatus,
+    TextPart,
+)
+from starlette.responses import JSONResponse  # noqa: E402
+
+from compression import BROTLI_QUALITY, GZIP_LEVEL, brotli, compress, dumps  # noqa: E402
+
+
+def observation(i: int) -> dict:
+    return {
+        "resourceType": "Observation",
+        "id": f"obs-{i}",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": "2823-3", "display": "Potassium"}], "text": "K"},
+        "subject": {"reference": "Patient/S6530532"},
+        "effectiveDateTime": f"2023-{1 + i % 12:02d}-{1 + i % 28:02d}T08:{i % 60:02d}:00+00:00",
+        "valueQuantity": {"value": round(3.5 + (i % 20) / 10, 1), "unit": "mmol/L", "system": "http://unitsofmeasure.org"},
+        "meta": {"versionId": "1", "lastUpdated": "2024-01-01T00:00:00+00:00"},
+    }
+
+
+def task_response(observations: int) -> GetTaskSuccessResponse:
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": observations,
+        "entry": [{"fullUrl": f"http://fhir/Observation/obs-{i}", "resource": observation(i)} for i in range(observations)],
+    }
+    instruction = json.dumps({
+        "id": "task5_1",
+        "instruction": "Check patient S6530532's most recent potassium level and order replacement if low.",
+        "system_context": "You are a clinical assistant with FHIR access.\n" + json.dumps(bundle),
+    })
+    user = Message(role=Role.user, message_id="m-1", context_id="ctx-1", task_id="task-1", parts=[Part(root=TextPart(text=instruction))])
+    agent = Message(role=Role.agent, message_id="m-2", context_id="ctx-1", task_id="task-1", parts=[Part(root=TextPart(text="Thinking..."))])
+    task = Task(
+        id="task-1",
+        context_id="ctx-1",
+        status=TaskStatus(state=TaskState.completed),
+        history=[user, agent],
+        artifacts=[Artifact(artifact_id="a-1", name="Response", parts=[Part(root=TextPart(text="[4.1]"))])],
+    )
+    return GetTaskSuccessResponse(id="1", result=task)
+
+
+def timed(func, runs: int) -> tuple[float, object]:
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = func()
+    return (time.perf_counter() - start) / runs * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure A2A response encoding and compression.")
+    parser.add_argument("--observations", type=int, nargs="+", default=[20, 200, 1000], help="Observations in the task's context")
+    parser.add_argument("--runs", type=int, default=50, help="Repetitions per timing")
+    args = parser.parse_args()
+
+    encodings = ["gzip", "br"] if brotli is not None else ["gzip"]
+    if brotli is None:
+        print("brotli is not installed: reporting gzip only")
+    print(f"gzip level {GZIP_LEVEL}, brotli quality {BROTLI_QUALITY}, {args.runs} runs per timing\n")
+
+    for count in args.observations:
+        response = task_response(count)
+        dump_ms, content = timed(lambda: response.model_dump(mode="json", exclude_none=True), args.runs)
+        stdlib_ms, body = timed(lambda: JSONResponse(content).body, args.runs)
+        orjson_ms, compact = timed(lambda: dumps(content), args.runs)
+        assert json.loads(body) == json.loads(compact)
+
+        print(f"{count} observations: {len(body):,} bytes")
+        print(f"  model_dump            {dump_ms:7.2f} ms")
+        print(f"  json (Starlette)      {stdlib_ms:7.2f} ms")
+        print(f"  orjson                {orjson_ms:7.2f} ms  ({stdlib_ms / orjson_ms:.1f}x faster)")
+        for encoding in encodings:
+            compress_ms, compressed = timed(lambda: compress(compact, encoding), args.runs)
+            if encoding == "gzip":
+                assert gzip.decompress(compressed) == compact
+            saved = 1 - len(compressed) / len(compact)
+            print(f"  {encoding:<6} {len(compressed):>12,} bytes ({saved:.0%} smaller)  {compress_ms:7.2f} ms")
+        print()
+
+
+if __name__ == '__main__':
+    main()
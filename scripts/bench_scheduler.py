@@ -0,0 +1,88 @@
+"""
+Simulated mixed load: FIFO LLM slots vs the cost-aware scheduler.
+
+Tasks arrive at random. Cheap lookups (Task 1/2 style) take `--fast-ms` of LLM
+time and open-ended reasoning tasks take `--slow-ms`. Every completion needs
+one of `--slots` slots. Reports median and p95 latency per task class for
+a plain semaphore (arrival order) and for `LLMScheduler`.
+
+Usage:
+    python scripts/bench_scheduler.py [--tasks 200] [--slow-share 0.3] [--slots 4]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from scheduler import TASK_COSTS, LLMScheduler  # noqa: E402
+
+
+class FifoSlots:
+    def __init__(self, slots: int):
+        self.semaphore = asyncio.Semaphore(slots)
+
+    @asynccontextmanager
+    async def slot(self, cost: float):
+        async with self.semaphore:
+            yield
+
+
+async def simulate(slots, tasks: list[tuple[float, str]], durations: dict) -> dict[str, list[float]]:
+    latencies = {"fast": [], "slow": []}
+
+    async def run(arrival: float, kind: str, start: float):
+        await asyncio.sleep(max(0.0, start + arrival - time.perf_counter()))
+        arrived = time.perf_counter()
+        cost = TASK_COSTS["search_patient"] if kind == "fast" else TASK_COSTS[None]
+        async with slots.slot(cost):
+            await asyncio.sleep(durations[kind])
+        latencies[kind].append(time.perf_counter() - arrived)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(arrival, kind, start) for arrival, kind in tasks))
+    return latencies
+
+
+def summary(values: list[float]) -> str:
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"median {statistics.median(ordered) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FIFO and cost-aware LLM scheduling under mixed load.")
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks in the run")
+    parser.add_argument("--slow-share", type=float, default=0.3, help="Fraction of open-ended tasks")
+    parser.add_argument("--slots", type=int, default=4, help="LLM slots")
+    parser.add_argument("--fast-ms", type=float, default=20, help="LLM time of a lookup")
+    parser.add_argument("--slow-ms", type=float, default=200, help="LLM time of an open-ended task")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    durations = {"fast": args.fast_ms / 1000, "slow": args.slow_ms / 1000}
+    mean_work = args.slow_share * durations["slow"] + (1 - args.slow_share) * durations["fast"]
+    # Arrivals at ~90% of capacity, so queues form
+    rate = 0.9 * args.slots / mean_work
+    arrival = 0.0
+    tasks = []
+    for _ in range(args.tasks):
+        arrival += rng.expovariate(rate)
+        tasks.append((arrival, "slow" if rng.random() < args.slow_share else "fast"))
+
+    for name, slots in (("FIFO", FifoSlots(args.slots)), ("scheduler", LLMScheduler(slots=args.slots))):
+        latencies = asyncio.run(simulate(slots, tasks, durations))
+        print(f"{name}:")
+        print(f"  fast ({len(latencies['fast'])}): {summary(latencies['fast'])}")
+        print(f"  slow ({len(latencies['slow'])}): {summary(latencies['slow'])}")
+        print(f"  all:        {summary(latencies['fast'] + latencies['slow'])}")
+
+
+if __name__ == '__main__':
+    main()
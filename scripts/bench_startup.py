@@ -0,0 +1,81 @@
+"""
+Startup profile of the Purple Agent.
+
+Runs `python -X importtime` in a fresh interpreter for each module and reports
+the total import time and the slowest imports (cumulative). It then times
+`Agent()` construction and the server warm-up. Use it to check that heavy
+modules (openai, numpy, ...) stay off the startup path.
+
+Usage:
+    python scripts/bench_startup.py [--module agent server] [--top 15] [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+
+TIMING_SNIPPET = """
+import asyncio, time
+start = time.perf_counter()
+import agent
+imported = time.perf_counter()
+agent.Agent()
+constructed = time.perf_counter()
+asyncio.run(agent.warm_up())
+warmed = time.perf_counter()
+print(imported - start, constructed - imported, warmed - constructed)
+"""
+
+
+def run_python(args: list[str]) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": SRC, "PYTHONDONTWRITEBYTECODE": "1"}
+    return subprocess.run([sys.executable, *args], cwd=os.path.dirname(SRC), env=env, capture_output=True, text=True)
+
+
+def import_profile(module: str) -> list[tuple[int, int, str]]:
+    """(self_us, cumulative_us, module) for every import made by `import <module>`."""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile Purple Agent startup.")
+    parser.add_argument("--module", nargs="+", default=["agent", "server"], help="Modules to profile")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement (median reported)")
+    args = parser.parse_args()
+
+    for module in args.module:
+        totals = []
+        for _ in range(args.runs):
+            rows = import_profile(module)
+            totals.append(next(cum for _, cum, name in reversed(rows) if name.strip() == module))
+        print(f"\nimport {module}: {statistics.median(totals) / 1000:.1f} ms (median of {args.runs})")
+        for _, cumulative, name in sorted(rows, key=lambda r: r[1], reverse=True)[: args.top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    timings = []
+    for _ in range(args.runs):
+        result = run_python(["-c", TIMING_SNIPPET])
+        if result.returncode != 0:
+            raise RuntimeError(f"Timing run failed:\n{result.stderr}")
+        timings.append([float(x) for x in result.stdout.split()[-3:]])
+    imported, constructed, warmed = (statistics.median(column) for column in zip(*timings))
+    print(f"\nimport agent:  {imported * 1000:.1f} ms")
+    print(f"Agent():       {constructed * 1000:.1f} ms")
+    print(f"warm_up():     {warmed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,12 @@ import json
 import httpx
 import re
 import os
+import sys
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
+
+from features import DEFAULT_FEATURES_PATH, FeatureStore
 
 # Ensure med_data directory exists
 os.makedirs("med_data", exist_ok=True)
@@ -70,5 +76,12 @@ async def main():
         
     print(f"Saved pre-fetched data to {output_path}. Total keys: {len(results)}")
 
+    # Precompute per-patient features from the same data
+    store = FeatureStore()
+    for bundle in results.values():
+        store.update_many(entry.get("resource") for entry in bundle.get("entry", []))
+    store.save(DEFAULT_FEATURES_PATH)
+    print(f"Saved features for {len(store)} patients to {DEFAULT_FEATURES_PATH}")
+
 if __name__ == "__main__":
     asyncio.run(main())
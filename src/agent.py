@@ -1,80 +1,271 @@
 import os
 import json
+import asyncio
+import functools
 import httpx
 import re
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 from a2a.server.tasks import TaskUpdater
-from a2a.types import Message, TaskState, Part, TextPart
+from a2a.types import Message, TaskState, Part, TextPart, DataPart
 from a2a.utils import get_message_text, new_agent_text_message
 
 try:
     from messenger import Messenger
+    from prompts import build_messages, build_tools, record_usage, supports_cache_control
+    from speculation import MRN_PATTERN, SpeculativePrefetcher
+    from fhir_write import build_bp_observation, context_time, post_fhir_many
+    from fhir_stream import STREAMED_RESOURCE_TYPES, EntryBudget
+    from fhir_paging import search_fhir_paged
+    from fhir_mirror import get_mirror
+    from fhir_cache import FHIR_CACHE
+    from features import get_feature_store, warm_feature_store
+    from event_loop import run_io
+    from name_index import NameIndex
+    from answers import extract_answer, format_instruction, response_format, structured_output_mode
+    from generation import generation_kwargs, strip_reasoning
+    from context_memory import ContextMemory, result_resources
+    from scheduler import LLM_SCHEDULER, TASK_COSTS, estimate_cost
 except ImportError:
     from .messenger import Messenger
+    from .prompts import build_messages, build_tools, record_usage, supports_cache_control
+    from .speculation import MRN_PATTERN, SpeculativePrefetcher
+    from .fhir_write import build_bp_observation, context_time, post_fhir_many
+    from .fhir_stream import STREAMED_RESOURCE_TYPES, EntryBudget
+    from .fhir_paging import search_fhir_paged
+    from .fhir_mirror import get_mirror
+    from .fhir_cache import FHIR_CACHE
+    from .features import get_feature_store, warm_feature_store
+    from .event_loop import run_io
+    from .name_index import NameIndex
+    from .answers import extract_answer, format_instruction, response_format, structured_output_mode
+    from .generation import generation_kwargs, strip_reasoning
+    from .context_memory import ContextMemory, result_resources
+    from .scheduler import LLM_SCHEDULER, TASK_COSTS, estimate_cost
 
 load_dotenv()
 
+# Task types that may create FHIR resources (and are offered the write tool)
+WRITE_TASK_TYPES = {"record_vitals"}
+
+# Items of one batch request processed at once
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Seconds the warm-up waits for the LLM provider to answer
+WARM_UP_TIMEOUT = 5.0
+
+# One LLM client (and connection pool) per provider, shared by every Agent
+_LLM_CLIENTS = {}
+
+# One batch queue per batch mode and provider, shared by every Agent
+_BATCH_COMPLETIONS = {}
+
+
+@dataclass(frozen=True)
+class LLMConfig:
+    provider: str | None
+    api_key: str | None
+    base_url: str | None
+    model: str | None
+
+
+def llm_config() -> LLMConfig:
+    """The LLM provider picked from the environment (Nebius first, then OpenRouter); all None without a key."""
+    if os.getenv("NEBIUS_API_KEY"):
+        return LLMConfig(
+            "nebius",
+            os.getenv("NEBIUS_API_KEY"),
+            "https://api.studio.nebius.ai/v1/",
+            os.getenv("NEBIUS_MODEL_NAME") or os.getenv("MODEL_NAME") or "deepseek-ai/DeepSeek-R1-0528",
+        )
+    if os.getenv("OPENROUTER_API_KEY"):
+        return LLMConfig(
+            "openrouter",
+            os.getenv("OPENROUTER_API_KEY"),
+            "https://openrouter.ai/api/v1",
+            os.getenv("OPENROUTER_MODEL_NAME") or os.getenv("MODEL_NAME") or "google/gemini-2.0-flash-exp:free",
+        )
+    return LLMConfig(None, None, None, None)
+
+
+def get_llm_client(api_key: str, base_url: str):
+    """Shared AsyncOpenAI client; `openai` is imported on first use, off the startup path."""
+    client = _LLM_CLIENTS.get((api_key, base_url))
+    if client is None:
+        from openai import AsyncOpenAI
+        client = _LLM_CLIENTS[(api_key, base_url)] = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    return client
+
+
+def get_batch_completions(config: LLMConfig):
+    """
+    The process-wide batch queue for LLM_BATCH_MODE, or None when completions run live.
+
+    "provider" routes completions through the provider's batch API, "local" through a
+    stand-in that replays batch files in real time. Every context shares one queue, so
+    a sweep's requests land in the same batch files.
+    """
+    mode = os.getenv("LLM_BATCH_MODE", "").lower()
+    if not config.api_key or mode not in ("provider", "local"):
+        return None
+    key = (mode, config.api_key, config.base_url)
+    batch = _BATCH_COMPLETIONS.get(key)
+    if batch is None:
+        try:
+            from batch_api import BatchCompletions, completion_kwargs, LocalBatchBackend, OpenAIBatchBackend
+        except ImportError:
+            from .batch_api import BatchCompletions, completion_kwargs, LocalBatchBackend, OpenAIBatchBackend
+        client = get_llm_client(config.api_key, config.base_url)
+        if mode == "provider":
+            backend = OpenAIBatchBackend(client)
+        else:
+            backend = LocalBatchBackend(lambda body: client.chat.completions.create(**completion_kwargs(body)))
+        batch = _BATCH_COMPLETIONS[key] = BatchCompletions(backend, work_dir=os.getenv("LLM_BATCH_DIR"))
+    return batch
+
+
+async def open_llm_pool(client) -> None:
+    """Open a connection in the shared client's pool, so the first completion skips the TCP/TLS handshake."""
+    try:
+        await client.with_options(max_retries=0, timeout=WARM_UP_TIMEOUT).models.list()
+    except Exception as e:
+        print(f"[PURPLE] Could not open an LLM connection during warm-up: {e}", flush=True)
+
+
+async def warm_up() -> None:
+    """
+    One-time startup work, run before the server reports ready: import the LLM
+    SDK, build the shared client and open a connection in its pool, and load
+    the feature store, FHIR mirror and the task 1 cache's name index.
+
+    FHIR searches get their base URL with each task, so there is no FHIR pool
+    to open here.
+    """
+    config = llm_config()
+    if config.api_key:
+        await open_llm_pool(get_llm_client(config.api_key, config.base_url))
+    await run_io(warm_feature_store)
+    await run_io(get_mirror)
+    if os.path.exists(TASK1_CACHE_PATH):
+        await run_io(load_cache_index, TASK1_CACHE_PATH)
+
 async def search_fhir(base_url: str, resource_type: str, params: dict) -> str:
     """
     Search the FHIR server for resources.
     """
     if not base_url:
         return "Error: No FHIR base URL provided."
+
+    # Serve from the embedded mirror when configured and the search is one it indexes,
+    # unless we wrote to the patient since (the mirror is a snapshot and never sees our writes)
+    mirror = get_mirror()
+    if mirror and mirror.supports(resource_type, params) and not FHIR_CACHE.written_to(base_url, resource_type, params):
+        # Same entry/byte budget and projection as the paged HTTP path
+        budget = EntryBudget() if resource_type in STREAMED_RESOURCE_TYPES else None
+        try:
+            # SQLite reads run on the I/O pool, never on the event loop
+            result = await run_io(mirror.search, base_url, resource_type, params, budget)
+            if result is not None:
+                return result
+            print("[PURPLE] Patient not in FHIR mirror, falling back to FHIR server.", flush=True)
+        except Exception as e:
+            print(f"[PURPLE] Mirror search failed, falling back to FHIR server: {e}", flush=True)
+
+    # Repeat searches: served while fresh, then revalidated with a conditional GET
+    cached = await FHIR_CACHE.lookup(base_url, resource_type, params)
+    if cached is not None:
+        return cached
+
+    # Potentially large result sets are paged through, parsed incrementally and trimmed as they arrive
+    if resource_type in STREAMED_RESOURCE_TYPES:
+        result = await search_fhir_paged(base_url, resource_type, params)
+        if not result.startswith("Error"):
+            FHIR_CACHE.put(base_url, resource_type, params, result)
+        return result
     
     url = f"{base_url.rstrip('/')}/{resource_type}"
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get(url, params=params, timeout=10.0)
             response.raise_for_status()
-            return json.dumps(response.json())
+            result = json.dumps(response.json())
     except Exception as e:
         return f"Error querying FHIR server: {str(e)}"
+    FHIR_CACHE.put(base_url, resource_type, params, result, response.headers.get("ETag"))
+    return result
+
+
+async def remembered_search(memory: ContextMemory | None, base_url: str, resource_type: str, params: dict) -> str:
+    """`search_fhir`, answered from (and recorded in) the conversation's memory when there is one."""
+    if memory is None:
+        return await search_fhir(base_url, resource_type, params)
+    result = memory.lookup(resource_type, params)
+    if result is not None:
+        print(f"[PURPLE] {resource_type} search answered from conversation memory.", flush=True)
+        return result
+    result = await search_fhir(base_url, resource_type, params)
+    memory.remember(resource_type, params, result)
+    return result
+
+
+TASK1_CACHE_PATH = "med_data/prefetched-fhir-task1.json"
+# (path, mtime) -> NameIndex over the cached Patient bundles
+_CACHE_INDEX: dict[tuple[str, float], NameIndex] = {}
+
+
+def batch_payload(text: str) -> tuple[list, bool] | None:
+    """
+    The items and stream flag of a batch of Green Agent payloads: a JSON array,
+    or {"tasks": [...], "stream": bool}. None for any other message.
+    """
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(payload, list):
+        return payload, False
+    if isinstance(payload, dict) and isinstance(payload.get("tasks"), list):
+        return payload["tasks"], bool(payload.get("stream", False))
+    return None
+
+
+def build_cache_index(cache: dict) -> NameIndex:
+    index = NameIndex()
+    for task_id, bundle in cache.items():
+        if not isinstance(bundle, dict) or not bundle.get("entry"):
+            continue
+        resource = bundle["entry"][0].get("resource", {})
+        if resource.get("resourceType") == "Patient":
+            index.add_patient(resource, payload=bundle)
+    return index
+
+
+def load_cache_index(path: str) -> NameIndex:
+    """Name index of the task 1 cache, rebuilt only when the file changes."""
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        key = None
+    index = _CACHE_INDEX.get(key) if key else None
+    if index is None:
+        with open(path, "r") as f:
+            index = build_cache_index(json.load(f))
+        if key:
+            _CACHE_INDEX.clear()
+            _CACHE_INDEX[key] = index
+    return index
 
 
 def search_local_cache(name: str, dob: str) -> str | None:
     try:
         # Assuming med_data is in the project root
-        path = "med_data/prefetched-fhir-task1.json"
+        path = TASK1_CACHE_PATH
         if not os.path.exists(path):
              return None
-             
-        with open(path, "r") as f:
-            cache = json.load(f)
-            
-        target_name_parts = set(name.lower().split())
-        
-        for task_id, bundle in cache.items():
-            if not isinstance(bundle, dict) or "entry" not in bundle:
-                continue
-            
-            entries = bundle.get("entry", [])
-            if not entries:
-                continue
-                
-            resource = entries[0].get("resource", {})
-            if resource.get("resourceType") != "Patient":
-                continue
-                
-            if resource.get("birthDate") != dob:
-                continue
-                
-            human_names = resource.get("name", [])
-            found_name = False
-            for hn in human_names:
-                family = hn.get("family", "")
-                given = " ".join(hn.get("given", []))
-                full_name_str = f"{given} {family}".lower()
-                
-                if all(part in full_name_str for part in target_name_parts):
-                    found_name = True
-                    break
-            
-            if found_name:
-                return json.dumps(bundle)
-                    
-        return None
 
+        # Blocked by birth date, then fuzzy-matched on name tokens
+        bundle = load_cache_index(path).best(name, dob)
+        return json.dumps(bundle) if bundle is not None else None
     except Exception as e:
         print(f"Cache lookup failed: {e}")
         return None
@@ -128,31 +319,53 @@ def parse_instruction(text: str) -> dict | None:
 
     return None
 
+class BatchItemUpdater:
+    """Updater for one item of a batch: progress is logged instead of emitted as A2A events."""
+
+    async def update_status(self, state, message):
+        print(f"[PURPLE] [batch] {get_message_text(message)}", flush=True)
+
+    async def add_artifact(self, parts, name):
+        pass
+
+
 class Agent:
     def __init__(self):
         self.messenger = Messenger()
-        if os.getenv("NEBIUS_API_KEY"):
-            self.api_key = os.getenv("NEBIUS_API_KEY")
-            self.base_url = "https://api.studio.nebius.ai/v1/"
-            self.model = os.getenv("NEBIUS_MODEL_NAME") or os.getenv("MODEL_NAME") or "deepseek-ai/DeepSeek-R1-0528"
-        elif os.getenv("OPENROUTER_API_KEY"):
-            self.api_key = os.getenv("OPENROUTER_API_KEY")
-            self.base_url = "https://openrouter.ai/api/v1"
-            self.model = os.getenv("OPENROUTER_MODEL_NAME") or os.getenv("MODEL_NAME") or "google/gemini-2.0-flash-exp:free"
-        else:
-            self.api_key = None
-            self.model = None # Will cause error later if used
+        config = llm_config()
+        self.provider = config.provider
+        self.api_key = config.api_key
+        self.base_url = config.base_url
+        self.model = config.model # None without a key: fails later if used
         
-        self.client = None
-        if self.api_key:
-            self.client = AsyncOpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url,
-            )
-        else:
+        # Built on first use (see the `client` property)
+        self._client = None
+        # Resolved patients, fetched resources and earlier turns of this context
+        self.memory = ContextMemory()
+        if not self.api_key:
              print("Warning: No API key found for OpenRouter or Nebius.")
 
-    async def run(self, message: Message, updater: TaskUpdater, task: "Task" = None) -> None:
+        # Offline sweeps queue completions for a provider/local batch (see get_batch_completions)
+        self.batch = get_batch_completions(config)
+
+    @property
+    def client(self):
+        if self._client is None and self.api_key:
+            self._client = get_llm_client(self.api_key, self.base_url)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    async def close(self) -> None:
+        """Release the context's connections: the messenger's pooled HTTP client."""
+        try:
+            await self.messenger.aclose()
+        except Exception as e:
+            print(f"[PURPLE] Closing agent failed: {e}", flush=True)
+
+    async def run(self, message: Message, updater: TaskUpdater, task: "Task" = None) -> str | None:
         """Implement your agent logic here.
 
         Args:
@@ -160,12 +373,16 @@ class Agent:
             updater: Report progress (update_status) and results (add_artifact)
             task: The current task object containing history
 
+        Returns:
+            The response text (None for batches, whose results are artifacts)
+
         Use self.messenger.talk_to_agent(message, url) to call other agents.
         """
         input_text = get_message_text(message)
         print(f"[PURPLE] Received Input: {input_text}", flush=True)
 
         # 1. Payload Parsing
+        batch = batch_payload(input_text)
         try:
             payload = json.loads(input_text)
             # Check if it looks like the expected Green Agent payload
@@ -183,15 +400,48 @@ class Agent:
             fhir_base_url = None
             system_context = None
 
+        # Batch: many benchmark tasks in one request
+        if batch is not None:
+            batch_items, stream_batch = batch
+            await self.run_batch(batch_items, updater, stream=stream_batch)
+            return None
+
         await updater.update_status(
             TaskState.working, new_agent_text_message("Processing request...")
         )
 
+        response_text = await self.answer(instruction, fhir_base_url, system_context, updater, task, memory=self.memory)
+        if not response_text.startswith("Error"):
+            self.memory.record_turn(instruction, response_text)
+
+        await updater.add_artifact(
+            parts=[Part(root=TextPart(text=response_text))],
+            name="Response",
+        )
+        return response_text
+
+    async def answer(
+        self,
+        instruction: str,
+        fhir_base_url: str | None,
+        system_context: str | None,
+        updater: TaskUpdater,
+        task: "Task" = None,
+        memory: ContextMemory | None = None,
+    ) -> str:
+        """
+        Run the full pipeline (pre-fetch, prompt, LLM, tools) for one instruction and return the response text.
+
+        With `memory`, FHIR searches are answered from the conversation's memory
+        when possible and earlier turns are replayed as history.
+        """
         response_text = ""
+        search = functools.partial(remembered_search, memory)
         if not self.client:
              response_text = "Error: Agent not configured with API key."
              print(f"[PURPLE] {response_text}", flush=True)
         else:
+            prefetcher = None
             try:
                 # 2. Heuristic Pre-Fetch
                 heuristic_context = ""
@@ -207,42 +457,75 @@ class Agent:
                             TaskState.working, new_agent_text_message(f"Detected Patient Search: Fetching data for {parsed_task['name']}...")
                         )
                         
-                        # Task 1 Optimization: Prioritize Local Cache
-                        print(f"[PURPLE] Checking local cache for {parsed_task['name']}...")
-                        cached_data = search_local_cache(parsed_task["name"], parsed_task["dob"])
-                        
+                        name_parts = parsed_task["name"].split()
+                        params = {
+                            "name": name_parts if len(name_parts) > 1 else parsed_task["name"],
+                            "birthdate": parsed_task["dob"]
+                        }
+                        # Resolved earlier in this conversation
+                        known_mrn = memory.resolve_patient(parsed_task["name"], parsed_task["dob"]) if memory else None
+                        if known_mrn:
+                             # Already resolved: the reference is enough, not the Patient bundle again
+                             memory.current_patient = known_mrn
+                             heuristic_context = (
+                                 f"\n[PATIENT FROM CONVERSATION MEMORY]:\n{parsed_task['name']} (DOB {parsed_task['dob']}) "
+                                 f"was resolved earlier in this conversation: Patient/{known_mrn} (MRN {known_mrn})\n"
+                             )
+                             cached_data = None
+                        else:
+                             # Task 1 Optimization: Prioritize Local Cache
+                             print(f"[PURPLE] Checking local cache for {parsed_task['name']}...")
+                             cached_data = await run_io(search_local_cache, parsed_task["name"], parsed_task["dob"])
+
                         if cached_data:
                              data = cached_data
                              heuristic_context = f"\n[CONTEXT FROM CACHE]:\n{data}\n"
                              await updater.update_status(
                                 TaskState.working, new_agent_text_message(f"Found cached data for {parsed_task['name']}.")
                             )
-                        else:
-                             # Fallback to Live FHIR
-                             print(f"[PURPLE] Cache miss. Fetching from FHIR server...")
-                             name_parts = parsed_task["name"].split()
-                             params = {
-                                "name": name_parts if len(name_parts) > 1 else parsed_task["name"],
-                                "birthdate": parsed_task["dob"]
-                             }
-                             data = await search_fhir(
-                                fhir_base_url, 
-                                "Patient", 
-                                params
-                             )
+                        elif not known_mrn:
+                             # Embedded mirror: fuzzy name match blocked by birth date
+                             mirror = get_mirror()
+                             data = await run_io(mirror.find_patient, parsed_task["name"], parsed_task["dob"], fhir_base_url) if mirror else None
+                             if not data:
+                                  # Fallback to Live FHIR
+                                  print(f"[PURPLE] Cache miss. Fetching from FHIR server...")
+                                  data = await search(fhir_base_url, "Patient", params)
                              heuristic_context = f"\n[CONTEXT FROM FHIR (Pre-fetched)]:\n{data}\n"
+
+                        if memory and not known_mrn:
+                            memory.remember("Patient", params, data)
+                            patients = [r for r in result_resources(data) if r["resourceType"] == "Patient"]
+                            if len(patients) == 1:
+                                memory.remember_patient(parsed_task["name"], parsed_task["dob"], patients[0]["id"])
                         
                         is_pre_fetched = True
                         skip_tools = True # Task 1 optimization: Skip tools
 
                     elif parsed_task["type"] == "get_patient_age":
-                        await updater.update_status(
-                            TaskState.working, new_agent_text_message(f"Detected Age Check: Fetching patient {parsed_task['mrn']}...")
-                        )
-                        # Fetch by ID (assuming MRN maps to ID 'Sxxxx' in this benchmark per implementation plan)
-                        params = {"_id": parsed_task["mrn"]} 
-                        data = await search_fhir(fhir_base_url, "Patient", params)
-                        heuristic_context = f"\n[CONTEXT FROM FHIR (Pre-fetched)]:\n{data}\n"
+                        features = await run_io(get_feature_store)
+                        if (features.get(parsed_task["mrn"]) or {}).get("birthDate"):
+                            # Precomputed: a few facts instead of the raw Patient resource
+                            await updater.update_status(
+                                TaskState.working, new_agent_text_message(f"Detected Age Check: Using precomputed facts for {parsed_task['mrn']}.")
+                            )
+                            facts = features.facts(parsed_task["mrn"], context_time(system_context))
+                            heuristic_context = f"\n[PATIENT FACTS (precomputed)]:\n{facts}\n"
+                            if memory:
+                                memory.current_patient = parsed_task["mrn"]
+                        else:
+                            await updater.update_status(
+                                TaskState.working, new_agent_text_message(f"Detected Age Check: Fetching patient {parsed_task['mrn']}...")
+                            )
+                            # Fetch by ID (assuming MRN maps to ID 'Sxxxx' in this benchmark per implementation plan)
+                            params = {"_id": parsed_task["mrn"]} 
+                            data = await search(fhir_base_url, "Patient", params)
+                            features.update_from_result(data)
+                            heuristic_context = f"\n[CONTEXT FROM FHIR (Pre-fetched)]:\n{data}\n"
+                            # Deterministic age so the LLM does not do date arithmetic
+                            age = features.age(parsed_task["mrn"], context_time(system_context))
+                            if age is not None:
+                                heuristic_context += f"\n[PATIENT FACTS (precomputed)]:\nAge as of {context_time(system_context)[:10]}: {age} years\n"
                         is_pre_fetched = True
                         skip_tools = True # Task 2 optimization: Skip tools (LLM can calc age from context)
 
@@ -252,27 +535,38 @@ class Agent:
                         )
                         # Fetch by ID to provide valid reference context
                         params = {"_id": parsed_task["mrn"]}
-                        data = await search_fhir(fhir_base_url, "Patient", params)
+                        data = await search(fhir_base_url, "Patient", params)
+                        (await run_io(get_feature_store)).update_from_result(data)
                         heuristic_context = f"\n[CONTEXT FROM FHIR (Pre-fetched)]:\n{data}\n"
+                        try:
+                            observation = build_bp_observation(parsed_task["mrn"], parsed_task["bp"], context_time(system_context))
+                            heuristic_context += (
+                                f"\n[PREPARED OBSERVATION (validated)]:\n{json.dumps(observation)}\n"
+                                "Submit it with the `create_fhir_resource` tool.\n"
+                            )
+                        except ValueError as e:
+                            print(f"[PURPLE] Could not prepare Observation: {e}", flush=True)
                         is_pre_fetched = True
                         skip_tools = False # Task 3 optimization: DO NOT skip tools (LLM needs to POST)
 
-                # 3. Context Injection & Prompt Construction
-                system_prompt = "You are a helpful medical AI assistant. You are participating in a medical benchmark. Answer questions accurately and concisely."
-                if system_context:
-                    system_prompt += f"\n\nCurrent Context: {system_context}"
-                
-                # If we pre-fetched, we don't necessarily need the tool instruction as strictly, 
-                # but we still tell it about validity.
-                if fhir_base_url:
-                    if is_pre_fetched:
-                        system_prompt += f"\n\nRelevant FHIR data has been pre-fetched and provided below. Use this context to answer the user's question directly."
-                    else:
-                        system_prompt += f"\nYou have access to a FHIR server at: {fhir_base_url}\nWhen asked to retrieve patient information, ALWAYS use the provided FHIR server URL using the `search_fhir` tool. Do not hallucinate data."
-
-                messages = [{"role": "system", "content": system_prompt}]
-                
-                # Handling History
+                elif not parsed_task:
+                    # Open-ended questions: carry known facts about mentioned patients instead of raw bundles
+                    features = await run_io(get_feature_store)
+                    now = context_time(system_context)
+                    # A follow-up without an MRN ("their latest BP") is about the conversation's current patient
+                    mrns = MRN_PATTERN.findall(instruction) or ([memory.current_patient] if memory and memory.current_patient else [])
+                    facts = [f for f in (features.facts(mrn, now) for mrn in dict.fromkeys(mrns)) if f]
+                    if facts:
+                        heuristic_context = "\n[PATIENT FACTS (precomputed)]:\n" + "\n\n".join(facts) + "\n"
+
+                # Follow-up turns: references to what the conversation already fetched, not the bundles again
+                if memory and memory.turns:
+                    references = memory.references()
+                    if references:
+                        heuristic_context += f"\n[CONVERSATION MEMORY]:\n{references}\n"
+
+                # 3. Prompt Construction (static prefix first, per-request context last)
+                history = memory.history() if memory else []
                 if task and task.history:
                      for msg in task.history:
                         role = "user" if msg.role == "user" else "assistant" # Map 'agent' to 'assistant'
@@ -281,44 +575,50 @@ class Agent:
                         
                         text = get_message_text(msg)
                         if text:
-                            messages.append({"role": role, "content": text})
-
-                user_content = instruction + heuristic_context
-                messages.append({"role": "user", "content": user_content})
-
-                # 4. Tool Configuration
-                tools = []
-                if fhir_base_url and not skip_tools:
-                    tools.append({
-                        "type": "function",
-                        "function": {
-                            "name": "search_fhir",
-                            "description": "Search for resources on the FHIR server.",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "resource_type": {
-                                        "type": "string",
-                                        "description": "The type of FHIR resource to search for (e.g., 'Patient', 'Observation', 'Condition')."
-                                    },
-                                    "params": {
-                                        "type": "object",
-                                        "description": "Key-value pairs for search parameters (e.g., {'name': 'John', 'birthdate': '1980-01-01'})."
-                                    }
-                                },
-                                "required": ["resource_type", "params"]
-                            }
-                        }
-                    })
+                            history.append({"role": role, "content": text})
+
+                # Compact {"answer": ...} replies, enforced by the provider where supported
+                task_type = parsed_task["type"] if parsed_task else None
+                # Per-task-type model, token budget and reasoning effort
+                generation = generation_kwargs(task_type, self.provider, self.model)
+                output_mode = structured_output_mode(self.provider, generation["model"])
+                answer_format = response_format(task_type, output_mode)
+
+                messages = build_messages(
+                    instruction,
+                    history=history,
+                    system_context=system_context,
+                    fhir_base_url=fhir_base_url,
+                    is_pre_fetched=is_pre_fetched,
+                    heuristic_context=heuristic_context,
+                    cache_hints=supports_cache_control(self.provider, generation["model"]),
+                    answer_format=format_instruction(task_type, output_mode),
+                )
+
+                # 4. Tool Configuration (frozen schema, identical bytes on every call)
+                # Only tasks that record data get the write tool
+                can_write = task_type in WRITE_TASK_TYPES
+                tools = build_tools(bool(fhir_base_url) and not skip_tools, write=can_write)
 
                 # Log the full prompt
-                print(f"[PURPLE] Sending Prompt to LLM ({self.model}):\n{json.dumps(messages, indent=2)}", flush=True)
+                print(f"[PURPLE] Sending Prompt to LLM ({generation['model']}):\n{json.dumps(messages, indent=2)}", flush=True)
 
-                # 5. LLM Call
-                completion = await self.client.chat.completions.create(
-                    model=self.model,
+                # Speculative Pre-Fetch: overlap likely FHIR reads with the first completion
+                if fhir_base_url and not parsed_task:
+                    prefetcher = SpeculativePrefetcher(search, fhir_base_url)
+                    started = prefetcher.start(instruction)
+                    if started:
+                        print(f"[PURPLE] Started {started} speculative FHIR read(s).", flush=True)
+
+                # 5. LLM Call (cheap lookups are scheduled ahead of long reasoning tasks)
+                cost = estimate_cost(task_type, messages)
+                completion = await self._complete(
+                    cost,
+                    **generation,
                     messages=messages,
-                    tools=tools if tools else None,
+                    tools=tools,
+                    # Only a final answer can be forced into the schema, not a tool-calling turn
+                    **({"response_format": answer_format} if answer_format and not tools else {}),
                 )
                 
                 message = completion.choices[0].message
@@ -326,6 +626,24 @@ class Agent:
                 # Handle tool calls (Legacy path or if pre-fetch missed)
                 if message.tool_calls:
                     messages.append(message) # Add the assistant's message with tool_calls
+
+                    # Bulk vitals: every write of this round shares one transaction round-trip
+                    writes = [c for c in message.tool_calls if c.function.name == "create_fhir_resource"] if can_write else []
+                    write_results = {}
+                    if writes:
+                        write_args = [json.loads(c.function.arguments) for c in writes]
+                        # Validated locally, idempotent on retry
+                        results = await post_fhir_many(
+                            fhir_base_url, [(args.get("resource_type"), args.get("resource")) for args in write_args]
+                        )
+                        write_results = {c.id: result for c, result in zip(writes, results)}
+                        # Keep precomputed features current with our own writes
+                        store = await run_io(get_feature_store)
+                        for result in results:
+                            store.update_from_result(result)
+                        if memory:
+                            for args in write_args:
+                                memory.invalidate(args.get("resource_type"))
                     
                     for tool_call in message.tool_calls:
                         if tool_call.function.name == "search_fhir":
@@ -333,8 +651,11 @@ class Agent:
                             resource_type = func_args.get("resource_type")
                             params = func_args.get("params")
                             
-                            # Execute tool
-                            tool_result = await search_fhir(fhir_base_url, resource_type, params)
+                            # Execute tool (resolves from an in-flight speculative read when it matches)
+                            if prefetcher:
+                                tool_result = await prefetcher.resolve(resource_type, params)
+                            else:
+                                tool_result = await search(fhir_base_url, resource_type, params)
                             
                             messages.append({
                                 "role": "tool",
@@ -342,10 +663,25 @@ class Agent:
                                 "name": "search_fhir",
                                 "content": tool_result
                             })
+                        elif tool_call.function.name == "create_fhir_resource":
+                            if not can_write:
+                                # Not offered for this task: a read-only question never writes
+                                tool_result = "Error: create_fhir_resource is not available for this task."
+                            else:
+                                tool_result = write_results[tool_call.id]
+
+                            messages.append({
+                                "role": "tool",
+                                "tool_call_id": tool_call.id,
+                                "name": "create_fhir_resource",
+                                "content": tool_result
+                            })
                     
-                    # Call LLM again with tool results
-                    second_completion = await self.client.chat.completions.create(
-                        model=self.model,
+                    # Call LLM again with tool results (not forced into JSON mode: the format is
+                    # asked for in the prompt and extracted locally)
+                    second_completion = await self._complete(
+                        cost,
+                        **generation,
                         messages=messages,
                         # tools=tools # Optional
                     )
@@ -353,12 +689,80 @@ class Agent:
                 else:
                     response_text = message.content
 
+                # Reasoning traces never reach the artifact
+                response_text = strip_reasoning(response_text)
+                if output_mode != "off":
+                    response_text = extract_answer(response_text, task_type)
+
             except Exception as e:
                 import traceback
                 response_text = f"Error calling LLM: {str(e)}\n{traceback.format_exc()}"
                 print(f"[PURPLE] Exception: {response_text}", flush=True)
+            finally:
+                if prefetcher:
+                    prefetcher.cancel()
 
-        await updater.add_artifact(
-            parts=[Part(root=TextPart(text=response_text))],
-            name="Response",
+        return response_text
+
+    async def _complete(self, cost: float = TASK_COSTS[None], **kwargs):
+        """Chat completion in an LLM slot scheduled by its expected `cost` (or queued for the next batch)."""
+        if self.batch:
+            completion = await self.batch.create(**kwargs)
+            record_usage(completion.usage)
+            return completion
+        async with LLM_SCHEDULER.slot(cost):
+            completion = await self.client.chat.completions.create(**kwargs)
+        record_usage(completion.usage)
+        return completion
+
+    async def run_batch(self, items: list, updater: TaskUpdater, stream: bool = False) -> None:
+        """
+        Answer many instruction payloads from one A2A message.
+
+        Items run concurrently (bounded by BATCH_MAX_CONCURRENCY, and by the
+        shared LLM limit for completions). With `stream`, each result is emitted
+        as its own artifact as soon as it completes; otherwise one aggregated
+        JSON artifact is emitted at the end, also when the batch is cut short
+        (then with the finished results and the indices still `unfinished`).
+        """
+        await updater.update_status(
+            TaskState.working, new_agent_text_message(f"Processing batch of {len(items)} tasks...")
         )
+        semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+        item_updater = BatchItemUpdater()
+
+        async def run_item(index: int, item) -> dict:
+            async with semaphore:
+                if not isinstance(item, dict) or "instruction" not in item:
+                    return {"index": index, "id": None, "response": "Error: Batch item must be an object with an 'instruction'."}
+                response = await self.answer(
+                    item["instruction"], item.get("fhir_base_url"), item.get("system_context"), item_updater
+                )
+                return {"index": index, "id": item.get("id"), "response": response}
+
+        # Own tasks, so cancelling the batch (deadline, cancel request) cancels every item
+        pending = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(pending):
+                result = await finished
+                if stream:
+                    await updater.add_artifact(
+                        parts=[Part(root=DataPart(data=result))],
+                        name=f"Response[{result['index']}]",
+                    )
+        finally:
+            unfinished = [t for t in pending if not t.done()]
+            for t in unfinished:
+                t.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+            if not stream:
+                # Also when the batch is cut short: finished results are kept, the rest listed as unfinished
+                finished = [t for t in pending if not t.cancelled() and t.exception() is None]
+                data = {"results": [t.result() for t in finished]}
+                if len(finished) < len(pending):
+                    data["unfinished"] = [i for i, t in enumerate(pending) if t not in finished]
+                await updater.add_artifact(
+                    parts=[Part(root=DataPart(data=data))],
+                    name="BatchResponse",
+                )
@@ -0,0 +1,145 @@
+"""
+Structured answers: per-task-type response schemas and a local post-processor.
+
+The Green agent scores a short value (an MRN, an age), but free-form answers
+from reasoning models come wrapped in preambles. Every request therefore asks
+for a compact `{"answer": ...}` object. Where the model supports it, this is
+enforced with `response_format` (JSON schema on OpenRouter models that honour
+it, JSON mode on other Nebius models). Reasoning models (DeepSeek-R1, ...) are
+only asked in the prompt, because JSON mode would constrain their reasoning
+trace too. The completion that follows a tool call is never forced either.
+`extract_answer` then pulls the answer out locally and validates it against
+the task type, falling back to the text it was given.
+
+Modes (LLM_STRUCTURED_OUTPUT):
+    auto        - pick per model (default)
+    json_schema - response_format with a strict JSON schema
+    json_object - response_format JSON mode, schema described in the prompt
+    prompt      - schema described in the prompt only
+    off         - free-form answers, no post-processing
+"""
+import json
+import os
+import re
+
+try:
+    from speculation import MRN_PATTERN
+    from generation import is_reasoning_model
+except ImportError:
+    from .speculation import MRN_PATTERN
+    from .generation import is_reasoning_model
+
+ANSWER_FIELDS = {
+    "search_patient": {"type": "string", "description": "The patient's MRN (e.g. S1234567), or \"Patient not found\""},
+    "get_patient_age": {"type": "integer", "description": "Age in completed years"},
+    "record_vitals": {"type": "string", "description": "One-line confirmation of what was recorded"},
+    None: {"type": "string", "description": "The answer, as short as possible"},
+}
+
+# OpenRouter model families that accept `response_format: json_schema`
+JSON_SCHEMA_MODEL_PREFIXES = ("openai/", "google/gemini", "anthropic/")
+STRUCTURED_MODES = {"json_schema", "json_object", "prompt", "off"}
+
+ANSWER_OBJECT_PATTERN = re.compile(r'\{[^{}]*"answer"[^{}]*\}', re.DOTALL)
+AGE_PATTERN = re.compile(r"\b(\d{1,3})\s*(?:years?|yrs?|y/?o)\b", re.IGNORECASE)
+NOT_FOUND_PATTERN = re.compile(r"\bnot\s+found\b", re.IGNORECASE)
+
+
+def structured_output_mode(provider: str | None, model: str | None) -> str:
+    mode = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").lower()
+    if mode in STRUCTURED_MODES:
+        return mode
+    if is_reasoning_model(model):
+        return "prompt"
+    if provider == "openrouter" and model and model.startswith(JSON_SCHEMA_MODEL_PREFIXES):
+        return "json_schema"
+    if provider == "nebius":
+        return "json_object"
+    return "prompt"
+
+
+def answer_schema(task_type: str | None) -> dict:
+    return {
+        "type": "object",
+        "properties": {"answer": ANSWER_FIELDS.get(task_type, ANSWER_FIELDS[None])},
+        "required": ["answer"],
+        "additionalProperties": False,
+    }
+
+
+def response_format(task_type: str | None, mode: str) -> dict | None:
+    """The `response_format` request parameter for a final-answer completion, if the mode uses one."""
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": f"{task_type or 'open'}_answer", "strict": True, "schema": answer_schema(task_type)},
+        }
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def format_instruction(task_type: str | None, mode: str) -> str:
+    """Prompt suffix describing the answer object ('' when structured output is off)."""
+    if mode == "off":
+        return ""
+    field = ANSWER_FIELDS.get(task_type, ANSWER_FIELDS[None])
+    return (
+        "\n\n[ANSWER FORMAT]: Give your final answer as a single JSON object "
+        f'{{"answer": <{field["type"]}: {field["description"]}>}} with no other text.'
+    )
+
+
+def parse_answer_object(text: str):
+    """The `answer` value from a JSON reply (bare, fenced or embedded in prose); None if there is none."""
+    candidates = [text.strip()]
+    candidates.extend(match.group(0) for match in reversed(list(ANSWER_OBJECT_PATTERN.finditer(text))))
+    for candidate in candidates:
+        if candidate.startswith("```"):
+            candidate = candidate.strip("`").removeprefix("json").strip()
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and "answer" in data:
+            return data["answer"]
+    return None
+
+
+def validate_answer(value, task_type: str | None) -> str | None:
+    """Normalize an answer for the task type; None if it does not fit."""
+    if value is None:
+        return None
+    if task_type == "search_patient":
+        text = str(value)
+        match = MRN_PATTERN.search(text)
+        if match:
+            return match.group(0)
+        return "Patient not found" if NOT_FOUND_PATTERN.search(text) else None
+    if task_type == "get_patient_age":
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return str(int(value))
+        text = str(value).strip()
+        if text.isdigit():
+            return text
+        match = AGE_PATTERN.search(text)
+        return match.group(1) if match else None
+    text = value if isinstance(value, str) else json.dumps(value)
+    return text.strip() or None
+
+
+def extract_answer(text: str | None, task_type: str | None) -> str | None:
+    """
+    The compact answer from a model reply, validated for the task type.
+
+    Tries the `{"answer": ...}` object first, then the free text itself; if
+    neither validates, the reply is returned unchanged.
+    """
+    if not isinstance(text, str):
+        return text
+    answer = validate_answer(parse_answer_object(text), task_type)
+    if answer is None and task_type in ("search_patient", "get_patient_age"):
+        answer = validate_answer(text, task_type)
+    return answer if answer is not None else text
@@ -0,0 +1,31 @@
+"""
+Atomic file replacement, shared by the ingest CLI and the request path.
+
+Kept free of heavy imports so the feature store can persist itself without
+pulling in the ingest pipeline.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    Yield a temporary path next to `path`; it replaces `path` only if the block succeeds.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_json(path: str, data) -> None:
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
@@ -0,0 +1,254 @@
+"""
+Provider batch-API mode for offline evaluation sweeps.
+
+Interactive runs make one real-time chat completion per LLM round. That is
+billed at full price and limited by per-minute rate limits. For full-benchmark
+sweeps, `BatchCompletions` can be used as the agent's completion function
+instead. Every request the normal pipeline builds is queued. After a short
+linger (or once the batch is full), the queued requests are written to an
+OpenAI-compatible batch JSONL file and submitted. The batch is polled to
+completion, and each result goes back to the task that asked for it. Tool
+rounds then continue as usual, and their follow-up completions form the next
+batch.
+
+Backends:
+    OpenAIBatchBackend: the provider's `/v1/batches` API (OpenAI, Nebius, ...)
+    LocalBatchBackend: stand-in that answers each line with a local callable
+"""
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import time
+
+from openai.types.chat import ChatCompletion
+
+try:
+    from event_loop import run_io
+except ImportError:
+    from .event_loop import run_io
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+DEFAULT_LINGER = float(os.getenv("LLM_BATCH_LINGER", "2.0"))
+DEFAULT_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))
+# Provider limit on requests per batch file
+DEFAULT_MAX_REQUESTS = 50000
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Request fields the SDK does not know and takes through `extra_body`
+PROVIDER_EXTENSION_FIELDS = ("reasoning",)
+
+
+def to_jsonable(value):
+    """Request kwargs as plain JSON (assistant messages may be SDK models); None values are dropped."""
+    if hasattr(value, "model_dump"):
+        return to_jsonable(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+
+def request_body(kwargs: dict) -> dict:
+    """SDK create() kwargs as a raw request body (`extra_body` fields are inlined, as the SDK does)."""
+    body = to_jsonable(kwargs)
+    body.update(body.pop("extra_body", None) or {})
+    return body
+
+
+def completion_kwargs(body: dict) -> dict:
+    """Inverse of request_body: provider extensions go back into `extra_body`."""
+    kwargs = {k: v for k, v in body.items() if k not in PROVIDER_EXTENSION_FIELDS}
+    extra = {k: v for k, v in body.items() if k in PROVIDER_EXTENSION_FIELDS}
+    if extra:
+        kwargs["extra_body"] = extra
+    return kwargs
+
+
+def batch_line(custom_id: str, body: dict) -> dict:
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_batch_file(path: str, lines: list[dict]) -> None:
+    with open(path, "w") as f:
+        for line in lines:
+            f.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_batch_file(path: str) -> list[dict]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_results(text: str) -> dict[str, dict]:
+    """Batch output JSONL -> {custom_id: output line}."""
+    results = {}
+    for line in text.splitlines():
+        if line.strip():
+            item = json.loads(line)
+            results[item["custom_id"]] = item
+    return results
+
+
+def completion_from_result(item: dict | None) -> ChatCompletion:
+    """One batch output line as a ChatCompletion; raises if the request failed."""
+    if item is None:
+        raise RuntimeError("Batch returned no result for request")
+    response = item.get("response") or {}
+    if item.get("error") or response.get("status_code", 200) >= 400:
+        raise RuntimeError(f"Batch request failed: {item.get('error') or response.get('body')}")
+    return ChatCompletion.model_validate(response["body"])
+
+
+class OpenAIBatchBackend:
+    """Submit a batch file through an OpenAI-compatible Files + Batches API and wait for it."""
+
+    def __init__(self, client, completion_window: str = "24h", poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.client = client
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+
+    async def run(self, path: str) -> str:
+        # File reads and writes run on the I/O pool, never on the event loop
+        data = await run_io(read_bytes, path)
+        input_file = await self.client.files.create(file=(os.path.basename(path), data), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        print(f"[PURPLE] Submitted batch {batch.id} ({path})", flush=True)
+
+        while batch.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts:
+                print(f"[PURPLE] Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total})", flush=True)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+        # Failed requests land in the error file; both share the output line format
+        text = ""
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self.client.files.content(file_id)
+                text += content.text + "\n"
+        return text
+
+
+class LocalBatchBackend:
+    """
+    Stand-in provider for tests and dry runs.
+
+    `respond(body)` receives each request body and returns a ChatCompletion
+    (or its JSON). It may be async. The output uses the provider's line format,
+    so the same result mapping is exercised.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.submitted: list[list[dict]] = []
+
+    async def run(self, path: str) -> str:
+        lines = await run_io(read_batch_file, path)
+        self.submitted.append(lines)
+
+        out = []
+        for line in lines:
+            try:
+                body = self.respond(line["body"])
+                if asyncio.iscoroutine(body):
+                    body = await body
+                out.append({
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "body": to_jsonable(body)},
+                    "error": None,
+                })
+            except Exception as e:
+                out.append({"custom_id": line["custom_id"], "response": None, "error": {"message": str(e)}})
+        return "\n".join(json.dumps(item) for item in out)
+
+
+class BatchCompletions:
+    """
+    Drop-in for `client.chat.completions.create` that collects requests into batches.
+
+    Args:
+        backend: OpenAIBatchBackend or LocalBatchBackend
+        work_dir: Where batch input files are written while a batch runs (default: system temp dir)
+        linger: Seconds to wait for more requests after the first one is queued
+        max_requests: Submit as soon as this many requests are queued
+    """
+
+    def __init__(self, backend, work_dir: str | None = None, linger: float = DEFAULT_LINGER, max_requests: int = DEFAULT_MAX_REQUESTS):
+        self.backend = backend
+        self.work_dir = work_dir or tempfile.gettempdir()
+        self.linger = linger
+        self.max_requests = max_requests
+        self._ids = itertools.count()
+        self._pending: list[tuple[str, dict, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self.batches = 0
+
+    async def create(self, **kwargs) -> ChatCompletion:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((f"req-{next(self._ids)}", request_body(kwargs), future))
+        if len(self._pending) >= self.max_requests:
+            self._submit()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._submit_later())
+        return await future
+
+    async def _submit_later(self):
+        await asyncio.sleep(self.linger)
+        self._timer = None
+        self._submit()
+
+    def _submit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.create_task(self._run(pending))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, pending: list[tuple[str, dict, asyncio.Future]]):
+        self.batches += 1
+        path = os.path.join(self.work_dir, f"purple-batch-{os.getpid()}-{int(time.time())}-{self.batches}.jsonl")
+        try:
+            await run_io(write_batch_file, path, [batch_line(custom_id, body) for custom_id, body, _ in pending])
+            print(f"[PURPLE] Batching {len(pending)} completion request(s) -> {path}", flush=True)
+            results = read_results(await self.backend.run(path))
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # The provider keeps its own copy; ours is not needed once the results are in
+            await run_io(remove_file, path)
+        for custom_id, _, future in pending:
+            if future.done():
+                continue
+            try:
+                future.set_result(completion_from_result(results.get(custom_id)))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,151 @@
+"""
+Smaller, cheaper A2A responses: compact JSON encoding and response compression.
+
+The Green agent polls `tasks/get` and receives full task histories and
+artifacts, so the same large JSON documents are serialized and sent again and
+again.
+
+    A2AApplication         encodes JSON-RPC responses with orjson (falls back
+                           to the standard encoder when orjson is missing)
+    CompressionMiddleware  brotli or gzip, negotiated from Accept-Encoding,
+                           for complete responses of at least
+                           COMPRESSION_MIN_SIZE bytes
+
+Server-sent event streams are never compressed: the middleware would have to
+buffer them, which defeats streaming.
+"""
+import gzip
+import json
+import os
+from collections.abc import AsyncGenerator
+
+from a2a.extensions.common import HTTP_EXTENSION_HEADER
+from a2a.server.apps import A2AStarletteApplication
+from a2a.types import JSONRPCErrorResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSION_STATS = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def dumps(content) -> bytes:
+    """Compact JSON bytes, as Starlette's JSONResponse renders them."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class A2AApplication(A2AStarletteApplication):
+    """A2A Starlette application that encodes non-streaming responses with orjson."""
+
+    def _create_response(self, context, handler_result):
+        if isinstance(handler_result, AsyncGenerator):
+            return super()._create_response(context, handler_result)  # SSE events are encoded by pydantic
+        headers = {}
+        if extensions := context.activated_extensions:
+            headers[HTTP_EXTENSION_HEADER] = ", ".join(sorted(extensions))
+        model = handler_result if isinstance(handler_result, JSONRPCErrorResponse) else handler_result.root
+        return ORJSONResponse(model.model_dump(mode="json", exclude_none=True), headers=headers)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """The best encoding we support from an Accept-Encoding header: "br", "gzip" or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete responses of at least `minimum_size` bytes.
+
+    Responses sent in several chunks (streams) and responses that already carry
+    a Content-Encoding pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = "content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream")
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                # Streamed response: send it as it comes
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                compressed = compress(body, encoding)
+                COMPRESSION_STATS["responses"] += 1
+                COMPRESSION_STATS["bytes_in"] += len(body)
+                COMPRESSION_STATS["bytes_out"] += len(compressed)
+                body = compressed
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
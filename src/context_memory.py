@@ -0,0 +1,170 @@
+"""
+Working memory of one A2A conversation (context).
+
+`Executor` keeps one `Agent` per context_id, and each Agent owns a
+`ContextMemory`. It holds:
+
+    patients   resolved (name, birth date) -> MRN, and the current patient
+    resources  FHIR resources already fetched, keyed by (type, id), with
+               their meta.versionId
+    searches   result text of FHIR searches already run, replayed instead of
+               fetched again
+    turns      earlier instructions and answers of the conversation
+
+A follow-up turn ("and what's their latest BP?") gets the earlier turns as
+history and a short block of references to what is already known, instead of
+the bundles again. Every part is bounded (oldest first out), and the memory is
+dropped when the Executor evicts the context (once no task still runs on it,
+the agent is also closed).
+"""
+import json
+import os
+from collections import OrderedDict, deque
+
+try:
+    from name_index import normalize
+    from speculation import request_key
+except ImportError:
+    from .name_index import normalize
+    from .speculation import request_key
+
+MAX_RESOURCES = int(os.getenv("CONTEXT_MEMORY_MAX_RESOURCES", "256"))
+MAX_SEARCH_BYTES = int(os.getenv("CONTEXT_MEMORY_MAX_SEARCH_BYTES", str(2 * 1024 * 1024)))
+MAX_TURNS = int(os.getenv("CONTEXT_MEMORY_MAX_TURNS", "10"))
+# References listed in the prompt block; the rest are only counted
+MAX_REFERENCES = 20
+
+
+def result_resources(result: str) -> list[dict]:
+    """Resources in a FHIR search result (a Bundle or a single resource); [] for errors and non-JSON."""
+    try:
+        data = json.loads(result)
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(data, dict):
+        return []
+    if data.get("resourceType") == "Bundle":
+        resources = [e.get("resource") for e in data.get("entry") or [] if isinstance(e, dict)]
+    else:
+        resources = [data]
+    return [r for r in resources if isinstance(r, dict) and r.get("resourceType") and r.get("id")]
+
+
+def reference(resource_type: str, resource_id: str, version: str | None) -> str:
+    return f"{resource_type}/{resource_id}" + (f" (v{version})" if version else "")
+
+
+class ContextMemory:
+    """
+    Args:
+        max_resources: Resources kept (least recently used dropped first)
+        max_search_bytes: Total size of remembered search results
+        max_turns: Earlier turns replayed as history
+    """
+
+    def __init__(self, max_resources: int = MAX_RESOURCES, max_search_bytes: int = MAX_SEARCH_BYTES, max_turns: int = MAX_TURNS):
+        self.max_resources = max_resources
+        self.max_search_bytes = max_search_bytes
+        self.patients: dict[tuple[str, str], str] = {}
+        self.current_patient: str | None = None
+        self.resources: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self.searches: OrderedDict[tuple, str] = OrderedDict()
+        self.search_bytes = 0
+        self.turns: deque[tuple[str, str]] = deque(maxlen=max_turns)
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self.resources)
+
+    # Patients
+
+    def remember_patient(self, name: str, birth_date: str, mrn: str) -> None:
+        self.patients[(normalize(name), birth_date)] = mrn
+        self.current_patient = mrn
+
+    def resolve_patient(self, name: str, birth_date: str) -> str | None:
+        return self.patients.get((normalize(name), birth_date))
+
+    # Resources and searches
+
+    def remember(self, resource_type: str, params: dict | None, result: str) -> None:
+        """Record a successful search's result and the resources in it."""
+        resources = result_resources(result)
+        if not resources and not result.lstrip().startswith("{"):
+            return  # "Error: ..." and other non-results
+        for resource in resources:
+            key = (resource["resourceType"], resource["id"])
+            self.resources[key] = resource
+            self.resources.move_to_end(key)
+            if resource["resourceType"] == "Patient":
+                self.current_patient = resource["id"]
+        while len(self.resources) > self.max_resources:
+            self.resources.popitem(last=False)
+
+        key = request_key(resource_type, params)
+        if key in self.searches:
+            self.search_bytes -= len(self.searches.pop(key))
+        if len(result) > self.max_search_bytes:
+            return
+        self.searches[key] = result
+        self.search_bytes += len(result)
+        while self.search_bytes > self.max_search_bytes:
+            _, evicted = self.searches.popitem(last=False)
+            self.search_bytes -= len(evicted)
+
+    def lookup(self, resource_type: str, params: dict | None) -> str | None:
+        """A remembered result for this search, or None."""
+        key = request_key(resource_type, params)
+        result = self.searches.get(key)
+        if result is None and len(params or {}) == 1 and key[1][0][0] == "_id":
+            # A read by id of a resource some other search already returned
+            resource = self.resources.get((resource_type, str(next(iter(params.values())))))
+            if resource is not None:
+                result = json.dumps({"resourceType": "Bundle", "type": "searchset", "total": 1, "entry": [{"resource": resource}]})
+        if result is not None:
+            self.hits += 1
+            if key in self.searches:
+                self.searches.move_to_end(key)
+        return result
+
+    def invalidate(self, resource_type: str) -> None:
+        """Forget searches over `resource_type` (after we wrote one, they may be stale)."""
+        for key in [k for k in self.searches if k[0] == resource_type]:
+            self.search_bytes -= len(self.searches.pop(key))
+
+    # Conversation
+
+    def record_turn(self, instruction: str, answer: str) -> None:
+        self.turns.append((instruction, answer))
+
+    def history(self) -> list[dict]:
+        messages = []
+        for instruction, answer in self.turns:
+            messages.append({"role": "user", "content": instruction})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def references(self) -> str:
+        """Prompt block naming what this conversation already resolved and fetched; "" when empty."""
+        if not self.current_patient and not self.resources:
+            return ""
+        lines = []
+        if self.current_patient:
+            lines.append(f"Current patient: Patient/{self.current_patient}")
+        recent = list(self.resources.items())[-MAX_REFERENCES:]
+        if recent:
+            refs = ", ".join(reference(t, i, (r.get("meta") or {}).get("versionId")) for (t, i), r in reversed(recent))
+            more = len(self.resources) - len(recent)
+            lines.append(f"Already retrieved: {refs}" + (f" and {more} more" if more else ""))
+            lines.append("Repeating a search for these returns the remembered result.")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "patients": len(self.patients),
+            "resources": len(self.resources),
+            "searches": len(self.searches),
+            "search_bytes": self.search_bytes,
+            "turns": len(self.turns),
+            "hits": self.hits,
+        }
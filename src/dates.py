@@ -0,0 +1,156 @@
+"""
+Vectorized date arithmetic over patient cohorts.
+
+Ages and elapsed times are computed with NumPy datetime64 arrays, one pass per
+cohort instead of one call per patient. Birth dates are parsed by NumPy
+directly. Timestamps with UTC offsets are normalized to naive UTC first,
+because datetime64 has no timezone support.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+NAT_DAY = np.datetime64("NaT", "D")
+NAT_SECOND = np.datetime64("NaT", "s")
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "D": 86400}
+
+
+def _parse_date(value) -> np.datetime64:
+    try:
+        return np.datetime64(value[:10], "D") if value else NAT_DAY
+    except ValueError:
+        return NAT_DAY
+
+
+def parse_dates(values) -> np.ndarray:
+    """
+    ISO dates (or timestamps, truncated to the date) as datetime64[D].
+
+    Partial FHIR dates ("1954", "1954-08") are the first day of the period;
+    missing or unparseable values are NaT.
+    """
+    try:
+        return np.array([v[:10] if v else None for v in values], dtype="datetime64[D]")
+    except ValueError:
+        # One malformed value must not fail the whole vector
+        return np.array([_parse_date(v) for v in values], dtype="datetime64[D]")
+
+
+def _parse_timestamp(value: str) -> np.datetime64:
+    if len(value) < 10:
+        # Year or year-month precision: the start of the period
+        return np.datetime64(value, "s")
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(parsed, "s")
+
+
+def parse_timestamps(values) -> np.ndarray:
+    """
+    ISO timestamps as naive-UTC datetime64[s].
+
+    Date-only and partial values ("1954", "1954-08") are midnight UTC at the
+    start of the period; missing or unparseable values are NaT.
+    """
+    out = np.full(len(values), NAT_SECOND, dtype="datetime64[s]")
+    for i, value in enumerate(values):
+        if not value:
+            continue
+        try:
+            out[i] = _parse_timestamp(value)
+        except ValueError:
+            continue
+    return out
+
+
+def _month_day(days: np.ndarray) -> np.ndarray:
+    """Sortable (month, day) key for each date."""
+    months = days.astype("datetime64[M]")
+    month_of_year = months.astype(np.int64) % 12
+    day_of_month = (days - months.astype("datetime64[D]")).astype(np.int64)
+    return month_of_year * 32 + day_of_month
+
+
+def ages(birth_dates, on) -> np.ndarray:
+    """
+    Completed years of age for every birth date, as of `on`.
+
+    Args:
+        birth_dates: ISO strings or a datetime64 array
+        on: ISO string (one reference date for all) or an array of per-patient dates
+
+    Returns:
+        np.ndarray: float64 ages; NaN where the birth date is unknown
+    """
+    born = birth_dates if isinstance(birth_dates, np.ndarray) else parse_dates(birth_dates)
+    born = born.astype("datetime64[D]")
+    if isinstance(on, str):
+        reference = np.full(born.shape, np.datetime64(on[:10], "D"))
+    else:
+        reference = (on if isinstance(on, np.ndarray) else parse_dates(on)).astype("datetime64[D]")
+
+    years = reference.astype("datetime64[Y]").astype(np.int64) - born.astype("datetime64[Y]").astype(np.int64)
+    before_birthday = _month_day(reference) < _month_day(born)
+    result = (years - before_birthday).astype(np.float64)
+    result[np.isnat(born) | np.isnat(reference)] = np.nan
+    return result
+
+
+def age_on(birth_date: str, on: str) -> int | None:
+    """Completed years between two ISO dates; None if either is unparseable."""
+    age = ages([birth_date], on)[0]
+    return None if np.isnan(age) else int(age)
+
+
+def elapsed(times, now: str, unit: str = "h") -> np.ndarray:
+    """Time from each timestamp until `now`, in `unit` ('s', 'm', 'h' or 'D'); NaN where unknown."""
+    stamps = times if isinstance(times, np.ndarray) else parse_timestamps(times)
+    reference = parse_timestamps([now])[0]
+    seconds = (reference - stamps.astype("datetime64[s]")).astype("timedelta64[s]")
+    result = seconds.astype(np.float64) / UNIT_SECONDS[unit]
+    result[np.isnat(stamps)] = np.nan
+    return result
+
+
+
+class PatientIndex:
+    """
+    Columnar snapshot of the feature store: one array per feature, one row per MRN.
+    """
+
+    def __init__(self, mrns: list[str], birth_dates: np.ndarray, last_bp_times: np.ndarray, lab_times: dict[str, dict]):
+        self.mrns = np.array(mrns, dtype=object)
+        self.birth_dates = birth_dates
+        self.last_bp_times = last_bp_times
+        self._lab_times = lab_times
+        self._positions = {mrn: i for i, mrn in enumerate(mrns)}
+
+    @classmethod
+    def from_features(cls, features: dict[str, dict], mrns=None) -> "PatientIndex":
+        """Index every patient in `features`, or only `mrns` (unknown MRNs get NaT rows)."""
+        mrns = list(features) if mrns is None else list(mrns)
+        rows = [features.get(m) or {} for m in mrns]
+        birth = parse_dates([row.get("birthDate") for row in rows])
+        last_bp = parse_timestamps([(row.get("last_bp") or {}).get("time") for row in rows])
+        lab_times = {
+            m: {code: lab.get("time") for code, lab in row.get("latest_labs", {}).items()}
+            for m, row in zip(mrns, rows)
+        }
+        return cls(mrns, birth, last_bp, lab_times)
+
+    def __len__(self) -> int:
+        return len(self.mrns)
+
+    def position(self, mrn: str) -> int | None:
+        return self._positions.get(mrn)
+
+    def ages(self, on: str) -> np.ndarray:
+        return ages(self.birth_dates, on)
+
+    def since_last_bp(self, now: str, unit: str = "h") -> np.ndarray:
+        return elapsed(self.last_bp_times, now, unit)
+
+    def since_latest_lab(self, code: str, now: str, unit: str = "h") -> np.ndarray:
+        times = parse_timestamps([self._lab_times[m].get(code) for m in self.mrns])
+        return elapsed(times, now, unit)
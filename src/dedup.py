@@ -0,0 +1,98 @@
+"""
+Deduplication of retried A2A messages.
+
+A Green agent that times out on `message/send` and retries sends the same
+message again, and the request handler turns it into a brand-new task. Each
+message is keyed by its message_id and a hash of its parts:
+
+    running    the retry waits for the original and replays its artifacts
+    completed  the retry replays the stored artifacts at once (within
+               DEDUP_WINDOW_SECONDS, up to DEDUP_MAX_ENTRIES results)
+    failed or  nothing is stored, so the retry runs the pipeline itself
+    canceled
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from a2a.server.tasks import TaskUpdater
+from a2a.types import Message
+
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW_SECONDS", "600"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "1024"))
+
+
+def message_key(message: Message) -> tuple[str, str]:
+    """
+    (message_id, content hash): a retry matches, a reused id with new content does not.
+
+    The context_id is left out: a retry that had none gets a fresh one assigned by the server.
+    """
+    parts = [part.model_dump(mode="json", exclude_none=True) for part in message.parts]
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    return (message.message_id, digest)
+
+
+class RecordingTaskUpdater(TaskUpdater):
+    """TaskUpdater that keeps the artifacts it emits, so a duplicate request can replay them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.artifacts: list[tuple[list, str | None]] = []
+
+    async def add_artifact(self, parts, artifact_id=None, name=None, **kwargs) -> None:
+        self.artifacts.append((parts, name))
+        await super().add_artifact(parts, artifact_id=artifact_id, name=name, **kwargs)
+
+
+class Deduplicator:
+    """
+    Args:
+        window: Seconds a completed result is replayed to duplicates
+        max_entries: Completed results kept (oldest dropped first)
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_entries: int = DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self.running: dict[tuple, asyncio.Future] = {}
+        self.completed: OrderedDict[tuple, tuple[float, list]] = OrderedDict()
+        self.replayed = 0
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self.completed and next(iter(self.completed.values()))[0] <= now:
+            self.completed.popitem(last=False)
+
+    async def claim(self, key: tuple) -> list | None:
+        """
+        Artifacts of an earlier identical request, waiting for it while it runs.
+        None means the caller owns the key: it must run the request, then `release` it.
+        """
+        while True:
+            self._expire()
+            if key in self.completed:
+                self.replayed += 1
+                return self.completed[key][1]
+            pending = self.running.get(key)
+            if pending is None:
+                self.running[key] = asyncio.get_running_loop().create_future()
+                return None
+            # Shielded: a canceled duplicate must not cancel the original's future
+            await asyncio.shield(pending)
+
+    def release(self, key: tuple, artifacts: list | None) -> None:
+        """Store a successful run's artifacts (None for failures) and wake duplicates waiting on it."""
+        if artifacts is not None and self.window > 0:
+            self.completed[key] = (time.monotonic() + self.window, artifacts)
+            while len(self.completed) > self.max_entries:
+                self.completed.popitem(last=False)
+        pending = self.running.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.set_result(None)
+
+    def stats(self) -> dict:
+        return {"running": len(self.running), "completed": len(self.completed), "replayed": self.replayed}
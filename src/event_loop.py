@@ -0,0 +1,112 @@
+"""
+Keeping the event loop free: a thread pool for blocking I/O and a lag monitor.
+
+All request-path disk I/O (cache files, the SQLite mirror, the feature store's
+first load, batch-mode JSONL files) goes through `run_io`, which runs it on a dedicated thread pool
+instead of the event loop. `LoopLagMonitor` measures how late a periodic
+timer fires. That delay is time the loop spent blocked. It records the lag as a
+metric (reported by /healthz) and warns when it exceeds a threshold.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+IO_THREADS = int(os.getenv("IO_THREADS", "8"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="purple-io")
+
+
+# Counted here rather than read from the executor's internals
+IO_STATS = {"in_flight": 0, "running": 0, "completed": 0}
+_IO_STATS_LOCK = threading.Lock()
+
+
+def _count(key: str, delta: int) -> None:
+    with _IO_STATS_LOCK:
+        IO_STATS[key] += delta
+
+
+async def run_io(func, /, *args, **kwargs):
+    """Run a blocking call on the I/O thread pool and await its result."""
+    def call():
+        _count("running", 1)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _count("running", -1)
+            _count("completed", 1)
+
+    loop = asyncio.get_running_loop()
+    _count("in_flight", 1)
+    try:
+        return await loop.run_in_executor(IO_EXECUTOR, call)
+    finally:
+        _count("in_flight", -1)
+
+
+def io_stats() -> dict:
+    """Calls on the I/O pool: running, waiting for a thread, and completed."""
+    with _IO_STATS_LOCK:
+        running, in_flight, completed = IO_STATS["running"], IO_STATS["in_flight"], IO_STATS["completed"]
+    return {"threads": IO_THREADS, "running": running, "queued": max(0, in_flight - running), "completed": completed}
+
+
+class LoopLagMonitor:
+    """
+    Samples event-loop lag every `interval` seconds.
+
+    Args:
+        interval: Seconds between samples
+        warn_ms: Log a warning when one sample's lag exceeds this
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, warn_ms: float = LOOP_LAG_WARN_MS):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.blocked = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record(self, lag_ms: float) -> None:
+        self.samples += 1
+        self.last_ms = lag_ms
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+        if lag_ms > self.warn_ms:
+            self.blocked += 1
+            print(f"[PURPLE] Event loop blocked for {lag_ms:.0f} ms (threshold {self.warn_ms:.0f} ms)", flush=True)
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "last_ms": round(self.last_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+            "mean_ms": round(self.total_ms / self.samples, 1) if self.samples else 0.0,
+            "blocked": self.blocked,
+        }
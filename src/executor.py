@@ -1,19 +1,25 @@
+import asyncio
+import os
+from collections import Counter, OrderedDict
+
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
     Task,
     TaskState,
-    UnsupportedOperationError,
     InvalidRequestError,
+    TaskNotCancelableError,
 )
 from a2a.utils.errors import ServerError
 from a2a.utils import (
+    get_message_text,
     new_agent_text_message,
     new_task,
 )
 
-from agent import Agent
+from agent import Agent, batch_payload
+from dedup import Deduplicator, RecordingTaskUpdater, message_key
 
 
 TERMINAL_STATES = {
@@ -23,10 +29,32 @@ TERMINAL_STATES = {
     TaskState.rejected
 }
 
+# Seconds a task may run before it is canceled (0 disables the deadline)
+TASK_DEADLINE = float(os.getenv("TASK_DEADLINE_SECONDS", "600")) or None
+# Deadline for batch payloads and for any task while LLM_BATCH_MODE queues completions for a
+# provider batch (which may take hours); 0, the default, disables it
+BATCH_TASK_DEADLINE = float(os.getenv("BATCH_TASK_DEADLINE_SECONDS", "0")) or None
+# Conversations (and their agents' memory) kept; the least recently used is evicted first
+MAX_CONTEXTS = int(os.getenv("MAX_CONTEXTS", "256"))
+
 
 class Executor(AgentExecutor):
-    def __init__(self):
-        self.agents: dict[str, Agent] = {} # context_id to agent instance
+    def __init__(
+        self,
+        deadline: float | None = TASK_DEADLINE,
+        max_contexts: int = MAX_CONTEXTS,
+        dedup: Deduplicator | None = None,
+        batch_deadline: float | None = BATCH_TASK_DEADLINE,
+    ):
+        self.agents: OrderedDict[str, Agent] = OrderedDict() # context_id to agent instance, least recently used first
+        self.running: dict[str, asyncio.Task] = {} # task_id to the asyncio task running the agent
+        self.deadline = deadline
+        self.batch_deadline = batch_deadline
+        self.max_contexts = max_contexts
+        self.evicted: list[Agent] = [] # agents dropped from `agents`, closed once no task uses them
+        self.in_use: Counter[Agent] = Counter() # agent to the number of tasks running on it
+        # Retried messages replay the original's result instead of running again
+        self.dedup = dedup or Deduplicator()
 
     async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
         msg = context.message
@@ -42,21 +70,100 @@ class Executor(AgentExecutor):
             await event_queue.enqueue_event(task)
 
         context_id = task.context_id
-        agent = self.agents.get(context_id)
-        if not agent:
-            agent = Agent()
-            self.agents[context_id] = agent
+        agent = self.get_agent(context_id)
+        # Held until the task ends, so eviction never closes an agent mid-run
+        self.in_use[agent] += 1
+        try:
+            await self.close_evicted()
+            updater = RecordingTaskUpdater(event_queue, task.id, context_id)
 
-        updater = TaskUpdater(event_queue, task.id, context_id)
+            await updater.start_work()
+            # Own task, so cancel() and the deadline abort in-flight LLM and FHIR calls
+            run = asyncio.create_task(self._run(agent, msg, updater, task))
+            self.running[task.id] = run
+            limit = self.deadline_for(agent, msg)
+            deadline = asyncio.timeout(limit)
+            try:
+                async with deadline:
+                    await run
+                if not updater._terminal_state_reached:
+                    await updater.complete()
+            except asyncio.CancelledError:
+                # execute() itself being cancelled (e.g. by the request handler) must propagate
+                if asyncio.current_task().cancelling():
+                    raise
+                print(f"Task {task.id} canceled")
+                if not updater._terminal_state_reached:
+                    await updater.cancel(new_agent_text_message("Task canceled", context_id=context_id, task_id=task.id))
+            except Exception as e:
+                if isinstance(e, TimeoutError) and deadline.expired():
+                    print(f"Task {task.id} exceeded its deadline of {limit}s; canceled")
+                    if not updater._terminal_state_reached:
+                        await updater.cancel(new_agent_text_message(
+                            f"Task exceeded its deadline of {limit}s", context_id=context_id, task_id=task.id
+                        ))
+                    return
+                print(f"Task failed with agent error: {e}")
+                await updater.failed(new_agent_text_message(f"Agent error: {e}", context_id=context_id, task_id=task.id))
+            finally:
+                run.cancel()
+                self.running.pop(task.id, None)
+        finally:
+            self.in_use[agent] -= 1
+            if not self.in_use[agent]:
+                del self.in_use[agent]
+            await self.close_evicted()
 
-        await updater.start_work()
+    def deadline_for(self, agent: Agent, msg) -> float | None:
+        """Seconds the task may run: batch payloads and batch-mode agents get the (longer) batch deadline."""
+        if agent.batch is not None or batch_payload(get_message_text(msg)) is not None:
+            return self.batch_deadline
+        return self.deadline
+
+    async def _run(self, agent: Agent, msg, updater: RecordingTaskUpdater, task: Task) -> None:
+        """Run the agent, or replay the result of an identical message already running or recently completed."""
+        key = message_key(msg)
+        artifacts = await self.dedup.claim(key)
+        if artifacts is not None:
+            print(f"Task {task.id} duplicates message {msg.message_id}; replaying its result")
+            for parts, name in artifacts:
+                await updater.add_artifact(parts=parts, name=name)
+            return
+        succeeded = False
         try:
-            await agent.run(msg, updater, task)
-            if not updater._terminal_state_reached:
-                await updater.complete()
-        except Exception as e:
-            print(f"Task failed with agent error: {e}")
-            await updater.failed(new_agent_text_message(f"Agent error: {e}", context_id=context_id, task_id=task.id))
+            response = await agent.run(msg, updater, task)
+            # An error answer is not worth replaying: a retry should try again
+            succeeded = not (response or "").startswith("Error")
+        finally:
+            self.dedup.release(key, updater.artifacts if succeeded else None)
+
+    def get_agent(self, context_id: str) -> Agent:
+        """The context's agent, created on first use; evicts the least recently used context when full."""
+        agent = self.agents.get(context_id)
+        if agent:
+            self.agents.move_to_end(context_id)
+            return agent
+        agent = self.agents[context_id] = Agent()
+        while len(self.agents) > self.max_contexts:
+            # A run still using an evicted agent finishes normally; the agent is closed after it
+            evicted_id, evicted = self.agents.popitem(last=False)
+            self.evicted.append(evicted)
+            print(f"Evicted context {evicted_id} (limit {self.max_contexts} contexts)")
+        return agent
+
+    async def close_evicted(self) -> None:
+        """Close evicted agents no task is using, so their connections are released now rather than at GC."""
+        idle = [agent for agent in self.evicted if not self.in_use[agent]]
+        self.evicted = [agent for agent in self.evicted if self.in_use[agent]]
+        for agent in idle:
+            await agent.close()
 
     async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        raise ServerError(error=UnsupportedOperationError())
+        run = self.running.get(context.task_id)
+        if run is None or run.done():
+            raise ServerError(error=TaskNotCancelableError(message=f"Task {context.task_id} is not running"))
+        run.cancel()
+        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
+        await updater.cancel(new_agent_text_message(
+            "Task canceled by request", context_id=context.context_id, task_id=context.task_id
+        ))
@@ -0,0 +1,203 @@
+"""
+Precomputed per-patient features for common benchmark questions.
+
+Most MedAgentBench questions reduce to a handful of per-patient facts: age,
+the latest value of a lab code, the last blood pressure, active medications.
+The feature store keeps those facts keyed by MRN. It is built during
+prefetch/ingest and updated as the agent reads and writes resources, so the
+fast path and the prompt builder can read a patient's features in O(1) and
+inject a few lines of facts instead of raw Bundles.
+"""
+import json
+import os
+from typing import TYPE_CHECKING
+
+try:
+    from fhir_mirror import effective_time, patient_reference
+    from atomic_files import atomic_write_json
+except ImportError:
+    from .fhir_mirror import effective_time, patient_reference
+    from .atomic_files import atomic_write_json
+
+if TYPE_CHECKING:
+    from dates import PatientIndex
+
+DEFAULT_FEATURES_PATH = "med_data/patient-features.json"
+BP_CODES = {"BP", "85354-9", "55284-4"}
+ACTIVE_MEDICATION_STATUSES = {"active", "on-hold"}
+
+
+def observation_codes(resource: dict) -> list[str]:
+    code = resource.get("code") or {}
+    codes = [coding["code"] for coding in code.get("coding", []) if coding.get("code")]
+    if code.get("text"):
+        codes.append(code["text"])
+    return codes
+
+
+def observation_value(resource: dict) -> dict:
+    if "valueQuantity" in resource:
+        quantity = resource["valueQuantity"]
+        return {"value": quantity.get("value"), "unit": quantity.get("unit") or quantity.get("code")}
+    if "valueString" in resource:
+        return {"value": resource["valueString"]}
+    if "valueCodeableConcept" in resource:
+        concept = resource["valueCodeableConcept"]
+        return {"value": concept.get("text") or next((c.get("display") for c in concept.get("coding", [])), None)}
+    return {}
+
+
+def medication_name(resource: dict) -> str | None:
+    concept = resource.get("medicationCodeableConcept") or {}
+    return concept.get("text") or next((c.get("display") for c in concept.get("coding", [])), None)
+
+
+def _dates():
+    """The NumPy-backed dates module, imported on first use to keep it off the startup path."""
+    try:
+        import dates
+    except ImportError:
+        from . import dates
+    return dates
+
+
+def age_on(birth_date: str, on: str) -> int | None:
+    return _dates().age_on(birth_date, on)
+
+
+def _is_newer(time: str | None, current: dict | None) -> bool:
+    return current is None or (time or "") >= (current.get("time") or "")
+
+
+class FeatureStore:
+    def __init__(self, features: dict[str, dict] | None = None):
+        self._features: dict[str, dict] = features or {}
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def get(self, mrn: str) -> dict | None:
+        return self._features.get(mrn)
+
+    def _patient(self, mrn: str) -> dict:
+        features = self._features.get(mrn)
+        if features is None:
+            features = self._features[mrn] = {"latest_labs": {}, "active_medications": {}}
+        return features
+
+    def update(self, resource: dict) -> None:
+        """Fold one resource into its patient's features (newer data wins)."""
+        if not isinstance(resource, dict):
+            return
+        resource_type = resource.get("resourceType")
+        mrn = patient_reference(resource)
+        if not mrn:
+            return
+
+        if resource_type == "Patient":
+            features = self._patient(mrn)
+            if resource.get("birthDate"):
+                features["birthDate"] = resource["birthDate"]
+            for human_name in resource.get("name", [])[:1]:
+                features["name"] = " ".join(human_name.get("given", []) + [human_name.get("family", "")]).strip()
+
+        elif resource_type == "Observation":
+            if resource.get("status") in ("entered-in-error", "cancelled"):
+                return
+            features = self._patient(mrn)
+            time = effective_time(resource)
+            value = {**observation_value(resource), "time": time}
+            codes = observation_codes(resource)
+            if BP_CODES.intersection(codes):
+                if _is_newer(time, features.get("last_bp")):
+                    features["last_bp"] = value
+                return
+            for code in codes:
+                if _is_newer(time, features["latest_labs"].get(code)):
+                    features["latest_labs"][code] = value
+
+        elif resource_type == "MedicationRequest":
+            features = self._patient(mrn)
+            medication_id = resource.get("id") or medication_name(resource)
+            if resource.get("status") in ACTIVE_MEDICATION_STATUSES:
+                features["active_medications"][medication_id] = medication_name(resource)
+            else:
+                features["active_medications"].pop(medication_id, None)
+
+    def age(self, mrn: str, now: str) -> int | None:
+        """Deterministic Task 2 answer: the patient's age as of `now`, if the birth date is known."""
+        birth_date = (self._features.get(mrn) or {}).get("birthDate")
+        return age_on(birth_date, now) if birth_date else None
+
+    def cohort(self, mrns=None) -> "PatientIndex":
+        """Columnar snapshot of all patients (or just `mrns`) for cohort-wide date arithmetic."""
+        return _dates().PatientIndex.from_features(self._features, mrns)
+
+    def update_many(self, resources) -> None:
+        for resource in resources:
+            self.update(resource)
+
+    def update_from_result(self, result: str) -> None:
+        """Fold a FHIR response (a Bundle or a single resource, as JSON text) into the store."""
+        try:
+            data = json.loads(result)
+        except (TypeError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("resourceType") == "Bundle":
+            self.update_many(entry.get("resource") for entry in data.get("entry", []))
+        else:
+            self.update(data)
+
+    def facts(self, mrn: str, now: str | None = None) -> str | None:
+        """A few lines of facts about the patient, or None if nothing is known."""
+        features = self._features.get(mrn)
+        if not features:
+            return None
+        lines = [f"Patient MRN: {mrn}"]
+        if features.get("name"):
+            lines.append(f"Name: {features['name']}")
+        if features.get("birthDate"):
+            lines.append(f"Birth date: {features['birthDate']}")
+            age = self.age(mrn, now) if now else None
+            if age is not None:
+                lines.append(f"Age as of {now[:10]}: {age} years")
+        if features.get("last_bp"):
+            bp = features["last_bp"]
+            lines.append(f"Last BP: {bp.get('value')} at {bp.get('time')}")
+        for code, lab in sorted(features["latest_labs"].items()):
+            unit = f" {lab['unit']}" if lab.get("unit") else ""
+            lines.append(f"Latest {code}: {lab.get('value')}{unit} at {lab.get('time')}")
+        medications = [name for name in features["active_medications"].values() if name]
+        if medications:
+            lines.append(f"Active medications: {', '.join(sorted(medications))}")
+        return "\n".join(lines)
+
+    def save(self, path: str = DEFAULT_FEATURES_PATH) -> None:
+        atomic_write_json(path, self._features)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_FEATURES_PATH) -> "FeatureStore":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+
+_STORE: FeatureStore | None = None
+
+
+def get_feature_store() -> FeatureStore:
+    """Process-wide store, loaded from FEATURE_STORE_PATH (or the default path) on first use."""
+    global _STORE
+    if _STORE is None:
+        path = os.getenv("FEATURE_STORE_PATH", DEFAULT_FEATURES_PATH)
+        try:
+            _STORE = FeatureStore.load(path) if os.path.exists(path) else FeatureStore()
+        except Exception as e:
+            print(f"[PURPLE] Could not load feature store from {path}: {e}", flush=True)
+            _STORE = FeatureStore()
+    return _STORE
+
+
+def warm_feature_store() -> FeatureStore:
+    """Load the store and import the NumPy-backed dates module, so neither happens on a request."""
+    _dates()
+    return get_feature_store()
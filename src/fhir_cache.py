@@ -0,0 +1,190 @@
+"""
+Version-aware cache of FHIR search results, kept coherent with our own writes.
+
+Each cached search stores its result text, a validator and the patients it
+depends on. The validator is the response's ETag or, for a read by id, the
+resource's `meta.versionId` as W/"<versionId>". Within FHIR_CACHE_TTL seconds
+an entry is served as is. After that it is revalidated with a conditional
+GET (`If-None-Match`); a 304 keeps it, anything else refetches it. Entries
+without a validator are refetched.
+
+Whenever the agent writes a resource, every cached search depending on that
+resource's patient is dropped. The patient is also marked as written, so the
+embedded mirror (a snapshot that never sees our writes) is bypassed for them.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import httpx
+
+try:
+    from fhir_mirror import patient_reference
+    from speculation import request_key
+    from context_memory import result_resources
+except ImportError:
+    from .fhir_mirror import patient_reference
+    from .speculation import request_key
+    from .context_memory import result_resources
+
+FHIR_CACHE_TTL = float(os.getenv("FHIR_CACHE_TTL", "60"))
+FHIR_CACHE_MAX_ENTRIES = int(os.getenv("FHIR_CACHE_MAX_ENTRIES", "1024"))
+REVALIDATE_TIMEOUT = 5.0
+
+# Search parameters naming the patient a search is about, per resource type
+PATIENT_PARAMS = {"Patient": ("_id", "identifier")}
+DEFAULT_PATIENT_PARAMS = ("patient", "subject")
+
+
+def version_etag(resource: dict) -> str | None:
+    version = (resource.get("meta") or {}).get("versionId")
+    return f'W/"{version}"' if version else None
+
+
+def param_patients(resource_type: str, params: dict | None) -> set[str]:
+    """Patient ids named by a search's parameters ("S1", "Patient/S1" -> "S1")."""
+    patients = set()
+    for name in PATIENT_PARAMS.get(resource_type, DEFAULT_PATIENT_PARAMS):
+        values = (params or {}).get(name)
+        for value in values if isinstance(values, (list, tuple)) else [values]:
+            if value:
+                patients.add(str(value).removeprefix("Patient/"))
+    return patients
+
+
+def read_by_id(resource_type: str, params: dict | None) -> str | None:
+    """The id when a search is a plain read of one resource by id."""
+    if len(params or {}) == 1 and request_key(resource_type, params)[1][0][0] == "_id":
+        value = next(iter(params.values()))
+        return str(value) if isinstance(value, (str, int)) else None
+    return None
+
+
+@dataclass
+class CachedSearch:
+    resource_type: str
+    params: dict | None
+    result: str
+    etag: str | None
+    patients: frozenset
+    checked_at: float
+
+
+class FhirCache:
+    """
+    Args:
+        ttl: Seconds an entry is served without revalidation
+        max_entries: Entries kept (least recently used dropped first)
+        client: httpx client for conditional GETs (default: one pooled client, built on first use)
+    """
+
+    def __init__(self, ttl: float = FHIR_CACHE_TTL, max_entries: int = FHIR_CACHE_MAX_ENTRIES, client: httpx.AsyncClient | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._http = client
+        self.entries: OrderedDict[tuple, CachedSearch] = OrderedDict()
+        self.written: set[tuple[str, str]] = set()  # (base_url, patient id)
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "invalidated": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _http_client(self) -> httpx.AsyncClient:
+        # Shared, so a revalidation reuses a warm connection instead of a new TCP/TLS handshake
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=REVALIDATE_TIMEOUT)
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _key(base_url: str, resource_type: str, params: dict | None) -> tuple:
+        return (base_url.rstrip("/"), request_key(resource_type, params))
+
+    def get(self, base_url: str, resource_type: str, params: dict | None) -> CachedSearch | None:
+        key = self._key(base_url, resource_type, params)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def fresh(self, entry: CachedSearch) -> bool:
+        return time.monotonic() - entry.checked_at < self.ttl
+
+    async def lookup(self, base_url: str, resource_type: str, params: dict | None) -> str | None:
+        """The cached result if still valid (fresh, or confirmed by a 304), else None."""
+        entry = self.get(base_url, resource_type, params)
+        if entry is not None and (self.fresh(entry) or await self.revalidate(base_url, entry)):
+            self.stats["hits"] += 1
+            return entry.result
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, base_url: str, resource_type: str, params: dict | None, result: str, etag: str | None = None) -> None:
+        resources = result_resources(result)
+        if etag is None and read_by_id(resource_type, params) and len(resources) == 1:
+            etag = version_etag(resources[0])
+        patients = param_patients(resource_type, params) | {p for p in map(patient_reference, resources) if p}
+        key = self._key(base_url, resource_type, params)
+        self.entries[key] = CachedSearch(resource_type, params, result, etag, frozenset(patients), time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate_patient(self, base_url: str, patient: str, resource_type: str | None = None) -> int:
+        """
+        Drop entries depending on `patient`, and (given `resource_type`) searches of
+        that type not scoped to any patient, which a new resource could now match.
+        """
+        base_url = base_url.rstrip("/")
+        stale = [
+            key for key, entry in self.entries.items()
+            if key[0] == base_url and (
+                patient in entry.patients
+                or (entry.resource_type == resource_type and not param_patients(entry.resource_type, entry.params))
+            )
+        ]
+        for key in stale:
+            del self.entries[key]
+        self.stats["invalidated"] += len(stale)
+        return len(stale)
+
+    def record_write(self, base_url: str, resource: dict) -> None:
+        """Called for every write we make: drop what depends on the resource's patient."""
+        patient = patient_reference(resource)
+        if patient:
+            self.written.add((base_url.rstrip("/"), patient))
+            self.invalidate_patient(base_url, patient, resource.get("resourceType"))
+
+    def written_to(self, base_url: str, resource_type: str, params: dict | None) -> bool:
+        """Whether the search concerns a patient we wrote to (so the mirror snapshot may be stale)."""
+        base_url = base_url.rstrip("/")
+        return any((base_url, p) in self.written for p in param_patients(resource_type, params))
+
+    async def revalidate(self, base_url: str, entry: CachedSearch) -> bool:
+        """Conditional GET for an entry with a validator; True (and the entry kept) on 304 Not Modified."""
+        if not entry.etag:
+            return False
+        resource_id = read_by_id(entry.resource_type, entry.params)
+        base_url = base_url.rstrip("/")
+        if resource_id:
+            url, params = f"{base_url}/{entry.resource_type}/{resource_id}", None
+        else:
+            url, params = f"{base_url}/{entry.resource_type}", entry.params
+        try:
+            response = await self._http_client().get(url, params=params, headers={"If-None-Match": entry.etag}, timeout=REVALIDATE_TIMEOUT)
+        except Exception as e:
+            print(f"[PURPLE] Revalidation of {url} failed: {e}", flush=True)
+            return False
+        if response.status_code != 304:
+            return False
+        entry.checked_at = time.monotonic()
+        self.stats["revalidated"] += 1
+        return True
+
+
+FHIR_CACHE = FhirCache()
@@ -0,0 +1,411 @@
+"""
+Embedded, read-only FHIR mirror backed by SQLite.
+
+Loaded from a FHIR bulk-export (one NDJSON file per resource type), it answers
+the searches the agent makes in-process instead of over HTTP:
+
+    Patient      _id, identifier, name, family, given, birthdate
+    Observation  patient/subject, code, category, date, _sort=(-)date
+    Condition, MedicationRequest, Procedure, ...   patient/subject
+
+plus `_count`. Searches with any other parameter (or a date prefix other than
+eq/ge/gt/le/lt) are reported as unsupported so `search_fhir` falls back to
+the remote server, as are patient-scoped searches for a patient the snapshot
+does not hold. Set FHIR_MIRROR_PATH to the database file to enable routing.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+try:
+    from fhir_stream import EntryBudget, compact_bundle
+    from name_index import MIN_SCORE, name_score, normalize, tokens
+except ImportError:
+    from .fhir_stream import EntryBudget, compact_bundle
+    from .name_index import MIN_SCORE, name_score, normalize, tokens
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    resource_type TEXT NOT NULL,
+    id TEXT NOT NULL,
+    version_id TEXT,
+    patient_id TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (resource_type, id)
+);
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    birthdate TEXT
+);
+CREATE TABLE IF NOT EXISTS patient_names (
+    patient_id TEXT NOT NULL,
+    part TEXT NOT NULL,
+    token TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patient_identifiers (
+    patient_id TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    effective TEXT
+);
+CREATE TABLE IF NOT EXISTS observation_codes (
+    observation_id TEXT NOT NULL,
+    patient_id TEXT,
+    kind TEXT NOT NULL,
+    system TEXT,
+    code TEXT NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_resources_patient ON resources (patient_id, resource_type);
+CREATE INDEX IF NOT EXISTS idx_patients_birthdate ON patients (birthdate);
+CREATE INDEX IF NOT EXISTS idx_patient_names_token ON patient_names (token, patient_id);
+CREATE INDEX IF NOT EXISTS idx_patient_identifiers_value ON patient_identifiers (value);
+CREATE INDEX IF NOT EXISTS idx_observations_patient_date ON observations (patient_id, effective);
+CREATE INDEX IF NOT EXISTS idx_observation_codes ON observation_codes (patient_id, kind, code, observation_id);
+"""
+
+PATIENT_PARAMS = {"_id", "identifier", "name", "family", "given", "birthdate", "_count"}
+OBSERVATION_PARAMS = {"patient", "subject", "code", "category", "date", "_sort", "_count"}
+PATIENT_SCOPED_PARAMS = {"patient", "subject", "_count"}
+DATE_PREFIXES = ("eq", "ge", "gt", "le", "lt")
+DATE_PARAMS = {"birthdate", "date"}
+# Sorts after any character that can follow a date prefix.
+HIGH = "\uffff"
+
+
+def patient_reference(resource: dict) -> str | None:
+    """The Patient id a resource belongs to (itself for Patients)."""
+    if resource.get("resourceType") == "Patient":
+        return resource.get("id")
+    for field in ("subject", "patient"):
+        reference = (resource.get(field) or {}).get("reference", "")
+        if reference.startswith("Patient/"):
+            return reference.split("/", 1)[1]
+    return None
+
+
+def name_tokens(resource: dict) -> list[tuple[str, str]]:
+    """(part, token) pairs for every family/given name of a Patient (normalized, accents folded)."""
+    pairs = []
+    for human_name in resource.get("name", []):
+        for given in human_name.get("given", []):
+            pairs.extend(("given", t) for t in tokens(given))
+        pairs.extend(("family", t) for t in tokens(human_name.get("family") or ""))
+    return pairs
+
+
+def effective_time(resource: dict) -> str | None:
+    period = resource.get("effectivePeriod") or {}
+    return resource.get("effectiveDateTime") or resource.get("effectiveInstant") or period.get("start") or resource.get("issued")
+
+
+def index_rows(resource: dict) -> dict[str, list[tuple]]:
+    """
+    All table rows for one resource. Pure function so loaders can run it in worker processes.
+    """
+    resource_type = resource.get("resourceType")
+    resource_id = resource.get("id")
+    if not resource_type or not resource_id:
+        return {}
+    patient_id = patient_reference(resource)
+    rows = {
+        "resources": [(
+            resource_type,
+            resource_id,
+            (resource.get("meta") or {}).get("versionId"),
+            patient_id,
+            json.dumps(resource, separators=(",", ":")),
+        )]
+    }
+    if resource_type == "Patient":
+        rows["patients"] = [(resource_id, resource.get("birthDate"))]
+        rows["patient_names"] = [(resource_id, part, token) for part, token in name_tokens(resource)]
+        rows["patient_identifiers"] = [
+            (resource_id, identifier["value"]) for identifier in resource.get("identifier", []) if identifier.get("value")
+        ]
+    elif resource_type == "Observation":
+        rows["observations"] = [(resource_id, patient_id, effective_time(resource))]
+        codes = []
+        for coding in (resource.get("code") or {}).get("coding", []):
+            if coding.get("code"):
+                codes.append((resource_id, patient_id, "code", coding.get("system"), coding["code"]))
+        if (resource.get("code") or {}).get("text"):
+            codes.append((resource_id, patient_id, "code", None, resource["code"]["text"]))
+        for category in resource.get("category", []):
+            for coding in category.get("coding", []):
+                if coding.get("code"):
+                    codes.append((resource_id, patient_id, "category", coding.get("system"), coding["code"]))
+        rows["observation_codes"] = codes
+    return rows
+
+
+INSERTS = {
+    "resources": "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)",
+    "patients": "INSERT OR REPLACE INTO patients VALUES (?, ?)",
+    "patient_names": "INSERT INTO patient_names VALUES (?, ?, ?)",
+    "patient_identifiers": "INSERT INTO patient_identifiers VALUES (?, ?)",
+    "observations": "INSERT OR REPLACE INTO observations VALUES (?, ?, ?)",
+    "observation_codes": "INSERT INTO observation_codes VALUES (?, ?, ?, ?, ?)",
+}
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA)
+
+
+def create_indexes(conn: sqlite3.Connection) -> None:
+    # Built after bulk loading; much faster than maintaining them row by row
+    conn.executescript(INDEXES)
+
+
+def insert_rows(conn: sqlite3.Connection, rows: dict[str, list[tuple]]) -> None:
+    for table, values in rows.items():
+        if values:
+            conn.executemany(INSERTS[table], values)
+
+
+def build_mirror(db_path: str, ndjson_paths: list[str]) -> int:
+    """
+    Load bulk-export NDJSON files into a fresh mirror database. Returns the number of resources.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    count = 0
+    try:
+        create_schema(conn)
+        for path in ndjson_paths:
+            batch: dict[str, list[tuple]] = {}
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    for table, values in index_rows(json.loads(line)).items():
+                        batch.setdefault(table, []).extend(values)
+                    count += 1
+                    if count % 10000 == 0:
+                        insert_rows(conn, batch)
+                        batch = {}
+            insert_rows(conn, batch)
+        create_indexes(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def _values(value) -> list[str]:
+    """Repeated search parameters arrive as lists; each one must match (AND)."""
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _supported_date(value: str) -> bool:
+    """Dates with no prefix or one of DATE_PREFIXES; ne/sa/eb/ap are left to the server."""
+    return not value[:2].isalpha() or value[:2] in DATE_PREFIXES
+
+
+def _date_clause(column: str, value: str) -> tuple[str, list]:
+    prefix = value[:2] if value[:2] in DATE_PREFIXES else "eq"
+    date = value[2:] if value[:2] in DATE_PREFIXES else value
+    if prefix == "eq":
+        return f"({column} >= ? AND {column} < ?)", [date, date + HIGH]
+    if prefix == "ge":
+        return f"{column} >= ?", [date]
+    if prefix == "gt":
+        return f"{column} >= ?", [date + HIGH]
+    if prefix == "le":
+        return f"{column} < ?", [date + HIGH]
+    return f"{column} < ?", [date]
+
+
+def _patient_id(value: str) -> str:
+    return value.split("/", 1)[1] if value.startswith("Patient/") else value
+
+
+class FhirMirror:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One read-only connection per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def supports(self, resource_type: str, params: dict | None) -> bool:
+        keys = set((params or {}).keys())
+        for key in keys & DATE_PARAMS:
+            if not all(map(_supported_date, _values(params[key]))):
+                return False
+        if resource_type == "Patient":
+            return keys <= PATIENT_PARAMS
+        if resource_type == "Observation":
+            return keys <= OBSERVATION_PARAMS
+        return bool(keys) and keys <= PATIENT_SCOPED_PARAMS
+
+    def count(self, resource_type: str | None = None) -> int:
+        if resource_type:
+            row = self._conn().execute("SELECT COUNT(*) FROM resources WHERE resource_type = ?", (resource_type,)).fetchone()
+        else:
+            row = self._conn().execute("SELECT COUNT(*) FROM resources").fetchone()
+        return row[0]
+
+    def _patient_query(self, params: dict) -> tuple[str, list, list, str]:
+        clauses, args = [], []
+        for key, value in params.items():
+            for v in _values(value):
+                if key == "_id":
+                    clauses.append("p.id = ?")
+                    args.append(v)
+                elif key == "identifier":
+                    clauses.append("p.id IN (SELECT patient_id FROM patient_identifiers WHERE value = ?)")
+                    args.append(v.split("|")[-1])
+                elif key in ("name", "family", "given"):
+                    # FHIR string search: case-insensitive 'starts with' on any name part
+                    part_clause = "" if key == "name" else " AND part = ?"
+                    clauses.append(f"p.id IN (SELECT patient_id FROM patient_names WHERE token >= ? AND token < ?{part_clause})")
+                    token = normalize(v)
+                    args.extend([token, token + HIGH] + ([key] if key != "name" else []))
+                elif key == "birthdate":
+                    clause, clause_args = _date_clause("p.birthdate", v)
+                    clauses.append(clause)
+                    args.extend(clause_args)
+        sql = "SELECT r.id, r.body FROM patients p JOIN resources r ON r.resource_type = 'Patient' AND r.id = p.id"
+        return sql, clauses, args, "ORDER BY p.id"
+
+    def _observation_query(self, params: dict) -> tuple[str, list, list, str]:
+        clauses, args = [], []
+        order = "ORDER BY o.effective, o.id"
+        for key, value in params.items():
+            for v in _values(value):
+                if key in ("patient", "subject"):
+                    clauses.append("o.patient_id = ?")
+                    args.append(_patient_id(v))
+                elif key in ("code", "category"):
+                    # Comma-separated values are OR; 'system|code' narrows by system
+                    options = []
+                    for option in v.split(","):
+                        system, _, code = option.rpartition("|")
+                        if system:
+                            options.append("(c.system = ? AND c.code = ?)")
+                            args.extend([system, code])
+                        else:
+                            options.append("c.code = ?")
+                            args.append(code)
+                    clauses.append(
+                        "EXISTS (SELECT 1 FROM observation_codes c WHERE c.observation_id = o.id "
+                        f"AND c.kind = '{key}' AND ({' OR '.join(options)}))"
+                    )
+                elif key == "date":
+                    clause, clause_args = _date_clause("o.effective", v)
+                    clauses.append(clause)
+                    args.extend(clause_args)
+                elif key == "_sort":
+                    order = "ORDER BY o.effective DESC, o.id" if v.startswith("-") else "ORDER BY o.effective, o.id"
+        sql = "SELECT r.id, r.body FROM observations o JOIN resources r ON r.resource_type = 'Observation' AND r.id = o.id"
+        return sql, clauses, args, order
+
+    def _scoped_query(self, resource_type: str, params: dict) -> tuple[str, list, list, str]:
+        clauses, args = ["r.resource_type = ?"], [resource_type]
+        for key, value in params.items():
+            if key in ("patient", "subject"):
+                for v in _values(value):
+                    clauses.append("r.patient_id = ?")
+                    args.append(_patient_id(v))
+        return "SELECT r.id, r.body FROM resources r", clauses, args, "ORDER BY r.id"
+
+    def search_resources(self, resource_type: str, params: dict | None) -> list[tuple[str, str]]:
+        """Matching resources as (id, stored JSON text) pairs."""
+        params = dict(params or {})
+        count = params.pop("_count", None)
+        if resource_type == "Patient":
+            sql, clauses, args, order = self._patient_query(params)
+        elif resource_type == "Observation":
+            sql, clauses, args, order = self._observation_query(params)
+        else:
+            sql, clauses, args, order = self._scoped_query(resource_type, params)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" {order}"
+        if count is not None:
+            sql += " LIMIT ?"
+            args.append(int(_values(count)[0]))
+        return self._conn().execute(sql, args).fetchall()
+
+    def find_patient(self, name: str, birth_date: str, base_url: str = "", min_score: float = MIN_SCORE) -> str | None:
+        """
+        Best fuzzy name match among the patients born on `birth_date`, as a searchset Bundle string.
+
+        The birthdate index narrows the search to one day's patients; only their
+        name tokens are scored (nicknames, phonetic and trigram matches).
+        """
+        candidates: dict[str, list[str]] = {}
+        rows = self._conn().execute(
+            "SELECT n.patient_id, n.token FROM patients p JOIN patient_names n ON n.patient_id = p.id WHERE p.birthdate = ?",
+            (birth_date[:10],),
+        )
+        for patient_id, token in rows:
+            candidates.setdefault(patient_id, []).append(token)
+        query_tokens = tokens(name)
+        scored = sorted(
+            ((name_score(query_tokens, candidate_tokens), patient_id) for patient_id, candidate_tokens in candidates.items()),
+            key=lambda item: (-item[0], item[1]),
+        )
+        if not scored or scored[0][0] < min_score:
+            return None
+        return self.search(base_url, "Patient", {"_id": scored[0][1]})
+
+    def has_patient(self, patient_id: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM patients WHERE id = ?", (patient_id,)).fetchone() is not None
+
+    def search(self, base_url: str, resource_type: str, params: dict | None, budget: EntryBudget | None = None) -> str | None:
+        """
+        A searchset Bundle string shaped like the remote server's response.
+
+        With a `budget`, entries are filtered, projected and trimmed exactly as on
+        the HTTP path. Returns None for a patient-scoped search naming a patient
+        the snapshot does not hold: an empty result would not be authoritative.
+        """
+        if resource_type != "Patient":
+            patients = [_patient_id(v) for key in ("patient", "subject") for v in _values((params or {}).get(key) or [])]
+            if not all(map(self.has_patient, patients)):
+                return None
+        base = (base_url or "").rstrip("/")
+        rows = self.search_resources(resource_type, params)
+        if budget is None:
+            entries = [f'{{"fullUrl":{json.dumps(f"{base}/{resource_type}/{resource_id}")},"resource":{body}}}' for resource_id, body in rows]
+            return compact_bundle({"total": len(entries)}, entries)
+        for resource_id, body in rows:
+            full_url = f"{base}/{resource_type}/{resource_id}"
+            raw = f'{{"fullUrl":{json.dumps(full_url)},"resource":{body}}}'
+            if not budget.offer({"fullUrl": full_url, "resource": json.loads(body)}, raw):
+                break
+        return budget.bundle({"total": len(rows)})
+
+
+_MIRROR: FhirMirror | None = None
+_MIRROR_PATH: str | None = None
+
+
+def get_mirror() -> FhirMirror | None:
+    """The mirror configured by FHIR_MIRROR_PATH, or None when disabled."""
+    global _MIRROR, _MIRROR_PATH
+    path = os.getenv("FHIR_MIRROR_PATH")
+    if not path or not os.path.exists(path):
+        return None
+    if _MIRROR is None or _MIRROR_PATH != path:
+        _MIRROR = FhirMirror(path)
+        _MIRROR_PATH = path
+        print(f"[PURPLE] Using embedded FHIR mirror at {path}", flush=True)
+    return _MIRROR
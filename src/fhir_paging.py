@@ -0,0 +1,166 @@
+"""
+Automatic pagination of FHIR searches.
+
+A searchset Bundle only holds the first page; the rest is reachable through
+`Bundle.link` entries with relation `next`. HAPI encodes the position in the
+next link as `_getpagesoffset`/`_count`, so once the first page reports a
+`total`, every remaining page URL is known up front and the pages can be fetched
+concurrently (at most `concurrency` in flight). Servers without that scheme are
+followed serially. Entries are streamed to the consumer in order, and the
+consumer's entry/byte budget decides when to stop.
+"""
+import asyncio
+import os
+from collections import deque
+from contextlib import aclosing
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+try:
+    from fhir_stream import BundleStreamParser, EntryBudget, drop_fields, stream_entries, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+except ImportError:
+    from .fhir_stream import BundleStreamParser, EntryBudget, drop_fields, stream_entries, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+
+DEFAULT_PAGE_CONCURRENCY = int(os.getenv("FHIR_PAGE_CONCURRENCY", "4"))
+# Guard against servers whose next links never end.
+MAX_SERIAL_PAGES = 100
+
+
+def next_link(meta: dict) -> str | None:
+    for link in meta.get("link") or []:
+        if link.get("relation") == "next":
+            return link.get("url")
+    return None
+
+
+def offset_page_urls(next_url: str, total) -> list[str]:
+    """
+    Every remaining page URL derived from an offset-style next link.
+
+    Returns an empty list when the server does not use `_getpagesoffset`/`_count`
+    or did not report a total, in which case pages must be followed serially.
+    """
+    parts = urlsplit(next_url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    values = dict(query)
+    if not isinstance(total, int) or "_getpagesoffset" not in values or "_count" not in values:
+        return []
+    try:
+        offset, count = int(values["_getpagesoffset"]), int(values["_count"])
+    except ValueError:
+        return []
+    if count <= 0:
+        return []
+
+    urls = []
+    for page_offset in range(offset, total, count):
+        page_query = [(k, str(page_offset) if k == "_getpagesoffset" else v) for k, v in query]
+        urls.append(urlunsplit(parts._replace(query=urlencode(page_query))))
+    return urls
+
+
+async def fetch_page(client, url: str) -> tuple[dict, list[tuple[dict, str]]]:
+    """Fetch one (bounded) page; returns its top-level members and entries."""
+    parser = BundleStreamParser()
+    entries = [item async for item in stream_entries(client, url, None, parser)]
+    return parser.meta, entries
+
+
+async def iter_search_entries(
+    client,
+    url: str,
+    params: dict | None,
+    first_meta: dict | None = None,
+    concurrency: int = DEFAULT_PAGE_CONCURRENCY,
+):
+    """
+    Yield (entry, raw_text) across all pages of a search, in server order.
+
+    `first_meta`, if given, is filled with the first page's top-level members.
+    Closing the generator early cancels any page fetches still in flight.
+    """
+    parser = BundleStreamParser()
+    if first_meta is not None:
+        parser.meta = first_meta
+    async with aclosing(stream_entries(client, url, params, parser)) as first_page:
+        async for item in first_page:
+            yield item
+
+    next_url = next_link(parser.meta)
+    if not next_url:
+        return
+
+    page_urls = offset_page_urls(next_url, parser.meta.get("total"))
+    if not page_urls:
+        # Serial: each page tells us where the next one is
+        for _ in range(MAX_SERIAL_PAGES):
+            meta, entries = await fetch_page(client, next_url)
+            for item in entries:
+                yield item
+            next_url = next_link(meta)
+            if not next_url or not entries:
+                return
+        return
+
+    # Concurrent: keep a window of `concurrency` pages in flight, yield in order
+    remaining = iter(page_urls)
+    pending: deque[asyncio.Task] = deque()
+
+    def launch():
+        while len(pending) < max(1, concurrency):
+            page_url = next(remaining, None)
+            if page_url is None:
+                return
+            pending.append(asyncio.create_task(fetch_page(client, page_url)))
+
+    try:
+        launch()
+        while pending:
+            _, entries = await pending.popleft()
+            launch()
+            if not entries:
+                return
+            for item in entries:
+                yield item
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def search_fhir_paged(
+    base_url: str,
+    resource_type: str,
+    params: dict,
+    max_entries: int | None = DEFAULT_MAX_ENTRIES,
+    max_bytes: int | None = DEFAULT_MAX_BYTES,
+    entry_filter=None,
+    projection=drop_fields(),
+    concurrency: int = DEFAULT_PAGE_CONCURRENCY,
+) -> str:
+    """
+    Search the FHIR server across all result pages, within an entry/byte budget.
+
+    Args:
+        max_entries: Stop once this many entries have been accepted (None for no limit)
+        max_bytes: Stop once the accepted entries reach this many characters (None for no limit)
+        entry_filter: Callable(entry) -> bool deciding whether an entry is kept
+        projection: Callable(entry) -> entry applied to kept entries
+        concurrency: Maximum pages fetched at once
+    """
+    if not base_url:
+        return "Error: No FHIR base URL provided."
+
+    url = f"{base_url.rstrip('/')}/{resource_type}"
+    meta: dict = {}
+    budget = EntryBudget(max_entries, max_bytes, entry_filter, projection)
+    try:
+        async with httpx.AsyncClient() as client:
+            pages = iter_search_entries(client, url, params, first_meta=meta, concurrency=concurrency)
+            async with aclosing(pages) as entries:
+                async for entry, raw in entries:
+                    if not budget.offer(entry, raw):
+                        break
+        return budget.bundle(meta)
+    except Exception as e:
+        return f"Error querying FHIR server: {str(e)}"
@@ -0,0 +1,258 @@
+"""
+Incremental parsing of FHIR searchset Bundles.
+
+Observation searches on long-stay patients can return megabytes. Instead of
+materializing the whole Bundle with `response.json()` and re-serializing it
+with `json.dumps`, the response body is fed chunk by chunk to
+`BundleStreamParser`. It yields each `entry` as soon as it is complete, so
+filters, projections and entry limits apply while the body is still arriving.
+Unprojected entries are passed on as the raw (already compact) server text.
+"""
+import json
+import os
+import re
+
+# Resource types whose searches go through the streaming (paged) path.
+STREAMED_RESOURCE_TYPES = {"Observation", "MedicationRequest", "Condition", "Procedure"}
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("FHIR_STREAM_MAX_ENTRIES", "200"))
+DEFAULT_MAX_BYTES = int(os.getenv("FHIR_MAX_RESULT_BYTES", "200000"))
+
+# Bulky fields that never help answer a question.
+DEFAULT_DROPPED_FIELDS = ("meta", "text")
+# Parts of a dropped `meta` that are kept anyway: the FHIR cache revalidates reads by id with versionId.
+KEPT_META_FIELDS = ("versionId",)
+
+STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+# A complete string, a lone quote (string not finished yet), or a bracket.
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]]')
+SCALAR_RE = re.compile(r'[^,\]}\s]+')
+WHITESPACE = " \t\r\n"
+
+
+class BundleStreamParser:
+    """
+    Event-style parser for a top-level JSON object with an `entry` array.
+
+    feed() returns the entries completed by the new text as (entry, raw_text)
+    tuples. Other top-level members (total, link, ...) are collected in `meta`.
+    """
+
+    def __init__(self):
+        self.meta: dict = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    def feed(self, text: str) -> list[tuple[dict, str]]:
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        entries = []
+        while self._step(entries):
+            pass
+        return entries
+
+    def _skip(self, chars: str) -> bool:
+        """Advance past `chars`. Returns False if the buffer ran out."""
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in chars:
+            pos += 1
+        self._pos = pos
+        return pos < len(buf)
+
+    def _value_end(self, start: int) -> int | None:
+        """End offset of the JSON value at `start`, or None if it is not complete yet."""
+        buf = self._buf
+        char = buf[start]
+        if char == '"':
+            match = STRING_RE.match(buf, start)
+            return match.end() if match else None
+        if char in "{[":
+            depth = 0
+            for match in TOKEN_RE.finditer(buf, start):
+                token = match.group()
+                if token == '"':
+                    return None
+                if token[0] == '"':
+                    continue
+                depth += 1 if token in "{[" else -1
+                if depth == 0:
+                    return match.end()
+            return None
+        match = SCALAR_RE.match(buf, start)
+        if not match or match.end() == len(buf):
+            return None
+        return match.end()
+
+    def _step(self, entries: list) -> bool:
+        state = self._state
+        if state == "start":
+            if not self._skip(WHITESPACE):
+                return False
+            if self._buf[self._pos] != "{":
+                raise ValueError("Expected a JSON object")
+            self._pos += 1
+            self._state = "key"
+            return True
+
+        if state == "key":
+            if not self._skip(WHITESPACE + ","):
+                return False
+            if self._buf[self._pos] == "}":
+                self._pos += 1
+                self._state = "end"
+                self.done = True
+                return False
+            end = self._value_end(self._pos)
+            if end is None:
+                return False
+            self._key = json.loads(self._buf[self._pos:end])
+            self._pos = end
+            self._state = "colon"
+            return True
+
+        if state == "colon":
+            if not self._skip(WHITESPACE):
+                return False
+            if self._buf[self._pos] != ":":
+                raise ValueError(f"Expected ':' after key {self._key!r}")
+            self._pos += 1
+            self._state = "value"
+            return True
+
+        if state == "value":
+            if not self._skip(WHITESPACE):
+                return False
+            if self._key == "entry" and self._buf[self._pos] == "[":
+                self._pos += 1
+                self._state = "entries"
+                return True
+            end = self._value_end(self._pos)
+            if end is None:
+                return False
+            self.meta[self._key] = json.loads(self._buf[self._pos:end])
+            self._pos = end
+            self._state = "key"
+            return True
+
+        if state == "entries":
+            if not self._skip(WHITESPACE + ","):
+                return False
+            if self._buf[self._pos] == "]":
+                self._pos += 1
+                self._state = "key"
+                return True
+            end = self._value_end(self._pos)
+            if end is None:
+                return False
+            raw = self._buf[self._pos:end]
+            entries.append((json.loads(raw), raw))
+            self._pos = end
+            return True
+
+        return False
+
+
+def drop_fields(fields=DEFAULT_DROPPED_FIELDS, kept_meta=KEPT_META_FIELDS):
+    """Projection removing the given top-level fields from each entry's resource (a dropped `meta` keeps `kept_meta`)."""
+    fields = set(fields)
+
+    def project(entry: dict) -> dict:
+        resource = entry.get("resource")
+        if not isinstance(resource, dict) or fields.isdisjoint(resource):
+            return entry
+        projected = {k: v for k, v in resource.items() if k not in fields}
+        meta = resource.get("meta")
+        if "meta" in fields and isinstance(meta, dict):
+            meta = {k: meta[k] for k in kept_meta if k in meta}
+            if meta:
+                projected["meta"] = meta
+        return {**entry, "resource": projected}
+
+    return project
+
+
+def compact_bundle(meta: dict, entries: list[str], truncated: bool = False) -> str:
+    """Assemble a searchset Bundle string from already-serialized entries."""
+    header = {"resourceType": meta.get("resourceType", "Bundle"), "type": meta.get("type", "searchset")}
+    if "total" in meta:
+        header["total"] = meta["total"]
+    if truncated:
+        header["truncated"] = True
+    head = json.dumps(header, separators=(",", ":"))[:-1]
+    return f'{head},"entry":[{",".join(entries)}]}}'
+
+
+def accept_entry(entry: dict, raw: str, entry_filter=None, projection=None) -> str | None:
+    """Apply filter and projection to one parsed entry; returns its compact text or None."""
+    if entry_filter and not entry_filter(entry):
+        return None
+    if projection:
+        projected = projection(entry)
+        if projected is not entry:
+            return json.dumps(projected, separators=(",", ":"))
+    return raw
+
+
+class EntryBudget:
+    """
+    Entries kept for one search result, within an entry/byte budget.
+
+    Shared by every search path (paged HTTP, embedded mirror) so each one
+    filters, projects and trims the same way.
+
+    Args:
+        max_entries: Stop once this many entries have been accepted (None for no limit)
+        max_bytes: Stop once the accepted entries reach this many characters (None for no limit)
+        entry_filter: Callable(entry) -> bool deciding whether an entry is kept
+        projection: Callable(entry) -> entry applied to kept entries
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = DEFAULT_MAX_ENTRIES,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+        entry_filter=None,
+        projection=drop_fields(),
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entry_filter = entry_filter
+        self.projection = projection
+        self.kept: list[str] = []
+        self.size = 0
+        self.truncated = False
+
+    def offer(self, entry: dict, raw: str) -> bool:
+        """
+        Consider one entry; returns False once the budget is spent and reading should stop.
+
+        The result is only reported truncated when an acceptable entry is actually
+        left out, not when the server had exactly `max_entries` of them.
+        """
+        text = accept_entry(entry, raw, self.entry_filter, self.projection)
+        if text is None:
+            return True
+        if (self.max_entries is not None and len(self.kept) >= self.max_entries) or (
+            self.max_bytes is not None and self.size + len(text) > self.max_bytes
+        ):
+            self.truncated = True
+            return False
+        self.kept.append(text)
+        self.size += len(text)
+        return True
+
+    def bundle(self, meta: dict) -> str:
+        return compact_bundle(meta, self.kept, self.truncated)
+
+
+async def stream_entries(client, url: str, params: dict | None, parser: BundleStreamParser):
+    """Yield (entry, raw_text) from a search response as the body arrives."""
+    async with client.stream("GET", url, params=params, timeout=10.0) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_text():
+            for item in parser.feed(chunk):
+                yield item
+
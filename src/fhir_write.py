@@ -0,0 +1,271 @@
+"""
+FHIR write support: building, validating and submitting resources.
+
+Writes are made idempotent with FHIR conditional create. Every resource carries
+an identifier derived from its content, and the server is asked to create it
+only if no resource with that identifier exists (`If-None-Exist` for single
+POSTs, `request.ifNoneExist` inside transaction Bundles). A retried write then
+returns the existing resource instead of creating a duplicate.
+
+Every write, successful or not, invalidates the cached reads that depend on
+the written resource's patient (see `fhir_cache`).
+"""
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import httpx
+
+try:
+    from fhir_cache import FHIR_CACHE
+except ImportError:
+    from .fhir_cache import FHIR_CACHE
+
+IDEMPOTENCY_SYSTEM = "urn:medagentbench:purple:idempotency-key"
+
+BP_PATTERN = re.compile(r"^\s*(\d{2,3})\s*/\s*(\d{2,3})\s*(mmHg|mm\[Hg\])?\s*$", re.IGNORECASE)
+CONTEXT_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:\d{2})?")
+
+OBSERVATION_STATUSES = {"registered", "preliminary", "final", "amended", "corrected", "cancelled", "entered-in-error", "unknown"}
+VALUE_FIELDS = ("valueString", "valueQuantity", "valueCodeableConcept", "valueInteger", "component")
+
+VITAL_SIGNS_CATEGORY = {
+    "coding": [
+        {
+            "system": "http://hl7.org/fhir/observation-category",
+            "code": "vital-signs",
+            "display": "Vital Signs",
+        }
+    ]
+}
+
+
+def context_time(system_context: str | None) -> str:
+    """The 'now' timestamp from the benchmark context, falling back to the wall clock."""
+    if system_context:
+        match = CONTEXT_TIME_PATTERN.search(system_context)
+        if match:
+            return match.group(0)
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def parse_bp(bp: str) -> tuple[int, int] | None:
+    """Parse '118/77 mmHg' into (systolic, diastolic)."""
+    match = BP_PATTERN.match(bp or "")
+    if not match:
+        return None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (systolic > diastolic > 0):
+        return None
+    return systolic, diastolic
+
+
+def build_bp_observation(mrn: str, bp: str, effective_datetime: str) -> dict:
+    """Blood pressure Observation in the shape MedAgentBench Task 3 expects."""
+    parsed = parse_bp(bp)
+    if not parsed:
+        raise ValueError(f"Unrecognized blood pressure value: {bp!r}")
+    systolic, diastolic = parsed
+    return {
+        "resourceType": "Observation",
+        "category": [VITAL_SIGNS_CATEGORY],
+        "code": {"text": "BP"},
+        "effectiveDateTime": effective_datetime,
+        "status": "final",
+        "valueString": f"{systolic}/{diastolic} mmHg",
+        "subject": {"reference": f"Patient/{mrn}"},
+    }
+
+
+def validate_resource(resource_type: str, resource: dict) -> list[str]:
+    """Local checks run before anything is sent. Returns a list of problems (empty if valid)."""
+    errors = []
+    if not isinstance(resource, dict):
+        return ["Resource must be a JSON object."]
+    if resource.get("resourceType") != resource_type:
+        errors.append(f"resourceType must be '{resource_type}', got {resource.get('resourceType')!r}.")
+    try:
+        json.dumps(resource)
+    except (TypeError, ValueError) as e:
+        errors.append(f"Resource is not JSON serializable: {e}")
+    # Malformed fields are reported, never raised: the LLM gets a message it can correct
+    identifier = resource.get("identifier")
+    if "identifier" in resource and not (isinstance(identifier, list) and all(isinstance(i, dict) for i in identifier)):
+        errors.append("identifier must be a list of objects.")
+
+    if resource_type == "Observation":
+        if resource.get("status") not in OBSERVATION_STATUSES:
+            errors.append(f"Observation.status must be one of {sorted(OBSERVATION_STATUSES)}.")
+        code = resource.get("code")
+        if not isinstance(code, dict) or not (code.get("text") or code.get("coding")):
+            errors.append("Observation.code must be an object with 'text' or 'coding'.")
+            code = {}
+        subject = resource.get("subject")
+        reference = subject.get("reference") if isinstance(subject, dict) else None
+        if not isinstance(reference, str) or not reference.startswith("Patient/") or reference == "Patient/":
+            errors.append("Observation.subject must be an object with reference 'Patient/<id>'.")
+        if not any(field in resource for field in VALUE_FIELDS):
+            errors.append("Observation requires a value[x] or component.")
+        value_string = resource.get("valueString")
+        if code.get("text") == "BP" and value_string is not None and not (isinstance(value_string, str) and parse_bp(value_string)):
+            errors.append(f"BP valueString must look like '118/77 mmHg', got {value_string!r}.")
+    return errors
+
+
+def idempotency_key(resource: dict) -> str:
+    """Content hash of a resource, ignoring server-assigned fields and our own idempotency identifier."""
+    content = {k: v for k, v in resource.items() if k not in ("id", "meta", "identifier")}
+    # Business identifiers tell resources apart; only the key we add ourselves is left out
+    identifiers = [i for i in resource.get("identifier") or [] if isinstance(i, dict) and i.get("system") != IDEMPOTENCY_SYSTEM]
+    if identifiers:
+        content["identifier"] = identifiers
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def with_idempotency_key(resource: dict, key: str | None = None) -> tuple[dict, str]:
+    """Return a copy of the resource tagged with its idempotency identifier, and the key."""
+    key = key or idempotency_key(resource)
+    identifiers = [i for i in resource.get("identifier") or [] if isinstance(i, dict) and i.get("system") != IDEMPOTENCY_SYSTEM]
+    identifiers.append({"system": IDEMPOTENCY_SYSTEM, "value": key})
+    return {**resource, "identifier": identifiers}, key
+
+
+def if_none_exist(key: str) -> str:
+    return f"identifier={IDEMPOTENCY_SYSTEM}|{key}"
+
+
+def build_transaction_bundle(resources: list[dict]) -> dict:
+    """Wrap resources in a FHIR transaction Bundle of conditional creates."""
+    entries = []
+    for resource in resources:
+        tagged, key = with_idempotency_key(resource)
+        entries.append({
+            "fullUrl": f"urn:uuid:{uuid4()}",
+            "resource": tagged,
+            "request": {
+                "method": "POST",
+                "url": tagged["resourceType"],
+                "ifNoneExist": if_none_exist(key),
+            },
+        })
+    return {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+
+
+async def post_fhir(base_url: str, resource_type: str, resource: dict, key: str | None = None) -> str:
+    """
+    Create a resource on the FHIR server (conditional create, safe to retry).
+    """
+    if not base_url:
+        return "Error: No FHIR base URL provided."
+
+    errors = validate_resource(resource_type, resource)
+    if errors:
+        return "Error: Resource failed validation: " + " ".join(errors)
+
+    tagged, key = with_idempotency_key(resource, key)
+    url = f"{base_url.rstrip('/')}/{resource_type}"
+    headers = {"Content-Type": "application/fhir+json", "If-None-Exist": if_none_exist(key)}
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(url, json=tagged, headers=headers, timeout=10.0)
+            response.raise_for_status()
+            return json.dumps(response.json()) if response.content else json.dumps({"status": response.status_code})
+    except Exception as e:
+        return f"Error writing to FHIR server: {str(e)}"
+    finally:
+        # Even a failed request may have been applied
+        FHIR_CACHE.record_write(base_url, {**resource, "resourceType": resource_type})
+
+
+async def post_transaction(base_url: str, resources: list[dict]) -> str:
+    """
+    Submit many resources in one round-trip as a FHIR transaction Bundle.
+    """
+    if not resources:
+        return json.dumps({"resourceType": "Bundle", "type": "transaction-response", "entry": []})
+    for i, resource in enumerate(resources):
+        errors = validate_resource(resource.get("resourceType", ""), resource)
+        if errors:
+            return f"Error: Resource {i} failed validation: " + " ".join(errors)
+
+    result = await _transaction(base_url, resources)
+    if isinstance(result, str):
+        return result
+    failures = failed_entries(result, resources)
+    if failures:
+        return f"Error: {len(failures)} of {len(resources)} transaction entries failed: " + "; ".join(failures)
+    return json.dumps(result)
+
+
+async def post_fhir_many(base_url: str, writes: list[tuple[str, dict]]) -> list[str]:
+    """
+    Create several resources, one result per (resource_type, resource) write, in write order.
+
+    Invalid writes get their validation error; the valid ones share a single transaction
+    round-trip (a lone valid write is a plain conditional create).
+    """
+    results = [None] * len(writes)
+    pending = []
+    for i, (resource_type, resource) in enumerate(writes):
+        errors = validate_resource(resource_type, resource)
+        if errors:
+            results[i] = "Error: Resource failed validation: " + " ".join(errors)
+        else:
+            pending.append(i)
+
+    if len(pending) == 1:
+        i = pending[0]
+        results[i] = await post_fhir(base_url, *writes[i])
+    elif pending:
+        resources = [writes[i][1] for i in pending]
+        response = await _transaction(base_url, resources)
+        failures = [] if isinstance(response, str) else failed_entries(response, resources)
+        if failures:
+            # The server applies a transaction all or nothing: one failed entry fails every write
+            response = "Error: transaction failed, nothing was written: " + "; ".join(failures)
+        entries = [] if isinstance(response, str) else response.get("entry") or []
+        for n, i in enumerate(pending):
+            if isinstance(response, str):
+                results[i] = response
+            elif n < len(entries):
+                results[i] = json.dumps(entries[n].get("resource") or entries[n].get("response") or {})
+            else:
+                results[i] = "Error: transaction response has no entry for this resource."
+    return results
+
+
+async def _transaction(base_url: str, resources: list[dict]) -> dict | str:
+    """POST validated resources as one transaction Bundle: the response Bundle, or an error string."""
+    if not base_url:
+        return "Error: No FHIR base URL provided."
+    bundle = build_transaction_bundle(resources)
+    headers = {"Content-Type": "application/fhir+json", "Prefer": "return=representation"}
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(base_url.rstrip("/"), json=bundle, headers=headers, timeout=30.0)
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        return f"Error writing to FHIR server: {str(e)}"
+    finally:
+        # Even a failed request may have been applied
+        for resource in resources:
+            FHIR_CACHE.record_write(base_url, resource)
+
+
+def failed_entries(response_bundle: dict, resources: list[dict]) -> list[str]:
+    """Entries of a transaction-response Bundle whose `response.status` is not 2xx, described for the caller."""
+    failures = []
+    for i, entry in enumerate((response_bundle or {}).get("entry") or []):
+        response = entry.get("response") or {}
+        status = str(response.get("status", ""))
+        if status.startswith("2"):
+            continue
+        resource_type = resources[i].get("resourceType") if i < len(resources) else "?"
+        issues = ((response.get("outcome") or {}).get("issue")) or []
+        details = " ".join(issue.get("diagnostics", "") for issue in issues if issue.get("diagnostics"))
+        failures.append(f"entry {i} ({resource_type}) {status or 'no status'}" + (f": {details}" if details else ""))
+    return failures
@@ -0,0 +1,98 @@
+"""
+Per-task-type generation profiles and reasoning-trace stripping.
+
+Reasoning models such as DeepSeek-R1 emit a long <think> trace on every
+completion, even for lookups the heuristics have already answered. A profile
+picked from the parse_instruction task type sets the request parameters:
+
+    max_tokens        - output budget (raised to REASONING_MIN_TOKENS for
+                        reasoning models, whose trace counts against it)
+    reasoning_effort  - sent where the provider supports it (OpenRouter)
+    stop              - stop sequences
+    fast              - route to the fast model, if one is configured
+
+The fast model comes from NEBIUS_FAST_MODEL_NAME / OPENROUTER_FAST_MODEL_NAME
+(or FAST_MODEL_NAME). GENERATION_PROFILES may hold a JSON object of
+per-task-type overrides, keyed by task type or "open" for open-ended
+questions, e.g. {"search_patient": {"max_tokens": 64}, "open": {"fast": true}}.
+"""
+import json
+import os
+import re
+
+GENERATION_PROFILES = {
+    # Lookups answered from pre-fetched data: short, no deliberation needed
+    "search_patient": {"max_tokens": 256, "reasoning_effort": "low", "stop": None, "fast": True},
+    "get_patient_age": {"max_tokens": 256, "reasoning_effort": "low", "stop": None, "fast": True},
+    # Needs a correct tool call, but the Observation is prepared for it
+    "record_vitals": {"max_tokens": 1024, "reasoning_effort": "low", "stop": None, "fast": True},
+    # Open-ended questions keep the default model and its reasoning
+    None: {"max_tokens": None, "reasoning_effort": None, "stop": None, "fast": False},
+}
+
+REASONING_MIN_TOKENS = 4096
+REASONING_MODEL_PATTERN = re.compile(r"(?:-R1\b|reason|think|qwq)", re.IGNORECASE)
+
+THINK_BLOCK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+UNCLOSED_THINK_PATTERN = re.compile(r"<think>.*\Z", re.DOTALL)
+
+
+def is_reasoning_model(model: str | None) -> bool:
+    return bool(model) and bool(REASONING_MODEL_PATTERN.search(model))
+
+
+def fast_model(provider: str | None) -> str | None:
+    if provider == "nebius":
+        return os.getenv("NEBIUS_FAST_MODEL_NAME") or os.getenv("FAST_MODEL_NAME")
+    if provider == "openrouter":
+        return os.getenv("OPENROUTER_FAST_MODEL_NAME") or os.getenv("FAST_MODEL_NAME")
+    return None
+
+
+def profile_for(task_type: str | None) -> dict:
+    profile = dict(GENERATION_PROFILES.get(task_type, GENERATION_PROFILES[None]))
+    overrides = os.getenv("GENERATION_PROFILES")
+    if overrides:
+        try:
+            profile.update(json.loads(overrides).get(task_type or "open", {}))
+        except (ValueError, AttributeError) as e:
+            print(f"[PURPLE] Ignoring invalid GENERATION_PROFILES: {e}", flush=True)
+    return profile
+
+
+def generation_kwargs(task_type: str | None, provider: str | None, model: str | None) -> dict:
+    """Chat completion parameters (model, max_tokens, stop, reasoning) for a task type."""
+    profile = profile_for(task_type)
+    if profile.get("fast"):
+        model = fast_model(provider) or model
+
+    kwargs = {"model": model}
+    max_tokens = profile.get("max_tokens")
+    if max_tokens:
+        kwargs["max_tokens"] = max(max_tokens, REASONING_MIN_TOKENS) if is_reasoning_model(model) else max_tokens
+    if profile.get("stop"):
+        kwargs["stop"] = profile["stop"]
+    if profile.get("reasoning_effort") and provider == "openrouter":
+        kwargs["extra_body"] = {"reasoning": {"effort": profile["reasoning_effort"]}}
+    return kwargs
+
+
+def strip_reasoning(text: str | None) -> str | None:
+    """
+    Remove reasoning traces from a reply.
+
+    Handles closed <think> blocks, a trace whose opening tag the provider
+    dropped (text up to a lone </think>), and a trace cut off by max_tokens.
+    A reply that is nothing but a trace is returned unstripped rather than
+    as an empty answer, so the answer extraction can still look inside it.
+    """
+    if not isinstance(text, str):
+        return text
+    stripped = THINK_BLOCK_PATTERN.sub("", text)
+    if "</think>" in stripped:
+        stripped = stripped.rsplit("</think>", 1)[1]
+    stripped = UNCLOSED_THINK_PATTERN.sub("", stripped).strip()
+    if not stripped and text.strip():
+        print("[PURPLE] Reply held only a reasoning trace; keeping it unstripped.", flush=True)
+        return text.strip()
+    return stripped
@@ -0,0 +1,159 @@
+"""
+Liveness and readiness for the A2A server.
+
+    /healthz - the process is up (always 200), with cache sizes and pool stats
+    /readyz  - 200 only once warm-up has finished and the FHIR server and LLM
+               backend answer their probes; 503 otherwise
+
+Probe results are cached (HEALTH_PROBE_TTL seconds, shorter for failures), so
+a healthcheck polling every few seconds costs at most one real probe per TTL.
+The FHIR probe reads `/metadata` from FHIR_BASE_URL. When that is not set it
+is skipped, because the FHIR URL normally arrives with each task.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+try:
+    from agent import TASK1_CACHE_PATH, get_llm_client, llm_config, warm_up
+    from features import get_feature_store
+    from fhir_mirror import get_mirror
+    from prompts import CACHE_STATS
+    from compression import COMPRESSION_STATS
+    from fhir_cache import FHIR_CACHE
+    from scheduler import LLM_SCHEDULER
+    from event_loop import LoopLagMonitor, io_stats, run_io
+except ImportError:
+    from .agent import TASK1_CACHE_PATH, get_llm_client, llm_config, warm_up
+    from .features import get_feature_store
+    from .fhir_mirror import get_mirror
+    from .prompts import CACHE_STATS
+    from .compression import COMPRESSION_STATS
+    from .fhir_cache import FHIR_CACHE
+    from .scheduler import LLM_SCHEDULER
+    from .event_loop import LoopLagMonitor, io_stats, run_io
+
+PROBE_TTL = float(os.getenv("HEALTH_PROBE_TTL", "30"))
+PROBE_FAILURE_TTL = float(os.getenv("HEALTH_PROBE_FAILURE_TTL", "5"))
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+
+
+async def probe_fhir(base_url: str) -> None:
+    async with httpx.AsyncClient(timeout=PROBE_TIMEOUT) as client:
+        response = await client.get(f"{base_url.rstrip('/')}/metadata")
+        response.raise_for_status()
+
+
+async def probe_llm() -> None:
+    config = llm_config()
+    if not config.api_key:
+        raise RuntimeError("No API key configured")
+    client = get_llm_client(config.api_key, config.base_url).with_options(max_retries=0, timeout=PROBE_TIMEOUT)
+    await client.models.list()
+
+
+class HealthMonitor:
+    def __init__(self, executor=None, fhir_base_url: str | None = None):
+        self.executor = executor
+        self.fhir_base_url = fhir_base_url if fhir_base_url is not None else os.getenv("FHIR_BASE_URL")
+        self.started_at = time.time()
+        self.warmed = False
+        self.warm_up_error: str | None = None
+        self.mirror_resources: int | None = None
+        self._probes: dict[str, tuple[float, dict]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.loop_lag = LoopLagMonitor()
+
+    async def warm_up(self) -> None:
+        start = time.perf_counter()
+        try:
+            await warm_up()
+            mirror = get_mirror()
+            # Counted once: a full COUNT(*) is too slow for every healthcheck
+            self.mirror_resources = await run_io(mirror.count) if mirror else None
+            self.warmed = True
+            print(f"[PURPLE] Warm-up done in {time.perf_counter() - start:.2f}s", flush=True)
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"[PURPLE] Warm-up failed (continuing cold): {e}", flush=True)
+
+    async def check(self, name: str, probe) -> dict:
+        """Run `probe` (a coroutine function), or return its cached result while fresh."""
+        cached = self._probes.get(name)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+        async with self._locks.setdefault(name, asyncio.Lock()):
+            # Another request may have refreshed it while we waited
+            cached = self._probes.get(name)
+            if cached and time.monotonic() < cached[0]:
+                return cached[1]
+            start = time.perf_counter()
+            try:
+                await probe()
+                result = {"ok": True}
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__}
+            result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            result["checked_at"] = time.time()
+            ttl = PROBE_TTL if result["ok"] else PROBE_FAILURE_TTL
+            self._probes[name] = (time.monotonic() + ttl, result)
+            return result
+
+    def stats(self) -> dict:
+        stats = {
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "warmed": self.warmed,
+            "caches": {
+                "feature_store_patients": len(get_feature_store()),
+                "fhir_mirror_resources": self.mirror_resources,
+                "task1_cache": os.path.exists(TASK1_CACHE_PATH),
+                "prompt_cache": dict(CACHE_STATS),
+                "fhir_cache": {"entries": len(FHIR_CACHE), **FHIR_CACHE.stats},
+            },
+            "pools": {
+                # In-flight counts are tracked by our own wrappers, not read from dependency internals
+                "llm_scheduler": LLM_SCHEDULER.stats(),
+                "io": io_stats(),
+            },
+            "event_loop_lag": self.loop_lag.stats(),
+            "compression": dict(COMPRESSION_STATS),
+        }
+        if self.executor is not None:
+            stats["pools"]["agents"] = len(self.executor.agents)
+            stats["caches"]["context_memory_resources"] = sum(len(agent.memory) for agent in self.executor.agents.values())
+            stats["pools"]["running_tasks"] = len(self.executor.running)
+            stats["pools"]["a2a_in_flight"] = sum(agent.messenger.in_flight for agent in self.executor.agents.values())
+            stats["pools"]["dedup"] = self.executor.dedup.stats()
+        if self.warm_up_error:
+            stats["warm_up_error"] = self.warm_up_error
+        return stats
+
+    async def readiness(self) -> tuple[bool, dict]:
+        checks = {"warm_up": {"ok": self.warmed}}
+        probes = {"llm": probe_llm}
+        if self.fhir_base_url:
+            probes["fhir"] = lambda: probe_fhir(self.fhir_base_url)
+        results = await asyncio.gather(*(self.check(name, probe) for name, probe in probes.items()))
+        checks.update(zip(probes, results))
+        return all(check["ok"] for check in checks.values()), checks
+
+    async def healthz(self, request: Request) -> JSONResponse:
+        return JSONResponse({"status": "ok", **self.stats()})
+
+    async def readyz(self, request: Request) -> JSONResponse:
+        ready, checks = await self.readiness()
+        return JSONResponse(
+            {"status": "ready" if ready else "not ready", "checks": checks, **self.stats()},
+            status_code=200 if ready else 503,
+        )
+
+    def routes(self) -> list[Route]:
+        return [
+            Route("/healthz", self.healthz, methods=["GET"]),
+            Route("/readyz", self.readyz, methods=["GET"]),
+        ]
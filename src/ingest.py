@@ -0,0 +1,173 @@
+"""
+Ingest a FHIR bulk `$export` into the agent's local indexes.
+
+NDJSON files are streamed line by line. Batches of lines are parsed and
+turned into index rows in a process pool, with a bounded number of batches in
+flight, so memory stays flat however large the export is. Rows are written to
+a temporary database next to the target, which is swapped into place with an
+atomic rename once fully built. Readers never see a half-written index.
+
+Usage:
+    python src/ingest.py --input path/to/export --output med_data/fhir-mirror.db
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from atomic_files import atomic_path
+    from fhir_mirror import create_indexes, create_schema, index_rows, insert_rows
+except ImportError:
+    from .atomic_files import atomic_path
+    from .fhir_mirror import create_indexes, create_schema, index_rows, insert_rows
+
+DEFAULT_RESOURCE_TYPES = ("Patient", "Observation", "Condition", "MedicationRequest")
+DEFAULT_BATCH_SIZE = 5000
+
+
+def find_ndjson(inputs: list[str]) -> list[str]:
+    """Expand directories to the NDJSON files they contain."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.ndjson"))))
+        else:
+            paths.append(item)
+    return paths
+
+
+def index_lines(
+    lines: list[str], resource_types: tuple[str, ...], keep_resources: bool = False
+) -> tuple[dict[str, list[tuple]], list[dict], int]:
+    """
+    Worker: parse NDJSON lines into index rows.
+
+    Returns the rows, the parsed resources if `keep_resources` (for consumers
+    such as the feature store that need more than the rows), and the count.
+    """
+    rows: dict[str, list[tuple]] = {}
+    resources = []
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        resource = json.loads(line)
+        if resource.get("resourceType") not in resource_types:
+            continue
+        count += 1
+        if keep_resources:
+            resources.append(resource)
+        for table, values in index_rows(resource).items():
+            rows.setdefault(table, []).extend(values)
+    return rows, resources, count
+
+
+def iter_batches(paths: list[str], batch_size: int):
+    for path in paths:
+        with open(path, "r") as f:
+            batch = []
+            for line in f:
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+
+def ingest(
+    inputs: list[str],
+    output: str,
+    resource_types: tuple[str, ...] = DEFAULT_RESOURCE_TYPES,
+    workers: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_resources=None,
+) -> int:
+    """
+    Build the mirror database at `output` from bulk-export NDJSON.
+
+    Args:
+        inputs: NDJSON files or directories containing them
+        output: Database path, replaced atomically when ingestion succeeds
+        resource_types: Resource types to keep
+        workers: Process pool size (default: CPU count)
+        batch_size: Lines per work item
+        on_resources: Optional callback receiving each batch of parsed resources, in order
+
+    Returns:
+        int: Number of resources ingested
+    """
+    paths = find_ndjson(inputs)
+    if not paths:
+        raise FileNotFoundError(f"No NDJSON files found in {inputs}")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    count = 0
+    with atomic_path(output) as tmp_path:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Bulk-load settings: the file is discarded on failure anyway
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            create_schema(conn)
+
+            def drain(future):
+                rows, resources, batch_count = future.result()
+                insert_rows(conn, rows)
+                if on_resources:
+                    on_resources(resources)
+                return batch_count
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = []
+                for batch in iter_batches(paths, batch_size):
+                    pending.append(pool.submit(index_lines, batch, tuple(resource_types), on_resources is not None))
+                    if len(pending) >= max_in_flight:
+                        count += drain(pending.pop(0))
+                for future in pending:
+                    count += drain(future)
+
+            create_indexes(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a FHIR bulk export into the local mirror.")
+    parser.add_argument("--input", nargs="+", required=True, help="NDJSON files or export directories")
+    parser.add_argument("--output", type=str, default="med_data/fhir-mirror.db", help="Mirror database to write")
+    parser.add_argument("--resource-types", nargs="+", default=list(DEFAULT_RESOURCE_TYPES), help="Resource types to keep")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Lines per work item")
+    parser.add_argument("--features", type=str, default=None, help="Also build the patient feature store at this path")
+    args = parser.parse_args()
+
+    store = None
+    if args.features:
+        from features import FeatureStore
+        store = FeatureStore()
+
+    start = time.perf_counter()
+    count = ingest(
+        args.input,
+        args.output,
+        tuple(args.resource_types),
+        args.workers,
+        args.batch_size,
+        on_resources=store.update_many if store else None,
+    )
+    print(f"Ingested {count} resources into {args.output} in {time.perf_counter() - start:.1f}s")
+    if store:
+        store.save(args.features)
+        print(f"Wrote features for {len(store)} patients to {args.features}")
+
+
+if __name__ == '__main__':
+    main()
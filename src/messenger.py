@@ -1,14 +1,19 @@
+import asyncio
 import json
+import os
+import time
+from dataclasses import dataclass
 from uuid import uuid4
 
 import httpx
 from a2a.client import (
-    A2ACardResolver,
+    Client,
     ClientConfig,
     ClientFactory,
     Consumer,
 )
 from a2a.types import (
+    AgentCard,
     Message,
     Part,
     Role,
@@ -17,7 +22,12 @@ from a2a.types import (
 )
 
 
+from a2a.utils.constants import AGENT_CARD_WELL_KNOWN_PATH
+
+
 DEFAULT_TIMEOUT = 300
+# Seconds a fetched agent card is trusted before it is revalidated (If-None-Match)
+CARD_TTL = float(os.getenv("A2A_CARD_TTL", "300"))
 
 
 def create_message(
@@ -42,59 +52,136 @@ def merge_parts(parts: list[Part]) -> str:
     return "\n".join(chunks)
 
 
-async def send_message(
-    message: str,
-    base_url: str,
-    context_id: str | None = None,
-    streaming: bool = False,
-    timeout: int = DEFAULT_TIMEOUT,
-    consumer: Consumer | None = None,
-):
-    """Returns dict with context_id, response and status (if exists)"""
-    async with httpx.AsyncClient(timeout=timeout) as httpx_client:
-        resolver = A2ACardResolver(httpx_client=httpx_client, base_url=base_url)
-        agent_card = await resolver.get_agent_card()
-        config = ClientConfig(
-            httpx_client=httpx_client,
-            streaming=streaming,
-        )
-        factory = ClientFactory(config)
-        client = factory.create(agent_card)
-        if consumer:
-            await client.add_event_consumer(consumer)
-
-        outbound_msg = create_message(text=message, context_id=context_id)
-        last_event = None
-        outputs = {"response": "", "context_id": None}
-
-        # if streaming == False, only one event is generated
-        async for event in client.send_message(outbound_msg):
-            last_event = event
-
-        match last_event:
-            case Message() as msg:
-                outputs["context_id"] = msg.context_id
+def collect_outputs(last_event) -> dict:
+    """Response text, context_id and (for tasks) status from the last event of an exchange."""
+    outputs = {"response": "", "context_id": None}
+    match last_event:
+        case Message() as msg:
+            outputs["context_id"] = msg.context_id
+            outputs["response"] += merge_parts(msg.parts)
+
+        case (task, update):
+            outputs["context_id"] = task.context_id
+            outputs["status"] = task.status.state.value
+            msg = task.status.message
+            if msg:
                 outputs["response"] += merge_parts(msg.parts)
+            if task.artifacts:
+                for artifact in task.artifacts:
+                    outputs["response"] += merge_parts(artifact.parts)
+
+        case _:
+            pass
+
+    return outputs
 
-            case (task, update):
-                outputs["context_id"] = task.context_id
-                outputs["status"] = task.status.state.value
-                msg = task.status.message
-                if msg:
-                    outputs["response"] += merge_parts(msg.parts)
-                if task.artifacts:
-                    for artifact in task.artifacts:
-                        outputs["response"] += merge_parts(artifact.parts)
 
-            case _:
-                pass
+@dataclass
+class FanOutResult:
+    url: str
+    response: str | None = None
+    error: str | None = None
+    elapsed: float = 0.0
 
-        return outputs
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CachedCard:
+    card: AgentCard
+    etag: str | None
+    expires_at: float
 
 
 class Messenger:
-    def __init__(self):
+    """
+    Talks to other A2A agents over one pooled HTTP client.
+
+    Agent cards are cached per URL for `card_ttl` seconds and then revalidated
+    with If-None-Match, so an unchanged card costs a 304 rather than a full
+    fetch. A2A clients are built once per (URL, streaming) and reused until the
+    card changes.
+    """
+
+    def __init__(self, card_ttl: float = CARD_TTL):
         self._context_ids = {}
+        self.card_ttl = card_ttl
+        self._http: httpx.AsyncClient | None = None
+        self._cards: dict[str, CachedCard] = {}
+        self._clients: dict[tuple[str, bool], Client] = {}
+        self.in_flight = 0
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT)
+        return self._http
+
+    async def get_agent_card(self, url: str) -> AgentCard:
+        """The agent card for `url`, from cache while fresh, revalidated with its ETag after that."""
+        cached = self._cards.get(url)
+        if cached and time.monotonic() < cached.expires_at:
+            return cached.card
+
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+        response = await self._http_client().get(f"{url.rstrip('/')}{AGENT_CARD_WELL_KNOWN_PATH}", headers=headers)
+        if cached and response.status_code == 304:
+            cached.expires_at = time.monotonic() + self.card_ttl
+            return cached.card
+
+        response.raise_for_status()
+        card = AgentCard.model_validate(response.json())
+        if cached is None or card != cached.card:
+            # Clients were built from the old card (transport, URL); rebuild on next use
+            for key in [key for key in self._clients if key[0] == url]:
+                del self._clients[key]
+        self._cards[url] = CachedCard(card, response.headers.get("etag"), time.monotonic() + self.card_ttl)
+        return card
+
+    async def get_client(self, url: str, streaming: bool = False) -> Client:
+        card = await self.get_agent_card(url)
+        client = self._clients.get((url, streaming))
+        if client is None:
+            config = ClientConfig(httpx_client=self._http_client(), streaming=streaming)
+            client = self._clients[(url, streaming)] = ClientFactory(config).create(card)
+        return client
+
+    async def send_message(
+        self,
+        message: str,
+        base_url: str,
+        context_id: str | None = None,
+        streaming: bool = False,
+        timeout: int = DEFAULT_TIMEOUT,
+        consumer: Consumer | None = None,
+    ) -> dict:
+        """Returns dict with context_id, response and status (if exists)"""
+        self.in_flight += 1
+        try:
+            return await self._send_message(message, base_url, context_id, streaming, timeout, consumer)
+        finally:
+            self.in_flight -= 1
+
+    async def _send_message(self, message, base_url, context_id, streaming, timeout, consumer) -> dict:
+        async with asyncio.timeout(timeout):
+            if consumer:
+                # Consumers stay attached to a client, so this one is not shared
+                card = await self.get_agent_card(base_url)
+                config = ClientConfig(httpx_client=self._http_client(), streaming=streaming)
+                client = ClientFactory(config).create(card)
+                await client.add_event_consumer(consumer)
+            else:
+                client = await self.get_client(base_url, streaming)
+
+            outbound_msg = create_message(text=message, context_id=context_id)
+            last_event = None
+
+            # if streaming == False, only one event is generated
+            async for event in client.send_message(outbound_msg):
+                last_event = event
+
+        return collect_outputs(last_event)
 
     async def talk_to_agent(
         self,
@@ -115,7 +202,7 @@ class Messenger:
         Returns:
             str: The agent's response message
         """
-        outputs = await send_message(
+        outputs = await self.send_message(
             message=message,
             base_url=url,
             context_id=None if new_conversation else self._context_ids.get(url, None),
@@ -126,5 +213,87 @@ class Messenger:
         self._context_ids[url] = outputs.get("context_id", None)
         return outputs["response"]
 
+    async def _talk_timed(self, message: str, url: str, new_conversation: bool, timeout: float) -> FanOutResult:
+        start = time.perf_counter()
+        try:
+            response = await self.talk_to_agent(message, url, new_conversation=new_conversation, timeout=timeout)
+            return FanOutResult(url, response=response, elapsed=time.perf_counter() - start)
+        except TimeoutError:
+            return FanOutResult(url, error=f"Timed out after {timeout}s", elapsed=time.perf_counter() - start)
+        except Exception as e:
+            return FanOutResult(url, error=str(e) or type(e).__name__, elapsed=time.perf_counter() - start)
+
+    async def fan_out(
+        self,
+        message: str,
+        urls: list[str],
+        new_conversation: bool = False,
+        timeout: float | dict[str, float] = DEFAULT_TIMEOUT,
+        quorum: int | None = None,
+    ):
+        """
+        Send `message` to several agents concurrently and yield a FanOutResult for each as it arrives.
+
+        Args:
+            message: The message to send to every agent
+            urls: The agents' URL endpoints (duplicates are sent once)
+            new_conversation: If True, start fresh conversations; otherwise continue each URL's conversation
+            timeout: Seconds per agent, or a {url: seconds} mapping (missing URLs use the default)
+            quorum: Stop after this many successful responses and cancel the rest
+                (e.g. 1 for a hedged request to replicated agents)
+
+        Failures and timeouts are yielded as results with `error` set; they never
+        abort the other requests. Context ids are tracked per URL as in talk_to_agent.
+        """
+        urls = list(dict.fromkeys(urls))
+        timeouts = timeout if isinstance(timeout, dict) else {}
+        default_timeout = DEFAULT_TIMEOUT if isinstance(timeout, dict) else timeout
+        tasks = [
+            asyncio.create_task(self._talk_timed(message, url, new_conversation, timeouts.get(url, default_timeout)))
+            for url in urls
+        ]
+        successes = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield result
+                if result.ok:
+                    successes += 1
+                    if quorum is not None and successes >= quorum:
+                        return
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def consult(self, message: str, urls: list[str], **kwargs) -> list[FanOutResult]:
+        """Collect fan_out results (in arrival order); accepts the same keyword arguments."""
+        return [result async for result in self.fan_out(message, urls, **kwargs)]
+
     def reset(self):
         self._context_ids = {}
+
+    async def aclose(self):
+        """Close the pooled HTTP client and forget cached cards and clients."""
+        self._clients.clear()
+        self._cards.clear()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+_DEFAULT_MESSENGER: Messenger | None = None
+
+
+async def send_message(
+    message: str,
+    base_url: str,
+    context_id: str | None = None,
+    streaming: bool = False,
+    timeout: int = DEFAULT_TIMEOUT,
+    consumer: Consumer | None = None,
+):
+    """Returns dict with context_id, response and status (if exists). Uses a process-wide Messenger."""
+    global _DEFAULT_MESSENGER
+    if _DEFAULT_MESSENGER is None:
+        _DEFAULT_MESSENGER = Messenger()
+    return await _DEFAULT_MESSENGER.send_message(message, base_url, context_id, streaming, timeout, consumer)
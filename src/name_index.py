@@ -0,0 +1,174 @@
+"""
+Fuzzy, indexed patient name matching.
+
+Names are normalized (accents folded, punctuation dropped, lowercased) and
+split into tokens. Common nicknames are mapped to a canonical given name. Each
+token is indexed three ways:
+
+    exact      canonical token               "katherine"
+    phonetic   Soundex-style key             "K365"
+    trigram    padded character trigrams     "  k", " ka", "kat", ...
+
+Lookups are blocked by birth date first, so only the handful of patients born
+that day are scored, however large the index grows. Without a birth date,
+candidates come from the postings of the query's phonetic keys (then
+trigrams), never from a full scan. Each query token must match some token of
+the candidate's name. An exact or nickname match scores 1.0, a phonetic match
+0.85, and a trigram match its Jaccard similarity (counted only above
+TRIGRAM_THRESHOLD). Short fragments therefore no longer match longer names
+("Al" does not match "Alvarez").
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+NICKNAMES = {
+    "abby": "abigail", "al": "albert", "alex": "alexander", "andy": "andrew", "bill": "william",
+    "billy": "william", "bob": "robert", "bobby": "robert", "cathy": "catherine", "chris": "christopher",
+    "dan": "daniel", "danny": "daniel", "dave": "david", "deb": "debra", "debbie": "debra",
+    "dick": "richard", "ed": "edward", "eddie": "edward", "jim": "james", "jimmy": "james",
+    "joe": "joseph", "john": "john", "johnny": "john", "jon": "jonathan", "josh": "joshua",
+    "kate": "katherine", "kathy": "katherine", "katie": "katherine", "ken": "kenneth", "kim": "kimberly",
+    "larry": "lawrence", "liz": "elizabeth", "maggie": "margaret", "matt": "matthew", "meg": "margaret",
+    "mike": "michael", "nick": "nicholas", "pam": "pamela", "pat": "patricia", "peggy": "margaret",
+    "pete": "peter", "rob": "robert", "ron": "ronald", "sam": "samuel", "steve": "steven",
+    "sue": "susan", "ted": "edward", "tim": "timothy", "tom": "thomas", "tony": "anthony",
+    "vicky": "victoria", "will": "william",
+}
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+EXACT_SCORE = 1.0
+PHONETIC_SCORE = 0.85
+TRIGRAM_THRESHOLD = 0.5
+MIN_SCORE = 0.5
+
+NON_LETTERS = re.compile(r"[^a-z\s]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase ASCII letters and single spaces: accents folded, hyphens split, apostrophes dropped."""
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    folded = folded.replace("'", "").replace("-", " ")
+    return " ".join(NON_LETTERS.sub(" ", folded).split())
+
+
+def tokens(name: str) -> list[str]:
+    return normalize(name).split()
+
+
+def canonical(token: str) -> str:
+    return NICKNAMES.get(token, token)
+
+
+def phonetic_key(token: str) -> str:
+    """American Soundex: first letter plus three digits."""
+    if not token:
+        return ""
+    key = token[0].upper()
+    previous = SOUNDEX_CODES.get(token[0], "")
+    for char in token[1:]:
+        code = SOUNDEX_CODES.get(char, "")
+        if code and code != previous:
+            key += code
+            if len(key) == 4:
+                break
+        # 'h' and 'w' do not separate letters with the same code; vowels do
+        if char not in "hw":
+            previous = code
+    return key.ljust(4, "0")
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def token_score(query: str, candidate: str) -> float:
+    if canonical(query) == canonical(candidate):
+        return EXACT_SCORE
+    if phonetic_key(query) == phonetic_key(candidate):
+        return PHONETIC_SCORE
+    a, b = trigrams(query), trigrams(candidate)
+    similarity = len(a & b) / len(a | b)
+    return similarity if similarity >= TRIGRAM_THRESHOLD else 0.0
+
+
+def name_score(query_tokens: list[str], candidate_tokens: list[str]) -> float:
+    """Mean best-match score of the query tokens; 0 if any query token matches nothing."""
+    if not query_tokens or not candidate_tokens:
+        return 0.0
+    scores = [max(token_score(q, c) for c in candidate_tokens) for q in query_tokens]
+    return 0.0 if min(scores) == 0.0 else sum(scores) / len(scores)
+
+
+def resource_names(resource: dict) -> list[str]:
+    """Every given and family name of a Patient resource, as text."""
+    names = []
+    for human_name in resource.get("name", []):
+        names.extend(human_name.get("given", []))
+        if human_name.get("family"):
+            names.append(human_name["family"])
+    return names
+
+
+class NameIndex:
+    """In-memory index of patients by birth date, name token, phonetic key and trigram."""
+
+    def __init__(self):
+        self._tokens: list[list[str]] = []
+        self._payloads: list = []
+        self._by_dob: dict[str, list[int]] = defaultdict(list)
+        self._by_phonetic: dict[str, set[int]] = defaultdict(set)
+        self._by_trigram: dict[str, set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def add(self, names: list[str], birth_date: str | None, payload) -> None:
+        position = len(self._payloads)
+        name_tokens = [t for name in names for t in tokens(name)]
+        self._tokens.append(name_tokens)
+        self._payloads.append(payload)
+        if birth_date:
+            self._by_dob[birth_date[:10]].append(position)
+        for token in name_tokens:
+            self._by_phonetic[phonetic_key(canonical(token))].add(position)
+            self._by_phonetic[phonetic_key(token)].add(position)
+            for gram in trigrams(token):
+                self._by_trigram[gram].add(position)
+
+    def add_patient(self, resource: dict, payload=None) -> None:
+        self.add(resource_names(resource), resource.get("birthDate"), resource if payload is None else payload)
+
+    def _candidates(self, query_tokens: list[str], birth_date: str | None) -> set[int]:
+        if birth_date:
+            return set(self._by_dob.get(birth_date[:10], ()))
+        candidates: set[int] = set()
+        for token in query_tokens:
+            candidates |= self._by_phonetic.get(phonetic_key(canonical(token)), set())
+            candidates |= self._by_phonetic.get(phonetic_key(token), set())
+        if not candidates:
+            for token in query_tokens:
+                for gram in trigrams(token):
+                    candidates |= self._by_trigram.get(gram, set())
+        return candidates
+
+    def search(self, name: str, birth_date: str | None = None, limit: int = 5, min_score: float = MIN_SCORE) -> list[tuple[float, object]]:
+        """Best matches as (score, payload), highest first."""
+        query_tokens = tokens(name)
+        scored = []
+        for position in self._candidates(query_tokens, birth_date):
+            score = name_score(query_tokens, self._tokens[position])
+            if score >= min_score:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(score, self._payloads[position]) for score, position in scored[:limit]]
+
+    def best(self, name: str, birth_date: str | None = None, min_score: float = MIN_SCORE):
+        """The single best match's payload, or None."""
+        matches = self.search(name, birth_date, limit=1, min_score=min_score)
+        return matches[0][1] if matches else None
@@ -0,0 +1,176 @@
+"""
+Prompt assembly ordered for provider-side prefix (KV) caching.
+
+Providers such as DeepSeek, Nebius and OpenRouter reuse the KV cache of a
+previously seen prompt prefix. The prefix only matches if it is byte-for-byte
+identical, so everything that varies per request (system_context, FHIR URL,
+pre-fetched data) must come after everything that does not:
+
+    1. SYSTEM_PREAMBLE   - fixed system message
+    2. FHIR_TOOLS        - frozen tool schema (built once at import; read-only
+                           tasks get FHIR_READ_TOOLS)
+    3. conversation history
+    4. task context      - system_context, FHIR server, pre-fetch notice
+    5. the question      - instruction plus any pre-fetched data
+"""
+
+SYSTEM_PREAMBLE = (
+    "You are a helpful medical AI assistant. You are participating in a medical benchmark. "
+    "Answer questions accurately and concisely.\n\n"
+    "Each request starts with a [TASK CONTEXT] block describing the current context and, "
+    "when available, the FHIR server. If relevant FHIR data has been pre-fetched it is "
+    "provided after the question; use that context to answer directly. Otherwise, when asked "
+    "to retrieve patient information, ALWAYS use the `search_fhir` tool. Do not hallucinate data. "
+    "When a task asks you to record new data, submit the resource with the `create_fhir_resource` tool."
+)
+
+SEARCH_FHIR_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "search_fhir",
+        "description": "Search for resources on the FHIR server.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "resource_type": {
+                    "type": "string",
+                    "description": "The type of FHIR resource to search for (e.g., 'Patient', 'Observation', 'Condition')."
+                },
+                "params": {
+                    "type": "object",
+                    "description": "Key-value pairs for search parameters (e.g., {'name': 'John', 'birthdate': '1980-01-01'})."
+                }
+            },
+            "required": ["resource_type", "params"]
+        }
+    }
+}
+
+CREATE_FHIR_RESOURCE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "create_fhir_resource",
+        "description": "Create (POST) a resource on the FHIR server. Safe to retry: duplicates are not created.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "resource_type": {
+                    "type": "string",
+                    "description": "The type of FHIR resource to create (e.g., 'Observation')."
+                },
+                "resource": {
+                    "type": "object",
+                    "description": "The complete FHIR resource as JSON, including 'resourceType'."
+                }
+            },
+            "required": ["resource_type", "resource"]
+        }
+    }
+}
+
+# Never mutate: the serialized schema is part of the cached prefix.
+# Writes are only offered to tasks that record data.
+FHIR_READ_TOOLS = (SEARCH_FHIR_TOOL,)
+FHIR_TOOLS = (SEARCH_FHIR_TOOL, CREATE_FHIR_RESOURCE_TOOL)
+
+# Model families on OpenRouter that honour explicit `cache_control` breakpoints.
+# DeepSeek/Nebius cache prefixes automatically and need no hints.
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+# Running totals, reported in the logs so cache hit rates can be checked.
+CACHE_STATS = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+
+def supports_cache_control(provider: str | None, model: str | None) -> bool:
+    return provider == "openrouter" and bool(model) and model.startswith(CACHE_CONTROL_MODEL_PREFIXES)
+
+
+def build_system_message(cache_hints: bool = False) -> dict:
+    if cache_hints:
+        return {
+            "role": "system",
+            "content": [
+                {"type": "text", "text": SYSTEM_PREAMBLE, "cache_control": {"type": "ephemeral"}}
+            ],
+        }
+    return {"role": "system", "content": SYSTEM_PREAMBLE}
+
+
+def build_task_context(system_context: str | None, fhir_base_url: str | None, is_pre_fetched: bool) -> str:
+    lines = ["[TASK CONTEXT]"]
+    if system_context:
+        lines.append(f"Current Context: {system_context}")
+    if fhir_base_url:
+        lines.append(f"FHIR server: {fhir_base_url}")
+        if is_pre_fetched:
+            lines.append("Relevant FHIR data has been pre-fetched and provided below.")
+    return "\n".join(lines)
+
+
+def build_messages(
+    instruction: str,
+    history: list[dict] | None = None,
+    system_context: str | None = None,
+    fhir_base_url: str | None = None,
+    is_pre_fetched: bool = False,
+    heuristic_context: str = "",
+    cache_hints: bool = False,
+    answer_format: str = "",
+) -> list[dict]:
+    """
+    Build the chat messages, static content first and per-request content last.
+
+    Args:
+        instruction: The question being asked
+        history: Prior conversation turns as chat messages
+        system_context: Per-request context supplied by the Green agent
+        fhir_base_url: FHIR server for this request, if any
+        is_pre_fetched: Whether FHIR data has been injected into the question
+        heuristic_context: Pre-fetched data appended after the question
+        cache_hints: Emit `cache_control` on the static preamble
+        answer_format: Answer-format instruction appended last
+    """
+    messages = [build_system_message(cache_hints)]
+    messages.extend(history or [])
+    task_context = build_task_context(system_context, fhir_base_url, is_pre_fetched)
+    messages.append({"role": "user", "content": f"{task_context}\n\n{instruction}{heuristic_context}{answer_format}"})
+    return messages
+
+
+def build_tools(enabled: bool, write: bool = False) -> list[dict] | None:
+    if not enabled:
+        return None
+    return list(FHIR_TOOLS if write else FHIR_READ_TOOLS)
+
+
+def cached_tokens(usage) -> int:
+    """Cached prompt tokens from an OpenAI-compatible usage block (0 if unknown)."""
+    if usage is None:
+        return 0
+    # OpenAI / OpenRouter style
+    details = getattr(usage, "prompt_tokens_details", None)
+    value = getattr(details, "cached_tokens", None) if details is not None else None
+    if isinstance(value, int):
+        return value
+    # DeepSeek style
+    value = getattr(usage, "prompt_cache_hit_tokens", None)
+    if isinstance(value, int):
+        return value
+    return 0
+
+
+def record_usage(usage) -> int:
+    """Accumulate prompt-cache statistics for a completion and log them."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    if not isinstance(prompt_tokens, int):
+        return 0
+    hit = cached_tokens(usage)
+    CACHE_STATS["requests"] += 1
+    CACHE_STATS["prompt_tokens"] += prompt_tokens
+    CACHE_STATS["cached_tokens"] += hit
+    print(
+        f"[PURPLE] Prompt cache: {hit}/{prompt_tokens} prompt tokens cached "
+        f"(total {CACHE_STATS['cached_tokens']}/{CACHE_STATS['prompt_tokens']})",
+        flush=True,
+    )
+    return hit
@@ -0,0 +1,168 @@
+"""
+Cost-aware scheduling of LLM completions.
+
+The provider slots (LLM_MAX_CONCURRENCY) are shared by every task. Each
+completion is given an expected cost from its task's `parse_instruction`
+classification and the size of its prompt:
+
+    cost = TASK_COSTS[task type] + prompt tokens / PROMPT_TOKENS_PER_COST
+
+Cheap completions (cost <= FAST_LANE_MAX_COST: Task 1 lookups, precomputed
+Task 2 answers, ...) queue in the "fast" lane and the rest in the "slow" lane.
+When a slot frees, lanes with waiters are served by stride scheduling in
+proportion to their weights (FAST_LANE_WEIGHT : SLOW_LANE_WEIGHT). A long
+task therefore always gets its share and is never starved. The slow lane may
+hold at most all but FAST_LANE_RESERVED_SLOTS slots, so a cheap lookup never
+waits behind long reasoning tasks that fill every slot. Within a lane,
+completions run in arrival order.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+FAST_LANE_MAX_COST = float(os.getenv("FAST_LANE_MAX_COST", "2.5"))
+FAST_LANE_WEIGHT = float(os.getenv("FAST_LANE_WEIGHT", "3"))
+SLOW_LANE_WEIGHT = float(os.getenv("SLOW_LANE_WEIGHT", "1"))
+FAST_LANE_RESERVED_SLOTS = int(os.getenv("FAST_LANE_RESERVED_SLOTS", "1"))
+
+# Expected cost by `parse_instruction` type; None is an open-ended question
+TASK_COSTS = {
+    "search_patient": 1.0,
+    "get_patient_age": 1.0,
+    "record_vitals": 2.0,
+    None: 4.0,
+}
+PROMPT_TOKENS_PER_COST = 4000
+CHARS_PER_TOKEN = 4
+
+
+def prompt_chars(messages: list) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            total += sum(len(block.get("text", "")) for block in content if isinstance(block, dict))
+    return total
+
+
+def estimate_cost(task_type: str | None, messages: list) -> float:
+    base = TASK_COSTS.get(task_type, TASK_COSTS[None])
+    return base + prompt_chars(messages) / CHARS_PER_TOKEN / PROMPT_TOKENS_PER_COST
+
+
+class Lane:
+    def __init__(self, name: str, weight: float, max_active: int):
+        self.name = name
+        self.weight = weight
+        self.max_active = max_active
+        self.waiters: deque[asyncio.Future] = deque()
+        self.active = 0
+        self.pass_value = 0.0
+        self.granted = 0
+        self.wait_total = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "granted": self.granted,
+            "mean_wait_ms": round(self.wait_total / self.granted * 1000, 1) if self.granted else 0.0,
+        }
+
+
+class LLMScheduler:
+    """
+    Args:
+        slots: Completions in flight at once, across all tasks
+        fast_max_cost: Highest cost served by the fast lane
+        weights: (fast, slow) share of slots when both lanes are waiting
+        reserved: Slots the slow lane may never take
+    """
+
+    def __init__(
+        self,
+        slots: int = LLM_MAX_CONCURRENCY,
+        fast_max_cost: float = FAST_LANE_MAX_COST,
+        weights: tuple[float, float] = (FAST_LANE_WEIGHT, SLOW_LANE_WEIGHT),
+        reserved: int = FAST_LANE_RESERVED_SLOTS,
+    ):
+        self.slots = slots
+        self.fast_max_cost = fast_max_cost
+        # With a single slot nothing can be reserved, or slow tasks would never run
+        slow_slots = max(1, slots - reserved) if slots > 1 else slots
+        self.lanes = {
+            "fast": Lane("fast", weights[0], slots),
+            "slow": Lane("slow", weights[1], slow_slots),
+        }
+        self.active = 0
+        self.virtual_time = 0.0
+
+    def lane_for(self, cost: float) -> Lane:
+        return self.lanes["fast" if cost <= self.fast_max_cost else "slow"]
+
+    def _can_run(self, lane: Lane) -> bool:
+        return self.active < self.slots and lane.active < lane.max_active
+
+    def _grant(self, lane: Lane) -> None:
+        self.active += 1
+        lane.active += 1
+        lane.granted += 1
+        self.virtual_time = lane.pass_value
+        lane.pass_value += 1 / lane.weight
+
+    def _dispatch(self) -> None:
+        while True:
+            ready = [lane for lane in self.lanes.values() if lane.waiters and self._can_run(lane)]
+            if not ready:
+                return
+            lane = min(ready, key=lambda l: (l.pass_value, -l.weight))
+            waiter = lane.waiters.popleft()
+            if waiter.done():
+                continue  # cancelled while queued
+            self._grant(lane)
+            waiter.set_result(None)
+
+    def _release(self, lane: Lane) -> None:
+        self.active -= 1
+        lane.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, cost: float):
+        """Hold one LLM slot, queued in the lane for `cost`."""
+        lane = self.lane_for(cost)
+        queued_at = time.perf_counter()
+        if not lane.waiters and not lane.active:
+            # An idle lane does not bank credit for the time it was idle
+            lane.pass_value = max(lane.pass_value, self.virtual_time)
+        if not lane.waiters and self._can_run(lane):
+            self._grant(lane)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            lane.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(lane)  # granted, but cancelled before it could be used
+                raise
+        lane.wait_total += time.perf_counter() - queued_at
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "free": self.slots - self.active,
+            **{name: lane.stats() for name, lane in self.lanes.items()},
+        }
+
+
+LLM_SCHEDULER = LLMScheduler()
@@ -1,7 +1,9 @@
 import argparse
+from contextlib import asynccontextmanager
+
 import uvicorn
+from starlette.middleware import Middleware
 
-from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
 from a2a.server.tasks import InMemoryTaskStore
 from a2a.types import (
@@ -10,7 +12,22 @@ from a2a.types import (
     AgentSkill,
 )
 
+from compression import A2AApplication, CompressionMiddleware
 from executor import Executor
+from fhir_cache import FHIR_CACHE
+from health import HealthMonitor
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Runs before uvicorn starts accepting connections, so nothing is served cold;
+    # /readyz stays 503 until it has finished
+    health = app.state.health
+    health.loop_lag.start()
+    await health.warm_up()
+    yield
+    await health.loop_lag.stop()
+    await FHIR_CACHE.aclose()
 
 
 def main():
@@ -30,6 +47,19 @@ def main():
         tags=["medical", "qa"],
         examples=["What are symptoms of flu?"]
     )
+    batch_skill = AgentSkill(
+        id="medical-qa-batch",
+        name="Batch Medical Question Answering",
+        description=(
+            "Answers many benchmark tasks in one request. Send a JSON array of task payloads, "
+            'or {"tasks": [...], "stream": true} to receive one artifact per task as it completes'
+        ),
+        tags=["medical", "qa", "batch"],
+        examples=[
+            '{"tasks": [{"id": "task1_1", "instruction": "...", "fhir_base_url": "...", "system_context": "..."}], '
+            '"stream": false}'
+        ]
+    )
 
     agent_card = AgentCard(
         name="Purple Agent",
@@ -39,18 +69,22 @@ def main():
         default_input_modes=['text'],
         default_output_modes=['text'],
         capabilities=AgentCapabilities(streaming=False),
-        skills=[skill]
+        skills=[skill, batch_skill]
     )
 
+    executor = Executor()
+    health = HealthMonitor(executor)
     request_handler = DefaultRequestHandler(
-        agent_executor=Executor(),
+        agent_executor=executor,
         task_store=InMemoryTaskStore(),
     )
-    server = A2AStarletteApplication(
+    server = A2AApplication(
         agent_card=agent_card,
         http_handler=request_handler,
     )
-    uvicorn.run(server.build(), host=args.host, port=args.port)
+    app = server.build(lifespan=lifespan, routes=health.routes(), middleware=[Middleware(CompressionMiddleware)])
+    app.state.health = health
+    uvicorn.run(app, host=args.host, port=args.port)
 
 
 if __name__ == '__main__':
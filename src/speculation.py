@@ -0,0 +1,107 @@
+"""
+Speculative FHIR prefetch for instructions the heuristics cannot classify.
+
+When `parse_instruction` returns None the LLM decides which FHIR query to run,
+which costs a full FHIR round-trip after the first completion. We guess the
+likely reads from identifiers in the instruction, start them concurrently with
+that completion, and hand the in-flight result to any matching tool call.
+"""
+import asyncio
+import re
+
+MRN_PATTERN = re.compile(r"\b(S\d{5,})\b")
+NAME_DOB_PATTERN = re.compile(
+    r"\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b[^\n]{0,40}?(\d{4}-\d{2}-\d{2})"
+)
+
+# Search parameters the LLM may use interchangeably for the same read.
+PARAM_ALIASES = {
+    ("Patient", "identifier"): "_id",
+}
+
+# Leading words that are capitalized but not part of a name.
+NAME_STOPWORDS = {"what", "whats", "find", "patient", "the", "name", "mrn", "dob", "for", "of", "with"}
+
+
+def extract_candidates(text: str) -> list[tuple[str, dict]]:
+    """
+    Guess the FHIR reads an instruction is likely to need.
+
+    Returns:
+        list of (resource_type, params) tuples, without duplicates
+    """
+    candidates = []
+    for mrn in MRN_PATTERN.findall(text):
+        candidates.append(("Patient", {"_id": mrn}))
+
+    for name, dob in NAME_DOB_PATTERN.findall(text):
+        parts = [p for p in name.split() if p.lower() not in NAME_STOPWORDS]
+        if not parts:
+            continue
+        candidates.append(("Patient", {"name": parts if len(parts) > 1 else parts[0], "birthdate": dob}))
+
+    unique = []
+    seen = set()
+    for resource_type, params in candidates:
+        key = request_key(resource_type, params)
+        if key not in seen:
+            seen.add(key)
+            unique.append((resource_type, params))
+    return unique
+
+
+def _normalize_value(key: str, value) -> tuple:
+    if isinstance(value, (list, tuple)):
+        tokens = [str(v) for v in value]
+    else:
+        tokens = [str(value)]
+    if key == "name":
+        tokens = [t for token in tokens for t in token.split()]
+    return tuple(sorted(t.strip().lower() for t in tokens))
+
+
+def request_key(resource_type: str, params: dict | None) -> tuple:
+    """Canonical form of a search so equivalent tool calls compare equal."""
+    items = []
+    for key, value in (params or {}).items():
+        key = PARAM_ALIASES.get((resource_type, key), key)
+        items.append((key, _normalize_value(key, value)))
+    return (resource_type, tuple(sorted(items)))
+
+
+class SpeculativePrefetcher:
+    def __init__(self, fetch, base_url: str):
+        """
+        Args:
+            fetch: Coroutine function with the signature of `search_fhir`
+            base_url: FHIR server the speculative reads are sent to
+        """
+        self._fetch = fetch
+        self._base_url = base_url
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+
+    def start(self, instruction: str) -> int:
+        """Launch speculative reads for the instruction. Returns how many were started."""
+        for resource_type, params in extract_candidates(instruction):
+            key = request_key(resource_type, params)
+            if key not in self._inflight:
+                self._inflight[key] = asyncio.create_task(
+                    self._fetch(self._base_url, resource_type, params)
+                )
+        return len(self._inflight)
+
+    async def resolve(self, resource_type: str, params: dict) -> str:
+        """Return the speculated result for this search, or fetch it now."""
+        task = self._inflight.pop(request_key(resource_type, params), None)
+        if task is not None:
+            self.hits += 1
+            print(f"[PURPLE] Speculative prefetch hit: {resource_type} {params}", flush=True)
+            return await task
+        return await self._fetch(self._base_url, resource_type, params)
+
+    def cancel(self) -> None:
+        """Abandon speculative reads nobody asked for."""
+        for task in self._inflight.values():
+            task.cancel()
+        self._inflight.clear()
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import json
 import os # Added os
@@ -150,6 +151,9 @@ async def test_agent_run_heuristic_task2_age():
             call_kwargs = agent.client.chat.completions.create.call_args.kwargs
             user_msg = call_kwargs["messages"][1]["content"]
             assert "CONTEXT FROM FHIR (Pre-fetched)" in user_msg
+
+            # Verify the age was computed deterministically from the fetched birth date
+            assert "[PATIENT FACTS (precomputed)]" in user_msg
             
             # Verify tools skipped (Task 2 optimization)
             assert call_kwargs["tools"] is None or len(call_kwargs["tools"]) == 0
@@ -189,6 +193,11 @@ async def test_agent_run_heuristic_task3_vitals():
             assert "tools" in call_kwargs
             assert len(call_kwargs["tools"]) > 0
 
+            # Verify a validated Observation was prepared for the POST
+            user_msg = call_kwargs["messages"][1]["content"]
+            assert "[PREPARED OBSERVATION (validated)]" in user_msg
+            assert '"valueString": "118/77 mmHg"' in user_msg
+
 @pytest.mark.asyncio
 async def test_agent_run_no_heuristic_match():
     # Setup Agent
@@ -296,3 +305,288 @@ async def test_agent_run_cache_priority():
                 user_msg = call_kwargs["messages"][1]["content"]
                 assert "[CONTEXT FROM CACHE]:" in user_msg
                 assert '"id": "S1"' in user_msg
+
+@pytest.mark.asyncio
+async def test_agent_run_speculative_prefetch():
+    # Free-form instruction: no heuristic match, but the MRN is speculated
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        agent.client = AsyncMock()
+
+        tool_call = MagicMock(id="call-1")
+        tool_call.function.name = "search_fhir"
+        tool_call.function.arguments = json.dumps({"resource_type": "Patient", "params": {"identifier": "S6534835"}})
+        first = MagicMock()
+        first.choices = [MagicMock(message=MagicMock(content=None, tool_calls=[tool_call]))]
+        second = MagicMock()
+        second.choices = [MagicMock(message=MagicMock(content="Peter Stafford", tool_calls=None))]
+        agent.client.chat.completions.create.side_effect = [first, second]
+
+        with patch("agent.search_fhir", new_callable=AsyncMock) as mock_search_fhir:
+            mock_search_fhir.return_value = json.dumps({"resourceType": "Bundle", "entry": [{"resource": {"id": "S6534835"}}]})
+
+            payload = {
+                "instruction": "Summarize the demographics of patient S6534835",
+                "fhir_base_url": "http://mock-fhir"
+            }
+            message = Message(
+                kind="message", role=Role.user,
+                parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id="msg-spec"
+            )
+            updater = MockTaskUpdater()
+
+            await agent.run(message, updater)
+
+            # Only the speculative read hit the server; the tool call reused it
+            mock_search_fhir.assert_called_once_with("http://mock-fhir", "Patient", {"_id": "S6534835"})
+            tool_messages = [m for m in agent.client.chat.completions.create.call_args.kwargs["messages"] if isinstance(m, dict) and m.get("role") == "tool"]
+            assert "S6534835" in tool_messages[0]["content"]
+            assert updater.artifacts[0][0][0].root.text == "Peter Stafford"
+            # The completion after a tool call is never forced into JSON mode
+            assert "response_format" not in agent.client.chat.completions.create.call_args.kwargs
+
+@pytest.mark.asyncio
+async def test_agent_run_task2_uses_precomputed_features():
+    from features import FeatureStore
+    store = FeatureStore()
+    store.update({"resourceType": "Patient", "id": "S2874099", "birthDate": "1963-01-29"})
+
+    # A non-reasoning model, so the answer is enforced with JSON mode
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key", "NEBIUS_MODEL_NAME": "meta-llama/Llama-3.3-70B-Instruct"}):
+        agent = Agent()
+        agent.client = AsyncMock()
+        mock_completion = MagicMock()
+        mock_completion.choices = [MagicMock(message=MagicMock(content='Thinking it over.\n{"answer": 60}', tool_calls=None))]
+        agent.client.chat.completions.create.return_value = mock_completion
+
+        with patch("agent.get_feature_store", return_value=store), \
+             patch("agent.search_fhir", new_callable=AsyncMock) as mock_search_fhir:
+            payload = {
+                "instruction": "What's the age of the patient with MRN of S2874099?",
+                "fhir_base_url": "http://mock-fhir",
+                "system_context": "It's 2023-11-13T10:15:00+00:00 now"
+            }
+            message = Message(
+                kind="message", role=Role.user,
+                parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id="msg-features"
+            )
+            updater = MockTaskUpdater()
+            await agent.run(message, updater)
+
+            # No FHIR round-trip; a few facts instead of the raw resource
+            mock_search_fhir.assert_not_called()
+            user_msg = agent.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+            assert "[PATIENT FACTS (precomputed)]" in user_msg
+            assert "Age as of 2023-11-13: 60 years" in user_msg
+
+            # Structured answer: JSON mode on Nebius, compact value in the artifact
+            call_kwargs = agent.client.chat.completions.create.call_args.kwargs
+            assert call_kwargs["response_format"] == {"type": "json_object"}
+            assert "[ANSWER FORMAT]" in user_msg
+            assert updater.artifacts[0][0][0].root.text == "60"
+
+@pytest.mark.asyncio
+async def test_agent_run_batch():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        agent.client = AsyncMock()
+
+        async def create(**kwargs):
+            content = kwargs["messages"][1]["content"]
+            answer = "first" if "first question" in content else "second"
+            return MagicMock(choices=[MagicMock(message=MagicMock(content=answer, tool_calls=None))], usage=None)
+
+        agent.client.chat.completions.create.side_effect = create
+
+        with patch("agent.search_fhir", new_callable=AsyncMock):
+            payload = {"tasks": [
+                {"id": "t1", "instruction": "Answer the first question"},
+                {"id": "t2", "instruction": "Answer the second question"},
+                "not a task",
+            ]}
+            message = Message(
+                kind="message", role=Role.user,
+                parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id="msg-batch"
+            )
+            updater = MockTaskUpdater()
+            await agent.run(message, updater)
+
+            # One aggregated artifact, results in submission order
+            assert len(updater.artifacts) == 1
+            parts, name = updater.artifacts[0]
+            assert name == "BatchResponse"
+            results = parts[0].root.data["results"]
+            assert [r["id"] for r in results] == ["t1", "t2", None]
+            assert [r["response"] for r in results[:2]] == ["first", "second"]
+            assert results[2]["response"].startswith("Error:")
+
+            # Streaming: one artifact per item
+            payload["stream"] = True
+            message.parts = [Part(root=TextPart(text=json.dumps(payload)))]
+            updater = MockTaskUpdater()
+            await agent.run(message, updater)
+            assert sorted(name for _, name in updater.artifacts) == ["Response[0]", "Response[1]", "Response[2]"]
+
+
+@pytest.mark.asyncio
+async def test_agent_run_batch_cancels_items():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        started, cancelled = [], []
+
+        async def answer(instruction, *args, **kwargs):
+            started.append(instruction)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(instruction)
+                raise
+
+        agent.answer = answer
+        payload = [{"instruction": f"q{i}"} for i in range(3)]
+        message = Message(
+            kind="message", role=Role.user,
+            parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id="msg-batch-cancel"
+        )
+        run = asyncio.create_task(agent.run(message, MockTaskUpdater()))
+        while len(started) < 3:
+            await asyncio.sleep(0)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+        assert sorted(cancelled) == ["q0", "q1", "q2"]
+
+
+@pytest.mark.asyncio
+async def test_agent_run_batch_keeps_finished_results_when_cancelled():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        answered = asyncio.Event()
+
+        async def answer(instruction, *args, **kwargs):
+            if instruction == "q0":
+                answered.set()
+                return "done"
+            await asyncio.sleep(10)
+
+        agent.answer = answer
+        payload = [{"instruction": f"q{i}"} for i in range(3)]
+        message = Message(
+            kind="message", role=Role.user,
+            parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id="msg-batch-partial"
+        )
+        updater = MockTaskUpdater()
+        run = asyncio.create_task(agent.run(message, updater))
+        await answered.wait()
+        await asyncio.sleep(0)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+        (parts, name), = updater.artifacts
+        assert name == "BatchResponse"
+        assert parts[0].root.data == {"results": [{"index": 0, "id": None, "response": "done"}], "unfinished": [1, 2]}
+
+@pytest.mark.asyncio
+async def test_agent_repeat_lookup_injects_the_remembered_reference():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        agent.client = AsyncMock()
+        reply = MagicMock()
+        reply.choices = [MagicMock(message=MagicMock(content="S6530532", tool_calls=None))]
+        agent.client.chat.completions.create.return_value = reply
+
+        patient = {"resourceType": "Patient", "id": "S6530532", "birthDate": "1954-08-10"}
+        with patch("agent.search_fhir", new_callable=AsyncMock) as mock_search_fhir, \
+             patch("agent.search_local_cache", return_value=None), \
+             patch("agent.get_mirror", return_value=None), \
+             patch("agent.get_feature_store") as mock_store:
+            mock_search_fhir.return_value = json.dumps({"resourceType": "Bundle", "entry": [{"resource": patient}]})
+            mock_store.return_value.facts.return_value = None
+
+            for message_id in ("msg-1", "msg-2"):
+                payload = {"instruction": "Find MRN for Brian Buchanan (DOB: 1954-08-10)", "fhir_base_url": "http://mock-fhir"}
+                message = Message(kind="message", role=Role.user, parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id=message_id)
+                await agent.run(message, MockTaskUpdater())
+
+        mock_search_fhir.assert_awaited_once()
+        prompt = str(agent.client.chat.completions.create.call_args.kwargs["messages"])
+        assert "Patient/S6530532" in prompt
+        assert "CONTEXT FROM FHIR" not in prompt
+
+
+@pytest.mark.asyncio
+async def test_agent_follow_up_reuses_conversation_memory():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        agent = Agent()
+        agent.client = AsyncMock()
+        first = MagicMock()
+        first.choices = [MagicMock(message=MagicMock(content="S6530532", tool_calls=None))]
+        tool_call = MagicMock(id="call-1")
+        tool_call.function.name = "search_fhir"
+        tool_call.function.arguments = json.dumps({"resource_type": "Patient", "params": {"_id": "S6530532"}})
+        second = MagicMock()
+        second.choices = [MagicMock(message=MagicMock(content=None, tool_calls=[tool_call]))]
+        third = MagicMock()
+        third.choices = [MagicMock(message=MagicMock(content="1954-08-10", tool_calls=None))]
+        agent.client.chat.completions.create.side_effect = [first, second, third]
+
+        patient = {"resourceType": "Patient", "id": "S6530532", "birthDate": "1954-08-10"}
+        with patch("agent.search_fhir", new_callable=AsyncMock) as mock_search_fhir, \
+             patch("agent.search_local_cache", return_value=None), \
+             patch("agent.get_feature_store") as mock_store:
+            mock_search_fhir.return_value = json.dumps({"resourceType": "Bundle", "entry": [{"resource": patient}]})
+            mock_store.return_value.facts.return_value = None
+
+            def message(instruction, message_id):
+                payload = {"instruction": instruction, "fhir_base_url": "http://mock-fhir"}
+                return Message(kind="message", role=Role.user, parts=[Part(root=TextPart(text=json.dumps(payload)))], message_id=message_id)
+
+            await agent.run(message("Find MRN for Brian Buchanan (DOB: 1954-08-10)", "msg-1"), MockTaskUpdater())
+            updater = MockTaskUpdater()
+            await agent.run(message("And what is their birth date?", "msg-2"), updater)
+
+        # The follow-up's read of the patient was answered from memory
+        mock_search_fhir.assert_called_once()
+        messages = agent.client.chat.completions.create.call_args.kwargs["messages"]
+        assert {"role": "assistant", "content": "S6530532"} in messages
+        assert any("[CONVERSATION MEMORY]" in str(m.get("content")) for m in messages if isinstance(m, dict))
+        tool_messages = [m for m in messages if isinstance(m, dict) and m.get("role") == "tool"]
+        assert "1954-08-10" in tool_messages[0]["content"]
+        assert updater.artifacts[0][0][0].root.text == "1954-08-10"
+        assert agent.memory.current_patient == "S6530532"
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_the_llm_pool_without_failing():
+    from agent import warm_up
+    client = MagicMock()
+    client.with_options.return_value.models.list = AsyncMock(side_effect=RuntimeError("unreachable"))
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("agent.get_llm_client", return_value=client):
+        await warm_up()
+    client.with_options.return_value.models.list.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_reads_provider_config_without_building_an_agent():
+    from agent import llm_config, warm_up
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), \
+         patch("agent.get_llm_client", return_value=MagicMock()) as get_client, \
+         patch("agent.open_llm_pool", AsyncMock()), \
+         patch("agent.Agent", side_effect=AssertionError("no Agent during warm-up")):
+        await warm_up()
+        assert llm_config().provider == "nebius"
+    get_client.assert_called_once_with("mock_key", "https://api.studio.nebius.ai/v1/")
+
+
+def test_contexts_share_one_batch_queue(tmp_path):
+    from agent import Agent
+    env = {"NEBIUS_API_KEY": "mock_key", "LLM_BATCH_MODE": "local", "LLM_BATCH_DIR": str(tmp_path)}
+    with patch.dict("os.environ", env), patch.dict("agent._BATCH_COMPLETIONS", clear=True), \
+         patch("agent.get_llm_client", return_value=MagicMock()):
+        first, second = Agent(), Agent()
+    assert first.batch is not None and first.batch is second.batch
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key", "LLM_BATCH_MODE": ""}):
+        assert Agent().batch is None
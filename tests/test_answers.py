@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+from answers import extract_answer, format_instruction, response_format, structured_output_mode
+
+
+def test_structured_output_mode_per_provider():
+    with patch.dict("os.environ", {}, clear=True):
+        assert structured_output_mode("openrouter", "google/gemini-2.0-flash-exp:free") == "json_schema"
+        assert structured_output_mode("openrouter", "deepseek/deepseek-v3.2") == "prompt"
+        assert structured_output_mode("nebius", "meta-llama/Llama-3.3-70B-Instruct") == "json_object"
+        # Reasoning models are asked in the prompt only, never forced into JSON mode
+        assert structured_output_mode("nebius", "deepseek-ai/DeepSeek-R1-0528") == "prompt"
+        assert structured_output_mode("openrouter", "openai/o3-reasoning") == "prompt"
+    with patch.dict("os.environ", {"LLM_STRUCTURED_OUTPUT": "off"}):
+        assert structured_output_mode("nebius", "deepseek-ai/DeepSeek-R1-0528") == "off"
+
+
+def test_response_format_and_instruction():
+    fmt = response_format("get_patient_age", "json_schema")
+    schema = fmt["json_schema"]["schema"]
+    assert fmt["json_schema"]["strict"] is True
+    assert schema["properties"]["answer"]["type"] == "integer"
+    assert schema["required"] == ["answer"]
+    assert response_format("get_patient_age", "json_object") == {"type": "json_object"}
+    assert response_format(None, "prompt") is None
+    assert '{"answer": <integer' in format_instruction("get_patient_age", "prompt")
+    assert format_instruction(None, "off") == ""
+
+
+def test_extract_answer():
+    # JSON object: bare, fenced, or after a preamble
+    assert extract_answer('{"answer": "S6534835"}', "search_patient") == "S6534835"
+    assert extract_answer('```json\n{"answer": 60}\n```', "get_patient_age") == "60"
+    assert extract_answer('Let me compute... 2023 - 1963.\n{"answer": "60 years"}', "get_patient_age") == "60"
+    # Free text fallbacks for lookup tasks
+    assert extract_answer("The patient's MRN is S6534835.", "search_patient") == "S6534835"
+    assert extract_answer("No matching record; patient not found.", "search_patient") == "Patient not found"
+    assert extract_answer("The patient is 60 years old as of 2023-11-13.", "get_patient_age") == "60"
+    # Invalid or unstructured answers are returned unchanged
+    assert extract_answer('{"answer": "unknown"}', "search_patient") == '{"answer": "unknown"}'
+    assert extract_answer("Peter Stafford", None) == "Peter Stafford"
+    assert extract_answer('{"answer": "Recorded BP 118/77 mmHg"}', "record_vitals") == "Recorded BP 118/77 mmHg"
+    assert extract_answer(None, None) is None
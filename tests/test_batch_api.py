@@ -0,0 +1,100 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from openai.types.chat import ChatCompletionMessage
+
+from batch_api import (
+    BatchCompletions,
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    batch_line,
+    read_results,
+    request_body,
+    to_jsonable,
+)
+
+
+def completion(content, tool_calls=None):
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+    }
+
+
+def test_to_jsonable_drops_none_and_dumps_models():
+    message = ChatCompletionMessage(role="assistant", content="hi")
+    body = to_jsonable({"model": "m", "messages": [message], "tools": None})
+    assert body == {"model": "m", "messages": [{"role": "assistant", "content": "hi"}]}
+    json.dumps(batch_line("req-0", body))
+    # Provider extensions are sent inline, as the SDK does with extra_body
+    assert request_body({"model": "m", "extra_body": {"reasoning": {"effort": "low"}}}) == {
+        "model": "m", "reasoning": {"effort": "low"}
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_completions_collects_concurrent_requests(tmp_path):
+    backend = LocalBatchBackend(lambda body: completion(body["messages"][-1]["content"].upper()))
+    batch = BatchCompletions(backend, work_dir=str(tmp_path), linger=0.01)
+
+    results = await asyncio.gather(*(
+        batch.create(model="m", messages=[{"role": "user", "content": text}], tools=None)
+        for text in ("a", "b", "c")
+    ))
+
+    assert [r.choices[0].message.content for r in results] == ["A", "B", "C"]
+    # One batch file with three lines in the provider's request format
+    assert len(backend.submitted) == 1
+    assert [line["url"] for line in backend.submitted[0]] == ["/v1/chat/completions"] * 3
+    assert "tools" not in backend.submitted[0][0]["body"]
+
+    # A follow-up round (e.g. after tool calls) forms the next batch
+    await batch.create(model="m", messages=[{"role": "user", "content": "d"}])
+    assert len(backend.submitted) == 2
+    # Batch input files are removed once their results are read
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_batch_completions_maps_failures_to_their_request(tmp_path):
+    def respond(body):
+        if body["messages"][0]["content"] == "bad":
+            raise ValueError("rejected")
+        return completion("ok")
+
+    batch = BatchCompletions(LocalBatchBackend(respond), work_dir=str(tmp_path), linger=0.01)
+    good, bad = await asyncio.gather(
+        batch.create(model="m", messages=[{"role": "user", "content": "good"}]),
+        batch.create(model="m", messages=[{"role": "user", "content": "bad"}]),
+        return_exceptions=True,
+    )
+    assert good.choices[0].message.content == "ok"
+    assert isinstance(bad, RuntimeError) and "rejected" in str(bad)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_openai_backend_submits_and_polls(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text(json.dumps(batch_line("req-0", {"model": "m"})) + "\n")
+    output = json.dumps({"custom_id": "req-0", "response": {"status_code": 200, "body": completion("x")}, "error": None})
+
+    client = SimpleNamespace(files=AsyncMock(), batches=AsyncMock())
+    client.files.create.return_value = SimpleNamespace(id="file-in")
+    client.batches.create.return_value = SimpleNamespace(id="batch-1", status="validating", request_counts=None)
+    client.batches.retrieve.return_value = SimpleNamespace(
+        id="batch-1", status="completed", request_counts=None, output_file_id="file-out", error_file_id=None
+    )
+    client.files.content.return_value = SimpleNamespace(text=output)
+
+    text = await OpenAIBatchBackend(client, poll_interval=0).run(str(path))
+
+    assert client.batches.create.call_args.kwargs["endpoint"] == "/v1/chat/completions"
+    client.files.content.assert_awaited_once_with("file-out")
+    assert read_results(text)["req-0"]["response"]["body"]["choices"][0]["message"]["content"] == "x"
@@ -0,0 +1,110 @@
+import json
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from a2a.server.request_handlers import DefaultRequestHandler
+from a2a.server.tasks import InMemoryTaskStore
+from a2a.types import AgentCapabilities, AgentCard, Artifact, Part, Task, TaskState, TaskStatus, TextPart
+
+from compression import A2AApplication, CompressionMiddleware, brotli, choose_encoding, dumps
+
+BIG = {"entry": [{"resourceType": "Observation", "id": f"obs-{i}", "value": i} for i in range(200)]}
+
+
+def build_app() -> Starlette:
+    async def stream(request):
+        async def events():
+            yield "data: 1\n\n"
+            yield "data: 2\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(
+        routes=[
+            Route("/big", lambda request: JSONResponse(BIG)),
+            Route("/small", lambda request: PlainTextResponse("ok")),
+            Route("/stream", stream),
+        ],
+        middleware=[Middleware(CompressionMiddleware, minimum_size=1024)],
+    )
+
+
+async def get(path: str, accept_encoding: str) -> httpx.Response:
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("gzip, br") == ("br" if brotli else "gzip")
+    assert choose_encoding("br;q=0, *") == "gzip"
+
+
+def test_dumps_is_compact():
+    assert dumps({"a": [1, "é"]}) == '{"a":[1,"é"]}'.encode()
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_compressed():
+    response = await get("/big", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(json.dumps(BIG)) / 4
+    assert response.json() == BIG  # httpx decodes gzip transparently
+
+
+@pytest.mark.asyncio
+async def test_small_and_streamed_responses_pass_through():
+    small = await get("/small", "gzip")
+    assert "content-encoding" not in small.headers and small.text == "ok"
+
+    stream = await get("/stream", "gzip")
+    assert "content-encoding" not in stream.headers
+    assert stream.text == "data: 1\n\ndata: 2\n\n"
+
+    plain = await get("/big", "identity")
+    assert "content-encoding" not in plain.headers and plain.json() == BIG
+
+
+@pytest.mark.skipif(brotli is None, reason="brotli is not installed")
+@pytest.mark.asyncio
+async def test_brotli_preferred_when_accepted():
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip, br"}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+    assert response.headers["content-encoding"] == "br"
+    assert json.loads(brotli.decompress(raw)) == BIG
+
+
+@pytest.mark.asyncio
+async def test_a2a_task_responses_are_encoded_and_compressed():
+    store = InMemoryTaskStore()
+    text = json.dumps(BIG)
+    await store.save(Task(
+        id="task-1", context_id="ctx-1", status=TaskStatus(state=TaskState.completed),
+        artifacts=[Artifact(artifact_id="a-1", name="Response", parts=[Part(root=TextPart(text=text))])],
+    ))
+    card = AgentCard(
+        name="Purple Agent", description="test", url="http://test/", version="1.0.0",
+        default_input_modes=["text"], default_output_modes=["text"], capabilities=AgentCapabilities(), skills=[],
+    )
+    app = A2AApplication(agent_card=card, http_handler=DefaultRequestHandler(agent_executor=MagicMock(), task_store=store))
+    app = app.build(middleware=[Middleware(CompressionMiddleware)])
+
+    request = {"jsonrpc": "2.0", "id": "1", "method": "tasks/get", "params": {"id": "task-1"}}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/", json=request, headers={"Accept-Encoding": "gzip"})
+        missing = await client.post("/", json={**request, "params": {"id": "nope"}}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["result"]["artifacts"][0]["parts"][0]["text"] == text
+    assert missing.json()["error"]["code"] == -32001
@@ -0,0 +1,57 @@
+import json
+
+from context_memory import ContextMemory, result_resources
+
+
+def bundle(*resources):
+    return json.dumps({"resourceType": "Bundle", "entry": [{"resource": r} for r in resources]})
+
+
+PATIENT = {"resourceType": "Patient", "id": "S6530532", "meta": {"versionId": "2"}}
+POTASSIUM = {"resourceType": "Observation", "id": "obs-1", "subject": {"reference": "Patient/S6530532"}}
+
+
+def test_result_resources():
+    assert result_resources(bundle(PATIENT, {"id": "no-type"})) == [PATIENT]
+    assert result_resources(json.dumps(PATIENT)) == [PATIENT]
+    assert result_resources("Error querying FHIR server: 500") == []
+
+
+def test_searches_replay_and_reads_by_id_come_from_resources():
+    memory = ContextMemory()
+    memory.remember("Patient", {"name": ["Brian", "Buchanan"], "birthdate": "1954-08-10"}, bundle(PATIENT))
+    memory.remember_patient("Brian Buchanan", "1954-08-10", "S6530532")
+
+    # Equivalent search (order and case of name tokens do not matter)
+    assert memory.lookup("Patient", {"birthdate": "1954-08-10", "name": ["buchanan", "brian"]}) == bundle(PATIENT)
+    # A read by id served from the remembered resource
+    assert json.loads(memory.lookup("Patient", {"identifier": "S6530532"}))["entry"][0]["resource"] == PATIENT
+    assert memory.lookup("Observation", {"patient": "S6530532"}) is None
+    assert memory.resolve_patient("brian  BUCHANAN", "1954-08-10") == "S6530532"
+    assert memory.hits == 2
+
+    # Errors are never remembered
+    memory.remember("Observation", {"patient": "S1"}, "Error querying FHIR server: timeout")
+    assert memory.lookup("Observation", {"patient": "S1"}) is None
+
+
+def test_memory_is_bounded_and_invalidated_by_writes():
+    memory = ContextMemory(max_resources=2, max_search_bytes=250)
+    for i in range(3):
+        memory.remember("Observation", {"patient": f"S{i}"}, bundle({"resourceType": "Observation", "id": f"obs-{i}"}))
+    assert list(memory.resources) == [("Observation", "obs-1"), ("Observation", "obs-2")]
+    assert memory.search_bytes <= 250
+    assert memory.lookup("Observation", {"patient": "S0"}) is None
+
+    memory.invalidate("Observation")
+    assert not memory.searches and memory.search_bytes == 0
+
+
+def test_references_name_what_is_known():
+    memory = ContextMemory()
+    assert memory.references() == ""
+    memory.remember("Patient", {"_id": "S6530532"}, bundle(PATIENT))
+    memory.remember("Observation", {"patient": "S6530532"}, bundle(POTASSIUM))
+    references = memory.references()
+    assert "Current patient: Patient/S6530532" in references
+    assert "Observation/obs-1, Patient/S6530532 (v2)" in references
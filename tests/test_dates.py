@@ -0,0 +1,53 @@
+import numpy as np
+
+from dates import PatientIndex, age_on, ages, elapsed
+
+
+def test_ages_vectorized():
+    result = ages(["1954-08-10", "1963-01-29", None, "2000-02-29"], "2023-11-13T10:15:00+00:00")
+    assert result[0] == 69
+    assert result[1] == 60
+    assert np.isnan(result[2])
+    assert result[3] == 23
+
+    # Birthday boundaries, including leap-day birthdays in non-leap years
+    assert age_on("1954-08-10", "2023-08-09") == 68
+    assert age_on("1954-08-10", "2023-08-10") == 69
+    assert age_on("2000-02-29", "2023-02-28") == 22
+    assert age_on("2000-02-29", "2023-03-01") == 23
+    assert age_on("1930-12-31", "2023-01-01") == 92
+
+
+def test_ages_per_patient_reference_dates():
+    result = ages(["1950-06-15", "1950-06-15"], ["2020-06-14", "2020-06-15"])
+    assert list(result) == [69, 70]
+
+
+def test_elapsed_normalizes_offsets():
+    result = elapsed(["2023-11-13T08:15:00+00:00", "2023-11-13T03:15:00-05:00", None], "2023-11-13T10:15:00Z", unit="h")
+    assert list(result[:2]) == [2.0, 2.0]
+    assert np.isnan(result[2])
+
+
+
+def test_partial_and_malformed_dates():
+    # FHIR allows year and year-month precision; they start the period
+    assert list(ages(["1954", "1954-08", "not-a-date"], "2023-11-13")[:2]) == [69, 69]
+    assert np.isnan(ages(["not-a-date"], "2023-11-13")[0])
+    result = elapsed(["2023", "2023-11", "garbage", "2023-11-13"], "2023-11-13T00:00:00Z", unit="D")
+    assert list(result[[0, 1, 3]]) == [316.0, 12.0, 0.0]
+    assert np.isnan(result[2])
+
+
+def test_patient_index_from_features():
+    index = PatientIndex.from_features({
+        "S1": {"birthDate": "1954-08-10", "last_bp": {"time": "2023-11-12T10:15:00+00:00"},
+               "latest_labs": {"MG": {"time": "2023-11-13T09:15:00+00:00"}}},
+        "S2": {"birthDate": "1963-01-29", "latest_labs": {}},
+    })
+    now = "2023-11-13T10:15:00+00:00"
+    assert list(index.ages(now)) == [69, 60]
+    assert index.since_last_bp(now)[0] == 24
+    assert np.isnan(index.since_last_bp(now)[1])
+    assert index.since_latest_lab("MG", now, unit="m")[0] == 60
+    assert index.position("S2") == 1
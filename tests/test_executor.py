@@ -0,0 +1,192 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from a2a.server.agent_execution import RequestContext
+from a2a.server.events import EventQueue
+from a2a.types import Message, MessageSendParams, Part, Role, TaskArtifactUpdateEvent, TaskState, TaskStatusUpdateEvent, TextPart
+
+from executor import Executor
+
+
+def make_context(text="hello"):
+    message = Message(kind="message", role=Role.user, parts=[Part(root=TextPart(text=text))], message_id="msg-1")
+    return RequestContext(request=MessageSendParams(message=message))
+
+
+async def final_state(queue: EventQueue) -> TaskState:
+    state = None
+    while not queue.queue.empty():
+        event = await queue.dequeue_event(no_wait=True)
+        if isinstance(event, TaskStatusUpdateEvent):
+            state = event.status.state
+    return state
+
+
+async def artifact_texts(queue: EventQueue) -> list[str]:
+    texts = []
+    while not queue.queue.empty():
+        event = await queue.dequeue_event(no_wait=True)
+        if isinstance(event, TaskArtifactUpdateEvent):
+            texts.append(event.artifact.parts[0].root.text)
+    return texts
+
+
+@pytest.mark.asyncio
+async def test_execute_cancels_task_past_deadline():
+    aborted = asyncio.Event()
+
+    async def hang(self, message, updater, task=None):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            aborted.set()
+            raise
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("executor.Agent.run", hang):
+        executor = Executor(deadline=0.05)
+        queue = EventQueue()
+        await executor.execute(make_context(), queue)
+
+    # In-flight work was aborted and the task ends as canceled
+    assert aborted.is_set()
+    assert await final_state(queue) == TaskState.canceled
+    assert executor.running == {}
+
+
+@pytest.mark.asyncio
+async def test_batch_payloads_get_the_batch_deadline():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key", "LLM_BATCH_MODE": ""}):
+        executor = Executor(deadline=0.05, batch_deadline=None)
+        agent = executor.get_agent("ctx")
+        assert executor.deadline_for(agent, make_context().message) == 0.05
+        batch = make_context('{"tasks": [{"instruction": "q0"}]}').message
+        assert executor.deadline_for(agent, batch) is None
+
+        # Completions queued for a provider batch may take hours, whatever the message
+        agent.batch = object()
+        assert executor.deadline_for(agent, make_context().message) is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_aborts_running_task():
+    started = asyncio.Event()
+
+    async def hang(self, message, updater, task=None):
+        started.set()
+        await asyncio.sleep(10)
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("executor.Agent.run", hang):
+        executor = Executor(deadline=None)
+        queue = EventQueue()
+        context = make_context()
+        execution = asyncio.create_task(executor.execute(context, queue))
+        await started.wait()
+
+        (task_id, run), = executor.running.items()
+        cancel_queue = EventQueue()
+        await executor.cancel(RequestContext(task_id=task_id, context_id=context.context_id), cancel_queue)
+        await execution
+
+    assert run.cancelled()
+    assert await final_state(cancel_queue) == TaskState.canceled
+    assert await final_state(queue) == TaskState.canceled
+
+
+def test_agents_are_evicted_least_recently_used_first():
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}):
+        executor = Executor(max_contexts=2)
+        first = executor.get_agent("ctx-1")
+        executor.get_agent("ctx-2")
+        assert executor.get_agent("ctx-1") is first
+        executor.get_agent("ctx-3")
+        assert list(executor.agents) == ["ctx-1", "ctx-3"]
+
+
+@pytest.mark.asyncio
+async def test_evicted_agent_is_closed_once_its_task_ends():
+    release = asyncio.Event()
+
+    async def answer(self, message, updater, task=None):
+        await release.wait()
+        return "done"
+
+    def context(context_id, message_id):
+        message = Message(kind="message", role=Role.user, parts=[Part(root=TextPart(text=message_id))],
+                          message_id=message_id, context_id=context_id)
+        return RequestContext(request=MessageSendParams(message=message))
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("executor.Agent.run", answer):
+        executor = Executor(deadline=None, max_contexts=1)
+        busy = executor.get_agent("ctx-busy")
+        busy.messenger.aclose = AsyncMock()
+        running = asyncio.create_task(executor.execute(context("ctx-busy", "m-1"), EventQueue()))
+        await asyncio.sleep(0.01)
+
+        # Evicted while its task runs: the memory is dropped, the agent stays open
+        release.set()
+        idle = executor.get_agent("ctx-idle")
+        assert list(executor.agents) == ["ctx-idle"]
+        assert executor.evicted == [busy]
+        busy.messenger.aclose.assert_not_awaited()
+
+        # Closed as soon as the task ends
+        await running
+        busy.messenger.aclose.assert_awaited_once()
+        assert executor.evicted == [] and not executor.in_use
+
+        # An idle agent is closed on the next eviction
+        idle.messenger.aclose = AsyncMock()
+        await executor.execute(context("ctx-new", "m-2"), EventQueue())
+        idle.messenger.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_retried_message_replays_the_original_result():
+    calls = []
+    release = asyncio.Event()
+
+    async def answer(self, message, updater, task=None):
+        calls.append(message.message_id)
+        await release.wait()
+        await updater.add_artifact(parts=[Part(root=TextPart(text="S6530532"))], name="Response")
+        return "S6530532"
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("executor.Agent.run", answer):
+        executor = Executor(deadline=None)
+        queues = [EventQueue() for _ in range(3)]
+        # A retry while the original is still running attaches to it
+        original = asyncio.create_task(executor.execute(make_context(), queues[0]))
+        retry = asyncio.create_task(executor.execute(make_context(), queues[1]))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(original, retry)
+        # A retry after completion replays the stored result
+        await executor.execute(make_context(), queues[2])
+        # Same message_id with different content is a different request
+        await executor.execute(make_context("something else"), EventQueue())
+
+    assert calls == ["msg-1", "msg-1"]
+    assert [await artifact_texts(q) for q in queues] == [["S6530532"]] * 3
+    assert executor.dedup.stats() == {"running": 0, "completed": 2, "replayed": 2}
+
+
+@pytest.mark.asyncio
+async def test_failed_message_is_not_replayed():
+    outcomes = iter([RuntimeError("LLM down"), "ok"])
+
+    async def flaky(self, message, updater, task=None):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        await updater.add_artifact(parts=[Part(root=TextPart(text=outcome))], name="Response")
+        return outcome
+
+    with patch.dict("os.environ", {"NEBIUS_API_KEY": "mock_key"}), patch("executor.Agent.run", flaky):
+        executor = Executor(deadline=None)
+        first, retry = EventQueue(), EventQueue()
+        await executor.execute(make_context(), first)
+        await executor.execute(make_context(), retry)
+
+    assert await final_state(first) == TaskState.failed
+    assert await artifact_texts(retry) == ["ok"]
@@ -0,0 +1,67 @@
+import json
+
+from features import FeatureStore, age_on
+
+
+def test_features_fold_newest_values():
+    store = FeatureStore()
+    store.update({"resourceType": "Patient", "id": "S1", "birthDate": "1954-08-10",
+                  "name": [{"given": ["Brian"], "family": "Buchanan"}]})
+    for time, value in (("2023-11-12T08:00:00+00:00", 1.8), ("2023-11-10T08:00:00+00:00", 2.5)):
+        store.update({"resourceType": "Observation", "subject": {"reference": "Patient/S1"}, "status": "final",
+                      "code": {"coding": [{"code": "MG"}]}, "effectiveDateTime": time,
+                      "valueQuantity": {"value": value, "unit": "mg/dL"}})
+    store.update({"resourceType": "Observation", "subject": {"reference": "Patient/S1"}, "status": "final",
+                  "code": {"text": "BP"}, "effectiveDateTime": "2023-11-13T10:15:00+00:00", "valueString": "118/77 mmHg"})
+    store.update({"resourceType": "MedicationRequest", "id": "m1", "status": "active", "subject": {"reference": "Patient/S1"},
+                  "medicationCodeableConcept": {"text": "Lisinopril 10 mg"}})
+
+    features = store.get("S1")
+    assert features["latest_labs"]["MG"] == {"value": 1.8, "unit": "mg/dL", "time": "2023-11-12T08:00:00+00:00"}
+    assert features["last_bp"]["value"] == "118/77 mmHg"
+
+    facts = store.facts("S1", "2023-11-13T10:15:00+00:00")
+    assert "Age as of 2023-11-13: 69 years" in facts
+    assert "Latest MG: 1.8 mg/dL" in facts
+    assert "Active medications: Lisinopril 10 mg" in facts
+    assert store.facts("S2") is None
+
+    # Stopped medications drop out
+    store.update({"resourceType": "MedicationRequest", "id": "m1", "status": "stopped", "subject": {"reference": "Patient/S1"}})
+    assert store.get("S1")["active_medications"] == {}
+
+
+def test_update_from_result_and_persistence(tmp_path):
+    store = FeatureStore()
+    store.update_from_result(json.dumps({"resourceType": "Bundle", "entry": [
+        {"resource": {"resourceType": "Patient", "id": "S2", "birthDate": "2000-02-29"}}
+    ]}))
+    store.update_from_result("Error querying FHIR server: timeout")
+
+    path = str(tmp_path / "features.json")
+    store.save(path)
+    assert FeatureStore.load(path).get("S2")["birthDate"] == "2000-02-29"
+
+
+def test_age_on_birthday_boundary():
+    assert age_on("1954-08-10", "2023-08-09") == 68
+    assert age_on("1954-08-10", "2023-08-10T00:00:00+00:00") == 69
+
+
+def test_unparseable_birth_date_has_no_age():
+    assert age_on("not-a-date", "2023-11-13") is None
+    store = FeatureStore({"S1": {"birthDate": "not-a-date", "latest_labs": {}, "active_medications": {}}})
+    assert store.age("S1", "2023-11-13") is None
+    assert "Age" not in store.facts("S1", "2023-11-13T10:15:00+00:00")
+
+
+def test_cohort_for_selected_patients():
+    store = FeatureStore({
+        "S1": {"birthDate": "1954-08-10", "last_bp": {"time": "2023-11-12T10:15:00+00:00"}, "latest_labs": {}},
+        "S2": {"birthDate": "1963-01-29", "latest_labs": {}},
+    })
+    now = "2023-11-13T10:15:00+00:00"
+    assert list(store.cohort().ages(now)) == [69, 60]
+    cohort = store.cohort(["S2", "S1"])
+    assert list(cohort.ages(now)) == [60, 69]
+    assert cohort.since_last_bp(now)[1] == 24
@@ -0,0 +1,96 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from agent import search_fhir
+from fhir_cache import FHIR_CACHE, FhirCache
+from fhir_write import build_bp_observation, post_fhir
+
+PATIENT = {"resourceType": "Patient", "id": "S1", "meta": {"versionId": "2"}}
+
+
+def bundle(*resources):
+    return json.dumps({"resourceType": "Bundle", "entry": [{"resource": r} for r in resources]})
+
+
+def mock_http(mock_client_cls, status_code=200, body=None, etag=None):
+    client = AsyncMock()
+    mock_client_cls.return_value.__aenter__.return_value = client
+    response = MagicMock(status_code=status_code, headers={"ETag": etag} if etag else {})
+    response.json.return_value = body
+    client.get.return_value = response
+    client.post.return_value = response
+    return client
+
+
+@pytest.mark.asyncio
+async def test_reads_by_id_revalidate_with_version_etag():
+    client = mock_http(MagicMock(), status_code=304)
+    client.is_closed = False
+    # Revalidations share one pooled client
+    cache = FhirCache(ttl=60, client=client)
+    cache.put("http://fhir/", "Patient", {"_id": "S1"}, bundle(PATIENT))
+    assert cache.get("http://fhir", "Patient", {"_id": "S1"}).etag == 'W/"2"'
+
+    # Fresh: no request at all
+    assert await cache.lookup("http://fhir", "Patient", {"_id": "S1"}) == bundle(PATIENT)
+    client.get.assert_not_called()
+
+    # Stale: conditional read of the resource, kept on 304
+    cache.ttl = 0
+    assert await cache.lookup("http://fhir", "Patient", {"_id": "S1"}) == bundle(PATIENT)
+    client.get.assert_called_once_with("http://fhir/Patient/S1", params=None, headers={"If-None-Match": 'W/"2"'}, timeout=5.0)
+
+    # Changed on the server
+    client.get.return_value = MagicMock(status_code=200)
+    assert await cache.lookup("http://fhir", "Patient", {"_id": "S1"}) is None
+    assert cache.stats == {"hits": 2, "revalidated": 1, "misses": 1, "invalidated": 0}
+
+
+@pytest.mark.asyncio
+async def test_revalidations_reuse_one_client():
+    cache = FhirCache(ttl=0)
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        mock_client_cls.return_value = AsyncMock(is_closed=False)
+        mock_client_cls.return_value.get.return_value = MagicMock(status_code=304)
+        cache.put("http://fhir", "Patient", {"_id": "S1"}, bundle(PATIENT))
+        for _ in range(3):
+            assert await cache.lookup("http://fhir", "Patient", {"_id": "S1"}) is not None
+    assert mock_client_cls.call_count == 1
+    await cache.aclose()
+    mock_client_cls.return_value.aclose.assert_awaited_once()
+
+
+def test_writes_invalidate_dependent_searches():
+    cache = FhirCache()
+    observation = {"resourceType": "Observation", "id": "o1", "subject": {"reference": "Patient/S1"}}
+    cache.put("http://fhir", "Observation", {"patient": "S1", "code": "K"}, bundle(observation))
+    cache.put("http://fhir", "Observation", {"patient": "S2", "code": "K"}, bundle())
+    cache.put("http://fhir", "Observation", {"code": "K"}, bundle())  # not scoped to a patient
+    cache.put("http://fhir", "Patient", {"_id": "S1"}, bundle(PATIENT))
+
+    cache.record_write("http://fhir/", build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00"))
+
+    assert cache.get("http://fhir", "Observation", {"patient": "S2", "code": "K"}) is not None
+    assert cache.get("http://fhir", "Observation", {"patient": "S1", "code": "K"}) is None
+    assert cache.get("http://fhir", "Observation", {"code": "K"}) is None
+    assert cache.get("http://fhir", "Patient", {"_id": "S1"}) is None
+    assert cache.written_to("http://fhir", "Observation", {"subject": "Patient/S1"})
+    assert not cache.written_to("http://fhir", "Observation", {"patient": "S2"})
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_serves_repeats_until_our_write():
+    FHIR_CACHE.entries.clear()
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        client = mock_http(mock_client_cls, body={"resourceType": "Bundle", "entry": [{"resource": PATIENT}]}, etag='W/"7"')
+        first = await search_fhir("http://cache-fhir", "Patient", {"_id": "S1"})
+        assert await search_fhir("http://cache-fhir", "Patient", {"identifier": "S1"}) == first
+        assert client.get.call_count == 1
+        assert FHIR_CACHE.get("http://cache-fhir", "Patient", {"_id": "S1"}).etag == 'W/"7"'
+
+        client.post.return_value.json.return_value = {"resourceType": "Observation", "id": "o9"}
+        await post_fhir("http://cache-fhir", "Observation", build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00"))
+        await search_fhir("http://cache-fhir", "Patient", {"_id": "S1"})
+        assert client.get.call_count == 2
@@ -0,0 +1,116 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from fhir_mirror import FhirMirror, build_mirror
+from fhir_stream import EntryBudget
+from agent import search_fhir
+
+PATIENTS = [
+    {"resourceType": "Patient", "id": "S6530532", "birthDate": "1954-08-10",
+     "name": [{"family": "Buchanan", "given": ["Brian"]}],
+     "identifier": [{"system": "urn:mrn", "value": "S6530532"}]},
+    {"resourceType": "Patient", "id": "S6426560", "birthDate": "1940-03-05",
+     "name": [{"family": "Alvarez", "given": ["Maria"]}]},
+]
+OBSERVATIONS = [
+    {"resourceType": "Observation", "id": f"mg-{i}", "subject": {"reference": "Patient/S6530532"},
+     "code": {"coding": [{"system": "http://loinc.org", "code": "MG"}]},
+     "effectiveDateTime": f"2023-11-1{i}T08:00:00+00:00", "valueQuantity": {"value": 1.5 + i}}
+    for i in range(3)
+] + [
+    {"resourceType": "Observation", "id": "bp-1", "subject": {"reference": "Patient/S6530532"},
+     "code": {"text": "BP"}, "effectiveDateTime": "2023-11-12T08:00:00+00:00", "valueString": "118/77 mmHg"},
+]
+
+
+@pytest.fixture
+def mirror_path(tmp_path):
+    paths = []
+    for name, resources in (("Patient", PATIENTS), ("Observation", OBSERVATIONS)):
+        path = tmp_path / f"{name}.ndjson"
+        path.write_text("\n".join(json.dumps(r) for r in resources) + "\n")
+        paths.append(str(path))
+    db_path = str(tmp_path / "mirror.db")
+    assert build_mirror(db_path, paths) == 6
+    return db_path
+
+
+def ids(bundle: str) -> list[str]:
+    return [e["resource"]["id"] for e in json.loads(bundle)["entry"]]
+
+
+def test_patient_search(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    assert ids(mirror.search("http://fhir", "Patient", {"name": ["Brian", "Buchanan"], "birthdate": "1954-08-10"})) == ["S6530532"]
+    assert ids(mirror.search("http://fhir", "Patient", {"name": ["Brian", "Buchanan"], "birthdate": "1999-01-01"})) == []
+    assert ids(mirror.search("http://fhir", "Patient", {"_id": "S6426560"})) == ["S6426560"]
+    assert ids(mirror.search("http://fhir", "Patient", {"identifier": "urn:mrn|S6530532"})) == ["S6530532"]
+    # FHIR string search matches the start of a name part
+    assert ids(mirror.search("http://fhir", "Patient", {"family": "alv"})) == ["S6426560"]
+
+
+def test_observation_search(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    result = mirror.search("http://fhir", "Observation", {"patient": "S6530532", "code": "MG", "_sort": "-date", "_count": 2})
+    assert ids(result) == ["mg-2", "mg-1"]
+    assert json.loads(result)["entry"][0]["fullUrl"] == "http://fhir/Observation/mg-2"
+
+    in_range = {"patient": "Patient/S6530532", "code": "http://loinc.org|MG", "date": ["ge2023-11-11", "le2023-11-11"]}
+    assert ids(mirror.search("http://fhir", "Observation", in_range)) == ["mg-1"]
+    assert ids(mirror.search("http://fhir", "Observation", {"patient": "S6530532", "code": "BP"})) == ["bp-1"]
+
+
+def test_unsupported_params_fall_back(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    assert mirror.supports("Observation", {"patient": "S1", "code": "MG"})
+    assert not mirror.supports("Observation", {"patient": "S1", "value-quantity": "gt5"})
+    assert not mirror.supports("Condition", {})
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_routes_to_mirror(mirror_path):
+    with patch.dict("os.environ", {"FHIR_MIRROR_PATH": mirror_path}):
+        with patch("httpx.AsyncClient") as mock_client_cls:
+            result = await search_fhir("http://fhir", "Patient", {"_id": "S6530532"})
+            mock_client_cls.assert_not_called()
+    assert ids(result) == ["S6530532"]
+
+
+def test_find_patient_fuzzy(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    assert ids(mirror.find_patient("Brian Buchanan", "1954-08-10", "http://fhir")) == ["S6530532"]
+    assert ids(mirror.find_patient("Brian Buchannan", "1954-08-10")) == ["S6530532"]
+    assert mirror.find_patient("Brian Buchanan", "1999-01-01") is None
+    assert mirror.find_patient("Al Alvarez", "1940-03-05") is None
+    # String search tokens are accent-folded
+    assert ids(mirror.search("http://fhir", "Patient", {"family": "Álv"})) == ["S6426560"]
+
+
+def test_unsupported_date_prefixes_fall_back(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    assert mirror.supports("Observation", {"patient": "S1", "date": "ge2023-11-11"})
+    assert mirror.supports("Patient", {"birthdate": "1954-08-10"})
+    for prefix in ("ne", "sa", "eb", "ap"):
+        assert not mirror.supports("Observation", {"patient": "S1", "date": f"{prefix}2023-11-11"})
+    assert not mirror.supports("Patient", {"birthdate": ["ge1950", "ap1954"]})
+
+
+def test_search_applies_budget_and_projection(mirror_path):
+    mirror = FhirMirror(mirror_path)
+    result = json.loads(mirror.search("http://fhir", "Observation", {"patient": "S6530532"}, EntryBudget(max_entries=2)))
+    assert len(result["entry"]) == 2
+    assert result["truncated"] is True
+    assert result["total"] == 4
+
+    only_bp = EntryBudget(entry_filter=lambda e: e["resource"]["code"].get("text") == "BP")
+    assert ids(mirror.search("http://fhir", "Observation", {"patient": "S6530532"}, only_bp)) == ["bp-1"]
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_falls_back_for_unknown_patient(mirror_path):
+    assert FhirMirror(mirror_path).search("http://fhir", "Observation", {"patient": "Patient/S9999999"}) is None
+    with patch.dict("os.environ", {"FHIR_MIRROR_PATH": mirror_path}):
+        with patch("agent.search_fhir_paged", return_value='{"resourceType":"Bundle","entry":[]}') as paged:
+            await search_fhir("http://fhir", "Observation", {"patient": "S9999999", "code": "MG"})
+            paged.assert_called_once()
@@ -0,0 +1,80 @@
+import json
+import pytest
+import httpx
+from urllib.parse import parse_qs, urlsplit
+from unittest.mock import patch
+
+from fhir_paging import offset_page_urls, search_fhir_paged
+
+TOTAL = 45
+COUNT = 10
+
+
+def page(offset: int, offset_links: bool) -> dict:
+    ids = range(offset, min(offset + COUNT, TOTAL))
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "link": [],
+        "entry": [{"resource": {"resourceType": "Observation", "id": str(i)}} for i in ids],
+    }
+    if offset_links:
+        bundle["total"] = TOTAL
+    if offset + COUNT < TOTAL:
+        next_url = (
+            f"http://mock-fhir?_getpages=abc&_getpagesoffset={offset + COUNT}&_count={COUNT}"
+            if offset_links else f"http://mock-fhir/Observation?page={offset + COUNT}"
+        )
+        bundle["link"].append({"relation": "next", "url": next_url})
+    return bundle
+
+
+def mock_server(offset_links: bool, requests: list):
+    def handler(request):
+        requests.append(str(request.url))
+        query = parse_qs(urlsplit(str(request.url)).query)
+        offset = int((query.get("_getpagesoffset") or query.get("page") or ["0"])[0])
+        return httpx.Response(200, json=page(offset, offset_links))
+
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(handler)
+    return patch("httpx.AsyncClient", side_effect=lambda *a, **k: real_client(transport=transport))
+
+
+def test_offset_page_urls():
+    urls = offset_page_urls("http://mock-fhir?_getpages=abc&_getpagesoffset=10&_count=10", 45)
+    assert [parse_qs(urlsplit(u).query)["_getpagesoffset"][0] for u in urls] == ["10", "20", "30", "40"]
+    assert offset_page_urls("http://mock-fhir/Observation?page=2", 45) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offset_links", [True, False])
+async def test_search_fhir_paged_collects_all_pages(offset_links):
+    requests = []
+    with mock_server(offset_links, requests):
+        result = json.loads(await search_fhir_paged("http://mock-fhir", "Observation", {"patient": "S1"}, max_entries=None))
+
+    assert [e["resource"]["id"] for e in result["entry"]] == [str(i) for i in range(TOTAL)]
+    assert len(requests) == 5
+    assert "truncated" not in result
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_paged_honors_budget():
+    requests = []
+    with mock_server(True, requests):
+        result = json.loads(await search_fhir_paged("http://mock-fhir", "Observation", {}, max_entries=15, concurrency=1))
+
+    assert len(result["entry"]) == 15
+    assert result["truncated"] is True
+    assert result["total"] == TOTAL
+    # Only the pages needed for the budget (plus the in-flight window) were fetched
+    assert len(requests) <= 3
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_paged_exact_budget_is_not_truncated():
+    with mock_server(True, []):
+        result = json.loads(await search_fhir_paged("http://mock-fhir", "Observation", {}, max_entries=TOTAL))
+    assert len(result["entry"]) == TOTAL
+    assert "truncated" not in result
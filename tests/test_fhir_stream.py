@@ -0,0 +1,86 @@
+import json
+import pytest
+import httpx
+from unittest.mock import patch
+
+from fhir_stream import BundleStreamParser
+from fhir_paging import search_fhir_paged
+
+BUNDLE = {
+    "resourceType": "Bundle",
+    "type": "searchset",
+    "total": 3,
+    "link": [{"relation": "self", "url": "http://mock-fhir/Observation?patient=S1"}],
+    "entry": [
+        {
+            "fullUrl": f"http://mock-fhir/Observation/{i}",
+            "resource": {
+                "resourceType": "Observation",
+                "id": str(i),
+                "meta": {"versionId": "1", "lastUpdated": "2023-11-13T10:15:00+00:00"},
+                "code": {"text": "MG"},
+                "valueString": f"value \"{i}\" [{{}}]",
+            },
+        }
+        for i in range(3)
+    ],
+}
+
+
+def test_parser_handles_arbitrary_chunking():
+    text = json.dumps(BUNDLE, indent=2)
+    for size in (1, 7, 64, len(text)):
+        parser = BundleStreamParser()
+        entries = []
+        for i in range(0, len(text), size):
+            entries.extend(parser.feed(text[i:i + size]))
+
+        assert parser.done
+        assert [e for e, _ in entries] == BUNDLE["entry"]
+        assert json.loads(entries[1][1]) == BUNDLE["entry"][1]
+        assert parser.meta["total"] == 3
+        assert parser.meta["link"] == BUNDLE["link"]
+
+
+def mock_client(body: str):
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text=body))
+    return patch("httpx.AsyncClient", side_effect=lambda *a, **k: real_client(transport=transport))
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_paged_projects_and_limits():
+    with mock_client(json.dumps(BUNDLE)):
+        result = json.loads(await search_fhir_paged("http://mock-fhir", "Observation", {"patient": "S1"}, max_entries=2))
+
+    assert result["total"] == 3
+    assert result["truncated"] is True
+    assert [e["resource"]["id"] for e in result["entry"]] == ["0", "1"]
+    # Default projection drops meta, except the versionId the cache revalidates with
+    assert result["entry"][0]["resource"]["meta"] == {"versionId": "1"}
+
+
+@pytest.mark.asyncio
+async def test_paged_read_by_id_is_cached_with_an_etag():
+    from fhir_cache import FhirCache
+    bundle = {**BUNDLE, "total": 1, "entry": BUNDLE["entry"][:1]}
+    with mock_client(json.dumps(bundle)):
+        result = await search_fhir_paged("http://mock-fhir", "Observation", {"_id": "0"})
+
+    cache = FhirCache()
+    cache.put("http://mock-fhir", "Observation", {"_id": "0"}, result)
+    assert cache.get("http://mock-fhir", "Observation", {"_id": "0"}).etag == 'W/"1"'
+
+
+@pytest.mark.asyncio
+async def test_search_fhir_paged_filter():
+    with mock_client(json.dumps(BUNDLE)):
+        result = json.loads(await search_fhir_paged(
+            "http://mock-fhir", "Observation", {},
+            entry_filter=lambda e: e["resource"]["id"] != "1",
+            projection=None,
+        ))
+
+    assert [e["resource"]["id"] for e in result["entry"]] == ["0", "2"]
+    assert "meta" in result["entry"][0]["resource"]
+    assert "truncated" not in result
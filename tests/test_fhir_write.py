@@ -0,0 +1,142 @@
+import json
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+
+from fhir_write import (
+    IDEMPOTENCY_SYSTEM,
+    build_bp_observation,
+    build_transaction_bundle,
+    context_time,
+    idempotency_key,
+    post_fhir,
+    post_fhir_many,
+    post_transaction,
+    validate_resource,
+    with_idempotency_key,
+)
+
+
+def test_build_bp_observation():
+    obs = build_bp_observation("S12345", "118/77 mmHg", "2023-11-13T10:15:00+00:00")
+    assert obs["valueString"] == "118/77 mmHg"
+    assert obs["subject"] == {"reference": "Patient/S12345"}
+    assert obs["category"][0]["coding"][0]["code"] == "vital-signs"
+    assert validate_resource("Observation", obs) == []
+
+    with pytest.raises(ValueError):
+        build_bp_observation("S12345", "high", "2023-11-13T10:15:00+00:00")
+
+
+def test_context_time():
+    assert context_time("It's 2023-11-13T10:15:00+00:00 now, and the code for BP is 'BP'") == "2023-11-13T10:15:00+00:00"
+
+
+def test_validate_resource_errors():
+    errors = validate_resource("Observation", {"resourceType": "Observation", "status": "done", "subject": {}})
+    assert len(errors) == 4
+
+
+def test_validate_resource_reports_non_dict_fields():
+    obs = build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00")
+    assert validate_resource("Observation", {**obs, "code": "BP"}) == ["Observation.code must be an object with 'text' or 'coding'."]
+    assert validate_resource("Observation", {**obs, "subject": "Patient/S1"}) == [
+        "Observation.subject must be an object with reference 'Patient/<id>'."
+    ]
+    assert validate_resource("Observation", {**obs, "identifier": None}) == ["identifier must be a list of objects."]
+    assert validate_resource("Observation", {**obs, "valueString": 120}) == ["BP valueString must look like '118/77 mmHg', got 120."]
+
+
+@pytest.mark.asyncio
+async def test_post_fhir_returns_validation_errors_for_malformed_resources():
+    obs = build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00")
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        result = await post_fhir("http://mock-fhir", "Observation", {**obs, "code": "BP", "identifier": None})
+    assert result.startswith("Error: Resource failed validation")
+    mock_client_cls.assert_not_called()
+
+
+def test_transaction_bundle_is_idempotent():
+    obs = build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00")
+    first = build_transaction_bundle([obs])["entry"][0]
+    retry = build_transaction_bundle([obs])["entry"][0]
+
+    assert first["request"]["method"] == "POST"
+    # Same content -> same conditional-create key, so retries don't duplicate
+    assert first["request"]["ifNoneExist"] == retry["request"]["ifNoneExist"]
+    assert first["resource"]["identifier"][0]["system"] == IDEMPOTENCY_SYSTEM
+
+
+@pytest.mark.asyncio
+async def test_post_fhir_conditional_create():
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        mock_client = AsyncMock()
+        mock_client_cls.return_value.__aenter__.return_value = mock_client
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"resourceType": "Observation", "id": "obs-1"}
+        mock_client.post.return_value = mock_response
+
+        obs = build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00")
+        result = await post_fhir("http://mock-fhir", "Observation", obs)
+
+        assert json.loads(result)["id"] == "obs-1"
+        kwargs = mock_client.post.call_args.kwargs
+        assert kwargs["headers"]["If-None-Exist"].startswith(f"identifier={IDEMPOTENCY_SYSTEM}|")
+
+        # Invalid resources never reach the server
+        mock_client.post.reset_mock()
+        result = await post_fhir("http://mock-fhir", "Observation", {"resourceType": "Observation"})
+        assert result.startswith("Error: Resource failed validation")
+        mock_client.post.assert_not_called()
+
+
+def test_idempotency_key_tells_identified_resources_apart():
+    obs = build_bp_observation("S1", "120/80 mmHg", "2023-11-13T10:15:00+00:00")
+    first = {**obs, "identifier": [{"system": "urn:lab", "value": "A1"}]}
+    second = {**obs, "identifier": [{"system": "urn:lab", "value": "A2"}]}
+    assert idempotency_key(first) != idempotency_key(second)
+    # Our own key is not part of the content, so tagging is stable
+    tagged, key = with_idempotency_key(first)
+    assert idempotency_key(tagged) == key == idempotency_key(first)
+
+
+@pytest.mark.asyncio
+async def test_post_transaction_surfaces_failed_entries():
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        mock_client = AsyncMock()
+        mock_client_cls.return_value.__aenter__.return_value = mock_client
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"resourceType": "Bundle", "type": "transaction-response", "entry": [
+            {"response": {"status": "201 Created"}},
+            {"response": {"status": "422 Unprocessable Entity",
+                          "outcome": {"issue": [{"diagnostics": "Unknown patient"}]}}},
+        ]}
+        mock_client.post.return_value = mock_response
+
+        observations = [build_bp_observation(f"S{i}", "120/80 mmHg", "2023-11-13T10:15:00+00:00") for i in range(2)]
+        result = await post_transaction("http://mock-fhir", observations)
+
+    assert result == "Error: 1 of 2 transaction entries failed: entry 1 (Observation) 422 Unprocessable Entity: Unknown patient"
+
+
+@pytest.mark.asyncio
+async def test_post_fhir_many_shares_one_transaction():
+    with patch("httpx.AsyncClient") as mock_client_cls:
+        mock_client = AsyncMock()
+        mock_client_cls.return_value.__aenter__.return_value = mock_client
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"resourceType": "Bundle", "type": "transaction-response", "entry": [
+            {"resource": {"resourceType": "Observation", "id": "o1"}, "response": {"status": "201 Created"}},
+            {"response": {"status": "200 OK", "location": "Observation/o2/_history/1"}},
+        ]}
+        mock_client.post.return_value = mock_response
+
+        observations = [build_bp_observation(f"S{i}", "120/80 mmHg", "2023-11-13T10:15:00+00:00") for i in range(2)]
+        writes = [("Observation", observations[0]), ("Observation", {"resourceType": "Observation"}), ("Observation", observations[1])]
+        results = await post_fhir_many("http://mock-fhir", writes)
+
+    mock_client.post.assert_called_once()
+    assert mock_client.post.call_args.kwargs["json"]["type"] == "transaction"
+    assert len(mock_client.post.call_args.kwargs["json"]["entry"]) == 2
+    assert json.loads(results[0]) == {"resourceType": "Observation", "id": "o1"}
+    assert results[1].startswith("Error: Resource failed validation")
+    assert json.loads(results[2]) == {"status": "200 OK", "location": "Observation/o2/_history/1"}
@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+from generation import REASONING_MIN_TOKENS, generation_kwargs, strip_reasoning
+
+
+def test_generation_kwargs_per_task_type():
+    with patch.dict("os.environ", {"NEBIUS_FAST_MODEL_NAME": "meta-llama/Llama-3.3-70B-Instruct"}, clear=True):
+        # Lookups go to the fast model with a short budget
+        kwargs = generation_kwargs("search_patient", "nebius", "deepseek-ai/DeepSeek-R1-0528")
+        assert kwargs == {"model": "meta-llama/Llama-3.3-70B-Instruct", "max_tokens": 256}
+        # Open-ended questions keep the default model, unbounded
+        assert generation_kwargs(None, "nebius", "deepseek-ai/DeepSeek-R1-0528") == {"model": "deepseek-ai/DeepSeek-R1-0528"}
+
+    with patch.dict("os.environ", {}, clear=True):
+        # No fast model: the reasoning model keeps room for its trace
+        kwargs = generation_kwargs("get_patient_age", "nebius", "deepseek-ai/DeepSeek-R1-0528")
+        assert kwargs["max_tokens"] == REASONING_MIN_TOKENS
+        # Reasoning effort where the provider supports it
+        kwargs = generation_kwargs("get_patient_age", "openrouter", "deepseek/deepseek-v3.2")
+        assert kwargs["extra_body"] == {"reasoning": {"effort": "low"}}
+
+    with patch.dict("os.environ", {"GENERATION_PROFILES": '{"search_patient": {"max_tokens": 64, "stop": ["\\n\\n"]}}'}, clear=True):
+        kwargs = generation_kwargs("search_patient", "nebius", "some/small-model")
+        assert kwargs["max_tokens"] == 64 and kwargs["stop"] == ["\n\n"]
+
+    # Open-ended questions are overridden under "open"
+    with patch.dict("os.environ", {"GENERATION_PROFILES": '{"open": {"max_tokens": 2048}}'}, clear=True):
+        assert generation_kwargs(None, "nebius", "some/small-model")["max_tokens"] == 2048
+
+
+def test_strip_reasoning():
+    assert strip_reasoning('<think>\nlong trace\n</think>\n\n{"answer": 60}') == '{"answer": 60}'
+    # Opening tag dropped by the provider
+    assert strip_reasoning('trace without opening tag</think>S6534835') == "S6534835"
+    # Trace cut off by max_tokens leaves nothing to emit
+    assert strip_reasoning("Answer: 60 <think>never closed") == "Answer: 60"
+    assert strip_reasoning("Plain answer") == "Plain answer"
+    assert strip_reasoning(None) is None
+    # Nothing but a trace: kept rather than emptied
+    assert strip_reasoning("<think>S6534835 is the MRN</think>") == "<think>S6534835 is the MRN</think>"
+    assert strip_reasoning("<think>cut off by max_tokens") == "<think>cut off by max_tokens"
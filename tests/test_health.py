@@ -0,0 +1,68 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+
+from event_loop import LoopLagMonitor, io_stats, run_io
+from health import HealthMonitor
+
+
+def make_client(monitor: HealthMonitor) -> httpx.AsyncClient:
+    app = Starlette(routes=monitor.routes())
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://purple")
+
+
+@pytest.mark.asyncio
+async def test_readyz_requires_warm_up_and_probes():
+    monitor = HealthMonitor(fhir_base_url="http://fhir")
+    llm = AsyncMock()
+    fhir = AsyncMock(side_effect=RuntimeError("connection refused"))
+
+    with patch("health.probe_llm", llm), patch("health.probe_fhir", fhir), patch("health.warm_up", AsyncMock()):
+        async with make_client(monitor) as client:
+            # Liveness never depends on warm-up or probes
+            response = await client.get("/healthz")
+            assert response.status_code == 200
+            assert "feature_store_patients" in response.json()["caches"]
+            assert set(response.json()["pools"]["io"]) == {"threads", "running", "queued", "completed"}
+
+            response = await client.get("/readyz")
+            assert response.status_code == 503
+            checks = response.json()["checks"]
+            assert checks["warm_up"]["ok"] is False
+            assert checks["llm"]["ok"] is True
+            assert checks["fhir"] == {**checks["fhir"], "ok": False, "error": "connection refused"}
+
+            await monitor.warm_up()
+            fhir.side_effect = None
+            # Failed probe is cached briefly; once it expires the FHIR server is probed again
+            monitor._probes.pop("fhir")
+            response = await client.get("/readyz")
+            assert response.status_code == 200
+            assert response.json()["status"] == "ready"
+
+            # Successful probes are cached: no new probe calls
+            await client.get("/readyz")
+            assert llm.await_count == 1
+            assert fhir.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_flags_blocking_calls():
+    monitor = LoopLagMonitor(interval=0.01, warn_ms=50)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    # Blocking I/O on the pool leaves the loop free...
+    completed = io_stats()["completed"]
+    await run_io(time.sleep, 0.1)
+    assert monitor.blocked == 0
+    assert io_stats()["completed"] == completed + 1
+    # ...the same call on the loop is reported
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+    assert monitor.blocked == 1
+    assert monitor.stats()["max_ms"] >= 50
@@ -0,0 +1,52 @@
+import json
+import os
+import pytest
+
+from fhir_mirror import FhirMirror
+from ingest import ingest
+
+
+def write_export(directory, count):
+    patients = [
+        {"resourceType": "Patient", "id": f"S{i:07d}", "birthDate": "1950-01-01",
+         "name": [{"family": f"Family{i}", "given": ["Given"]}]}
+        for i in range(count)
+    ]
+    observations = [
+        {"resourceType": "Observation", "id": f"obs-{i}", "subject": {"reference": f"Patient/S{i:07d}"},
+         "code": {"text": "BP"}, "effectiveDateTime": "2023-11-13T10:15:00+00:00", "valueString": "118/77 mmHg"}
+        for i in range(count)
+    ]
+    procedures = [{"resourceType": "Procedure", "id": "p-1", "subject": {"reference": "Patient/S0000000"}}]
+    for name, resources in (("Patient", patients), ("Observation", observations), ("Procedure", procedures)):
+        with open(os.path.join(directory, f"{name}.ndjson"), "w") as f:
+            f.write("\n".join(json.dumps(r) for r in resources) + "\n")
+
+
+def test_ingest_builds_mirror(tmp_path):
+    write_export(tmp_path, 50)
+    output = str(tmp_path / "out" / "mirror.db")
+    seen = []
+
+    count = ingest([str(tmp_path)], output, workers=2, batch_size=7, on_resources=seen.extend)
+
+    # Procedure is not in the default resource types
+    assert count == 100
+    assert len(seen) == 100
+    mirror = FhirMirror(output)
+    assert mirror.count("Patient") == 50
+    result = json.loads(mirror.search("http://fhir", "Observation", {"patient": "S0000042", "code": "BP"}))
+    assert [e["resource"]["id"] for e in result["entry"]] == ["obs-42"]
+
+
+def test_ingest_failure_keeps_previous_index(tmp_path):
+    output = tmp_path / "mirror.db"
+    output.write_text("previous")
+    (tmp_path / "Patient.ndjson").write_text('{"resourceType": "Patient", "id": "S1"}\nnot json\n')
+
+    with pytest.raises(json.JSONDecodeError):
+        ingest([str(tmp_path / "Patient.ndjson")], str(output), workers=1)
+
+    assert output.read_text() == "previous"
+    # No temporary files left behind
+    assert sorted(os.listdir(tmp_path)) == ["Patient.ndjson", "mirror.db"]
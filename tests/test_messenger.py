@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from messenger import Messenger
+
+CARD = {
+    "name": "Specialist",
+    "description": "Test agent",
+    "url": "http://specialist/",
+    "version": "1.0.0",
+    "capabilities": {"streaming": False},
+    "default_input_modes": ["text"],
+    "default_output_modes": ["text"],
+    "skills": [],
+}
+
+
+def make_transport(requests: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.method == "GET":
+            if request.headers.get("if-none-match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, json=CARD, headers={"ETag": '"v1"'})
+        rpc = json.loads(request.content)
+        sent = rpc["params"]["message"]
+        reply = {
+            "kind": "message",
+            "role": "agent",
+            "message_id": "reply",
+            "context_id": sent.get("context_id") or sent.get("contextId") or "ctx-1",
+            "parts": [{"kind": "text", "text": f"echo: {sent['parts'][0]['text']}"}],
+        }
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": rpc["id"], "result": reply})
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_messenger_reuses_card_and_client():
+    requests = []
+    messenger = Messenger()
+    messenger._http = httpx.AsyncClient(transport=make_transport(requests))
+
+    assert await messenger.talk_to_agent("hi", "http://specialist") == "echo: hi"
+    assert await messenger.talk_to_agent("again", "http://specialist") == "echo: again"
+
+    # One card fetch for the whole conversation; context carried to the second turn
+    assert [r.method for r in requests] == ["GET", "POST", "POST"]
+    assert messenger._context_ids["http://specialist"] == "ctx-1"
+    assert json.loads(requests[2].content)["params"]["message"]["contextId"] == "ctx-1"
+    await messenger.aclose()
+
+
+@pytest.mark.asyncio
+async def test_messenger_revalidates_expired_card_with_etag():
+    requests = []
+    messenger = Messenger(card_ttl=0)
+    messenger._http = httpx.AsyncClient(transport=make_transport(requests))
+
+    await messenger.talk_to_agent("hi", "http://specialist")
+    client = messenger._clients[("http://specialist", False)]
+    await messenger.talk_to_agent("again", "http://specialist")
+
+    revalidation = requests[2]
+    assert revalidation.method == "GET"
+    assert revalidation.headers["if-none-match"] == '"v1"'
+    # 304: the built client is kept
+    assert messenger._clients[("http://specialist", False)] is client
+    await messenger.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fan_out_streams_results_with_timeouts_and_quorum():
+    messenger = Messenger()
+    delays = {"http://fast": 0.01, "http://slow": 0.05, "http://hung": 10, "http://broken": 0.0}
+    cancelled = []
+
+    async def talk(message, url, new_conversation=False, timeout=300):
+        try:
+            async with asyncio.timeout(timeout):
+                await asyncio.sleep(delays[url])
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+        if url == "http://broken":
+            raise RuntimeError("boom")
+        return f"{url} says {message}"
+
+    messenger.talk_to_agent = talk
+
+    results = await messenger.consult("hi", list(delays), timeout={"http://hung": 0.1})
+    assert [r.url for r in results] == ["http://broken", "http://fast", "http://slow", "http://hung"]
+    assert results[0].error == "boom"
+    assert results[1].response == "http://fast says hi"
+    assert results[3].error.startswith("Timed out")
+
+    # Hedged request: the first success wins, the others are cancelled
+    results = await messenger.consult("hi", ["http://slow", "http://fast", "http://hung"], quorum=1)
+    assert [r.url for r in results] == ["http://fast"]
+    await asyncio.sleep(0)
+    assert sorted(cancelled) == ["http://hung", "http://slow"]
@@ -0,0 +1,44 @@
+from name_index import NameIndex, name_score, normalize, phonetic_key, tokens
+
+PATIENTS = [
+    ("S6426560", ["Maria", "Alvarez"], "1940-03-05"),
+    ("S0001", ["Al", "Smith"], "1940-03-05"),
+    ("S6538722", ["Katherine", "Sutton"], "1943-02-11"),
+    ("S6551923", ["Debra", "Dunn"], "1969-05-12"),
+    ("S9000001", ["José", "Núñez-García"], "1980-01-01"),
+    ("S6192632", ["Timothy", "Ramos"], "1959-04-28"),
+]
+
+
+def build_index() -> NameIndex:
+    index = NameIndex()
+    for mrn, names, dob in PATIENTS:
+        index.add(names, dob, mrn)
+    return index
+
+
+def test_normalize_and_phonetic():
+    assert normalize("  Núñez-García O'Brien ") == "nunez garcia obrien"
+    assert tokens("José Núñez") == ["jose", "nunez"]
+    assert phonetic_key("robert") == phonetic_key("rupert") == "R163"
+    assert phonetic_key("ashcraft") == "A261"
+
+
+def test_short_tokens_do_not_match_longer_names():
+    # Substring matching used to accept "Al" for "Alvarez"
+    assert name_score(["al"], ["maria", "alvarez"]) == 0.0
+    assert build_index().search("Al Alvarez", "1940-03-05") == []
+
+
+def test_search_blocks_by_birth_date_and_tolerates_typos():
+    index = build_index()
+    assert index.best("Maria Alvarez", "1940-03-05") == "S6426560"
+    # Accents, nicknames, typos
+    assert index.best("Jose Nunez Garcia", "1980-01-01") == "S9000001"
+    assert index.best("Kate Sutton", "1943-02-11") == "S6538722"
+    assert index.best("Tim Ramos", "1959-04-28") == "S6192632"
+    assert index.best("Maria Alvares", "1940-03-05") == "S6426560"
+    # Same name, wrong birth date
+    assert index.best("Debra Dunn", "1969-05-15") is None
+    # Without a birth date, candidates come from the phonetic postings
+    assert index.best("Katherine Sutton") == "S6538722"
@@ -0,0 +1,46 @@
+import json
+from types import SimpleNamespace
+
+from prompts import (
+    SYSTEM_PREAMBLE,
+    build_messages,
+    build_tools,
+    cached_tokens,
+    supports_cache_control,
+)
+
+
+def test_static_prefix_is_identical_across_requests():
+    a = build_messages("Q1", system_context="It's 2023-11-13", fhir_base_url="http://fhir-a")
+    b = build_messages("Q2", system_context="Other context", fhir_base_url="http://fhir-b", is_pre_fetched=True)
+
+    # System message and tool schema must not depend on the request
+    assert a[0] == b[0] == {"role": "system", "content": SYSTEM_PREAMBLE}
+    assert json.dumps(build_tools(True)) == json.dumps(build_tools(True))
+    assert build_tools(False) is None
+    # The write tool is only offered to tasks that record data
+    assert [t["function"]["name"] for t in build_tools(True)] == ["search_fhir"]
+    assert [t["function"]["name"] for t in build_tools(True, write=True)] == ["search_fhir", "create_fhir_resource"]
+
+    # Dynamic context goes into the final user message, ahead of the question
+    user = b[-1]["content"]
+    assert user.startswith("[TASK CONTEXT]")
+    assert "Other context" in user and "http://fhir-b" in user
+    assert user.index("http://fhir-b") < user.index("Q2")
+
+
+def test_cache_hints_only_where_supported():
+    assert supports_cache_control("openrouter", "anthropic/claude-3.5-sonnet")
+    assert not supports_cache_control("nebius", "deepseek-ai/DeepSeek-R1-0528")
+
+    messages = build_messages("Q", cache_hints=True)
+    assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_cached_tokens_from_usage():
+    openai_usage = SimpleNamespace(prompt_tokens=100, prompt_tokens_details=SimpleNamespace(cached_tokens=64))
+    deepseek_usage = SimpleNamespace(prompt_tokens=100, prompt_cache_hit_tokens=32)
+
+    assert cached_tokens(openai_usage) == 64
+    assert cached_tokens(deepseek_usage) == 32
+    assert cached_tokens(None) == 0
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from scheduler import LLMScheduler, estimate_cost
+
+
+def test_estimate_cost_by_task_type_and_prompt_size():
+    short = [{"role": "user", "content": "x" * 400}]
+    assert estimate_cost("search_patient", short) == pytest.approx(1.025)
+    assert estimate_cost(None, short) > estimate_cost("record_vitals", short)
+    # A huge context pushes even a lookup out of the fast lane
+    scheduler = LLMScheduler(slots=2)
+    assert scheduler.lane_for(estimate_cost("search_patient", short)).name == "fast"
+    assert scheduler.lane_for(estimate_cost("search_patient", [{"role": "user", "content": "x" * 40000}])).name == "slow"
+
+
+@pytest.mark.asyncio
+async def test_cheap_tasks_do_not_wait_behind_slow_ones():
+    scheduler = LLMScheduler(slots=2, reserved=1)
+    finished = []
+
+    async def complete(name, cost, seconds):
+        async with scheduler.slot(cost):
+            await asyncio.sleep(seconds)
+        finished.append(name)
+
+    slow = [asyncio.create_task(complete(f"slow-{i}", 5, 0.05)) for i in range(3)]
+    await asyncio.sleep(0)
+    fast = [asyncio.create_task(complete(f"fast-{i}", 1, 0.001)) for i in range(3)]
+    await asyncio.gather(*slow, *fast)
+
+    # The reserved slot serves every lookup while the slow lane holds the other
+    assert finished[:3] == ["fast-0", "fast-1", "fast-2"]
+    assert scheduler.stats()["free"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lanes_share_slots_by_weight_without_starvation():
+    scheduler = LLMScheduler(slots=1, weights=(3, 1))
+    order = []
+    gate = asyncio.Event()
+
+    async def complete(name, cost):
+        async with scheduler.slot(cost):
+            order.append(name)
+            await gate.wait()
+
+    holder = asyncio.create_task(complete("holder", 5))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(complete(f"slow-{i}", 5)) for i in range(4)]
+    waiters += [asyncio.create_task(complete(f"fast-{i}", 1)) for i in range(6)]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(holder, *waiters)
+
+    lanes = [name.split("-")[0] for name in order[1:]]
+    # One slow grant for every three fast ones while both lanes wait (the holder counts as slow)
+    assert lanes[:8].count("slow") == 2
+    assert order[1:].index("slow-0") < 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_release_nothing_they_do_not_hold():
+    scheduler = LLMScheduler(slots=1)
+    gate = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(1):
+            await gate.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    queued.cancel()
+    gate.set()
+    await holder
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+
+    assert scheduler.active == 0
+    async with scheduler.slot(1):
+        assert scheduler.stats()["free"] == 0